@@ -1,25 +1,29 @@
 import os
 import logging
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
 import httpx
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request
 
 # Add parent directory to path to import common module
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
+from common.admission import AdmissionControlMiddleware
 from common.observability import add_observability_routes, setup_otel_instrumentation
+from common.upstream import UpstreamClient
+from common.cache import ResponseCache
+from common.proxy import ProxyRoute, add_proxy_routes, proxy_endpoint
+from common.responses import json_response
+from catalog_lookup import MAX_IDS, get_products, parse_ids
+from catalog_replica import CatalogReplica
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
 # Setup OpenTelemetry if configured
-setup_otel_instrumentation()
-
-app = FastAPI(title="API Gateway", version="1.0.0")
-
-# Add observability routes
-add_observability_routes(app)
+setup_otel_instrumentation("api_gateway")
 
 # Service URLs from environment variables
 CATALOG_SERVICE_URL = os.getenv("CATALOG_SERVICE_URL", "http://localhost:8001")
@@ -28,95 +32,151 @@ CART_SERVICE_URL = os.getenv("CART_SERVICE_URL", "http://localhost:8002")
 logger.info(f"Catalog service URL: {CATALOG_SERVICE_URL}")
 logger.info(f"Cart service URL: {CART_SERVICE_URL}")
 
-class CartItem(BaseModel):
-    product_id: str
-    quantity: int
-    user_id: str
+# Shared, keep-alive pooled clients per backend
+catalog_upstream = UpstreamClient("catalog", CATALOG_SERVICE_URL)
+cart_upstream = UpstreamClient("cart", CART_SERVICE_URL)
+
+# Read-through cache for catalog responses
+catalog_cache = ResponseCache.from_env("catalog")
+
+# Optional local copy of the catalog, copied from and followed through the catalog
+# writer: the one catalog process that accepts changes and publishes the feed
+CATALOG_REPLICA = os.getenv("CATALOG_REPLICA", "false").lower() in ("1", "true", "yes")
+CATALOG_WRITER_URL = os.getenv("CATALOG_WRITER_URL", CATALOG_SERVICE_URL)
+catalog_writer_upstream = UpstreamClient("catalog_writer", CATALOG_WRITER_URL) if CATALOG_REPLICA else None
+catalog_replica = CatalogReplica.from_env(catalog_writer_upstream, catalog_cache) if CATALOG_REPLICA else None
+
+# Cart view fan-out: ids per catalog call, concurrent calls, and the catalog deadline
+CART_VIEW_CHUNK_SIZE = int(os.getenv("CART_VIEW_CHUNK_SIZE", "25"))
+CART_VIEW_CONCURRENCY = int(os.getenv("CART_VIEW_CONCURRENCY", "4"))
+CART_VIEW_CATALOG_TIMEOUT = float(os.getenv("CART_VIEW_CATALOG_TIMEOUT", "0.5"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open upstream connection pools on startup and close them on shutdown"""
+    await catalog_upstream.start()
+    await cart_upstream.start()
+    if catalog_writer_upstream is not None:
+        await catalog_writer_upstream.start()
+    if catalog_replica is not None:
+        await catalog_replica.start()
+    yield
+    if catalog_replica is not None:
+        await catalog_replica.stop()
+    if catalog_writer_upstream is not None:
+        await catalog_writer_upstream.close()
+    await catalog_upstream.close()
+    await cart_upstream.close()
+
+app = FastAPI(title="API Gateway", version="1.0.0", lifespan=lifespan)
+
+# Cap in-flight requests per worker; added first so shed requests are still measured
+app.add_middleware(AdmissionControlMiddleware)
+
+# Add observability routes
+add_observability_routes(app)
+
+# Gateway routes, forwarded unchanged to the owning service
+ROUTES = [
+    ProxyRoute("POST", "/cart/add", cart_upstream),
+    ProxyRoute("POST", "/cart/add/batch", cart_upstream),
+    ProxyRoute("GET", "/cart/{cart_id}", cart_upstream),
+    ProxyRoute("DELETE", "/cart/{cart_id}", cart_upstream),
+]
+
+add_proxy_routes(app, ROUTES)
+
+proxy_get_product = proxy_endpoint(ProxyRoute("GET", "/catalog/{product_id}", catalog_upstream, cache=catalog_cache))
+proxy_list_products = proxy_endpoint(ProxyRoute("GET", "/catalog", catalog_upstream, cache=catalog_cache))
 
 @app.get("/catalog/{product_id}")
-async def get_product(product_id: str):
-    """Proxy request to catalog service"""
-    logger.info(f"Proxying catalog request for product {product_id}")
+async def get_product(request: Request, product_id: str):
+    """Serve a product from the catalog replica while it is fresh, otherwise proxy it through the cache"""
+    if catalog_replica is None or not catalog_replica.fresh:
+        return await proxy_get_product(request)
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{CATALOG_SERVICE_URL}/catalog/{product_id}")
-            response.raise_for_status()
-            return response.json()
-    except httpx.HTTPStatusError as e:
-        logger.error(f"Catalog service error: {e.response.status_code}")
-        raise HTTPException(status_code=e.response.status_code, detail="Catalog service error")
-    except httpx.RequestError as e:
-        logger.error(f"Failed to connect to catalog service: {e}")
-        raise HTTPException(status_code=503, detail="Catalog service unavailable")
+    entry = catalog_replica.get(product_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    _, body, etag = entry
+    return json_response(request, body, etag)
 
 @app.get("/catalog")
-async def list_products():
-    """Proxy request to catalog service for product list"""
-    logger.info("Proxying catalog list request")
+async def list_products(request: Request, ids: Optional[List[str]] = Query(None)):
+    """Proxy product listings; `ids` fetches many products at once, reporting missing ids"""
+    if ids is None:
+        return await proxy_list_products(request)
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{CATALOG_SERVICE_URL}/catalog")
-            response.raise_for_status()
-            return response.json()
-    except httpx.HTTPStatusError as e:
-        logger.error(f"Catalog service error: {e.response.status_code}")
-        raise HTTPException(status_code=e.response.status_code, detail="Catalog service error")
-    except httpx.RequestError as e:
-        logger.error(f"Failed to connect to catalog service: {e}")
+    product_ids = parse_ids(ids)
+    if len(product_ids) > MAX_IDS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_IDS} ids per request")
+    
+    lookup = await get_products(catalog_upstream, catalog_cache, product_ids, replica=catalog_replica)
+    for error in lookup.errors:
+        if isinstance(error, httpx.HTTPStatusError):
+            logger.error("Catalog service error: %s", error.response.status_code)
+            raise HTTPException(status_code=error.response.status_code, detail="Catalog service error")
+        logger.error("Failed to connect to catalog service: %s", error)
         raise HTTPException(status_code=503, detail="Catalog service unavailable")
-
-@app.post("/cart/add")
-async def add_to_cart(item: CartItem):
-    """Proxy request to cart service"""
-    logger.info(f"Proxying cart add request: {item}")
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f"{CART_SERVICE_URL}/cart/add", json=item.dict())
-            response.raise_for_status()
-            return response.json()
-    except httpx.HTTPStatusError as e:
-        logger.error(f"Cart service error: {e.response.status_code}")
-        raise HTTPException(status_code=e.response.status_code, detail="Cart service error")
-    except httpx.RequestError as e:
-        logger.error(f"Failed to connect to cart service: {e}")
-        raise HTTPException(status_code=503, detail="Cart service unavailable")
+    return {
+        "items": [lookup.found[product_id] for product_id in product_ids if product_id in lookup.found],
+        "missing": lookup.missing,
+    }
 
-@app.get("/cart/{cart_id}")
-async def get_cart(cart_id: str):
-    """Proxy request to cart service"""
-    logger.info(f"Proxying cart get request for {cart_id}")
-    
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{CART_SERVICE_URL}/cart/{cart_id}")
-            response.raise_for_status()
-            return response.json()
-    except httpx.HTTPStatusError as e:
-        logger.error(f"Cart service error: {e.response.status_code}")
-        raise HTTPException(status_code=e.response.status_code, detail="Cart service error")
-    except httpx.RequestError as e:
-        logger.error(f"Failed to connect to cart service: {e}")
-        raise HTTPException(status_code=503, detail="Cart service unavailable")
+@app.get("/cart/{cart_id}/view")
+async def view_cart(cart_id: str):
+    """Cart with product details, line totals and cart total in one round trip
 
-@app.delete("/cart/{cart_id}")
-async def clear_cart(cart_id: str):
-    """Proxy request to cart service"""
-    logger.info(f"Proxying cart clear request for {cart_id}")
+    Products are fetched concurrently in chunks; if the catalog is slow or
+    failing the cart is still returned, with unresolved lines marked and
+    `degraded` set.
+    """
+    logger.info("Building cart view for %s", cart_id)
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.delete(f"{CART_SERVICE_URL}/cart/{cart_id}")
-            response.raise_for_status()
-            return response.json()
-    except httpx.HTTPStatusError as e:
-        logger.error(f"Cart service error: {e.response.status_code}")
-        raise HTTPException(status_code=e.response.status_code, detail="Cart service error")
+        response = await cart_upstream.get(f"/cart/{cart_id}")
     except httpx.RequestError as e:
-        logger.error(f"Failed to connect to cart service: {e}")
+        logger.error("Failed to connect to cart service: %s", e)
         raise HTTPException(status_code=503, detail="Cart service unavailable")
+    if response.status_code != 200:
+        logger.error("Cart service error: %s", response.status_code)
+        raise HTTPException(status_code=response.status_code, detail="Cart service error")
+    
+    items = response.json()["items"]
+    lookup = await get_products(
+        catalog_upstream,
+        catalog_cache,
+        parse_ids(item["product_id"] for item in items),
+        chunk_size=CART_VIEW_CHUNK_SIZE,
+        concurrency=CART_VIEW_CONCURRENCY,
+        timeout=CART_VIEW_CATALOG_TIMEOUT,
+        replica=catalog_replica,
+    )
+    
+    lines = []
+    total = 0.0
+    for item in items:
+        product = lookup.found.get(item["product_id"])
+        line_total = round(product["price"] * item["quantity"], 2) if product else None
+        if line_total is not None:
+            total += line_total
+        lines.append({
+            "product_id": item["product_id"],
+            "quantity": item["quantity"],
+            "product": product,
+            "line_total": line_total,
+        })
+    
+    return {
+        "cart_id": cart_id,
+        "items": lines,
+        "item_count": sum(item["quantity"] for item in items),
+        "total": round(total, 2),
+        "missing": lookup.missing,
+        "unavailable": lookup.failed,
+        "degraded": bool(lookup.failed),
+    }
 
 @app.get("/")
 async def root():
@@ -129,7 +189,9 @@ async def root():
         "endpoints": {
             "catalog": "/catalog/{product_id}",
             "cart_add": "/cart/add",
+            "cart_add_batch": "/cart/add/batch",
             "cart_get": "/cart/{cart_id}",
+            "cart_view": "/cart/{cart_id}/view",
             "cart_clear": "/cart/{cart_id}",
             "health": "/healthz",
             "metrics": "/metrics"
@@ -0,0 +1,109 @@
+# Product lookups for gateway endpoints that combine catalog data
+import json
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from common.cache import ResponseCache
+from common.upstream import UpstreamClient
+from catalog_replica import CatalogReplica
+
+logger = logging.getLogger(__name__)
+
+# Catalog multi-get limit
+MAX_IDS = 1000
+
+
+def parse_ids(values: Iterable[str]) -> List[str]:
+    """Flatten comma-separated and repeated `ids` values, dropping blanks and duplicates"""
+    return list(dict.fromkeys(
+        product_id.strip()
+        for value in values
+        for product_id in value.split(",")
+        if product_id.strip()
+    ))
+
+
+class ProductLookup:
+    """Result of resolving a set of product ids"""
+
+    def __init__(self):
+        self.found: Dict[str, dict] = {}
+        self.missing: List[str] = []
+        self.failed: List[str] = []
+        self.errors: List[BaseException] = []
+
+
+async def get_products(
+    upstream: UpstreamClient,
+    cache: ResponseCache,
+    product_ids: List[str],
+    chunk_size: int = MAX_IDS,
+    concurrency: int = 4,
+    timeout: Optional[float] = None,
+    replica: Optional[CatalogReplica] = None,
+) -> ProductLookup:
+    """Resolve products by id
+
+    While the gateway's catalog `replica` is fresh every id is resolved from
+    it, with no catalog call. Otherwise products already in the gateway's
+    per-product cache are served from it.
+    The rest are split into catalog multi-gets of `chunk_size` ids, fetched
+    concurrently with at most `concurrency` in flight. Ids whose chunk failed
+    or did not finish within `timeout` seconds are reported in `failed`.
+    """
+    lookup = ProductLookup()
+    if replica is not None and replica.fresh:
+        for product_id in product_ids:
+            entry = replica.get(product_id)
+            if entry is None:
+                lookup.missing.append(product_id)
+            else:
+                lookup.found[product_id] = entry[0]
+        logger.info("Resolved %d products from the catalog replica, %d missing", len(lookup.found), len(lookup.missing))
+        return lookup
+
+    misses: List[str] = []
+    for product_id in product_ids:
+        cached = cache.get(f"/catalog/{product_id}")
+        if cached is None:
+            misses.append(product_id)
+            continue
+        status_code, (content, _) = cached
+        if status_code == 200:
+            lookup.found[product_id] = json.loads(content)
+        else:
+            lookup.missing.append(product_id)
+
+    resolved = set()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_chunk(chunk: List[str]):
+        async with semaphore:
+            response = await upstream.get("/catalog", params={"ids": ",".join(chunk)})
+            response.raise_for_status()
+            data = response.json()
+        for product in data["items"]:
+            lookup.found[product["id"]] = product
+        lookup.missing.extend(data["missing"])
+        resolved.update(chunk)
+
+    tasks = [
+        asyncio.ensure_future(fetch_chunk(misses[start:start + chunk_size]))
+        for start in range(0, len(misses), chunk_size)
+    ]
+    if tasks:
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        lookup.errors = [task.exception() for task in done if task.exception() is not None]
+        if pending:
+            lookup.errors.append(asyncio.TimeoutError(f"{len(pending)} catalog lookups timed out"))
+        lookup.failed = [product_id for product_id in misses if product_id not in resolved]
+
+    logger.info(
+        "Resolved %d products (%d cached), %d missing, %d unavailable",
+        len(lookup.found), len(product_ids) - len(misses), len(lookup.missing), len(lookup.failed),
+    )
+    return lookup
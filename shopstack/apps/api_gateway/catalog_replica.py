@@ -0,0 +1,96 @@
+# Local replica of the catalog, kept current from the catalog writer's change feed
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from common.cache import ResponseCache
+from common.feed_follower import CatalogFollower
+from common.observability import (
+    CATALOG_REPLICA_CHANGES_TOTAL,
+    CATALOG_REPLICA_PRODUCTS,
+    CATALOG_REPLICA_STALENESS_SECONDS,
+    CATALOG_REPLICA_SYNCS_TOTAL,
+    set_gauge_function,
+)
+from common.responses import make_etag, render_json
+from common.upstream import UpstreamClient
+
+# Replicated product: (product, rendered JSON body, ETag)
+ReplicaEntry = Tuple[dict, bytes, str]
+
+
+def replica_entry(product: dict) -> ReplicaEntry:
+    """Render a product exactly as the catalog does, so bodies and ETags match the upstream's"""
+    body = render_json(product)
+    return product, body, make_etag(body)
+
+
+class CatalogReplica(CatalogFollower):
+    """In-memory copy of every catalog product, followed from the writer's `/catalog/changes`
+
+    Each upsert or delete from the feed invalidates the product's entry in
+    `cache`. A new copy replaces the old one when complete, and only products
+    that differ between the two are invalidated. Reads are answered while
+    the replica is `fresh`: copied in full and heard from the feed within
+    `max_staleness` seconds.
+    """
+
+    def __init__(
+        self,
+        upstream: UpstreamClient,
+        cache: Optional[ResponseCache] = None,
+        page_size: int = 1000,
+        poll_timeout: float = 25.0,
+        max_staleness: float = 60.0,
+        retry_interval: float = 1.0,
+    ):
+        super().__init__(upstream, page_size=page_size, poll_timeout=poll_timeout, retry_interval=retry_interval)
+        self.cache = cache
+        self.max_staleness = max_staleness
+        self.products: Dict[str, ReplicaEntry] = {}
+
+        self._applied = {op: CATALOG_REPLICA_CHANGES_TOTAL.labels(op=op) for op in ("upsert", "delete")}
+        set_gauge_function(CATALOG_REPLICA_PRODUCTS, lambda: len(self.products))
+        set_gauge_function(CATALOG_REPLICA_STALENESS_SECONDS, self.staleness)
+
+    @classmethod
+    def from_env(cls, upstream: UpstreamClient, cache: Optional[ResponseCache] = None) -> "CatalogReplica":
+        """Build a replica from `CATALOG_REPLICA_PAGE_SIZE`, `_POLL_TIMEOUT`, `_MAX_STALENESS` and `_RETRY_INTERVAL`"""
+        return cls(
+            upstream,
+            cache,
+            page_size=int(os.getenv("CATALOG_REPLICA_PAGE_SIZE", "1000")),
+            poll_timeout=float(os.getenv("CATALOG_REPLICA_POLL_TIMEOUT", "25.0")),
+            max_staleness=float(os.getenv("CATALOG_REPLICA_MAX_STALENESS", "60.0")),
+            retry_interval=float(os.getenv("CATALOG_REPLICA_RETRY_INTERVAL", "1.0")),
+        )
+
+    @property
+    def fresh(self) -> bool:
+        return self.synced and time.monotonic() - self.last_contact <= self.max_staleness
+
+    def get(self, product_id: str) -> Optional[ReplicaEntry]:
+        return self.products.get(product_id)
+
+    def replace(self, products: List[dict], reason: str):
+        """Swap in a new copy, invalidating cached responses only for products that changed"""
+        entries = {product["id"]: replica_entry(product) for product in products}
+        previous, self.products = self.products, entries
+        if self.cache is not None and previous:
+            for product_id in previous.keys() | entries.keys():
+                old, new = previous.get(product_id), entries.get(product_id)
+                if old is None or new is None or old[2] != new[2]:
+                    self.cache.invalidate(f"/catalog/{product_id}")
+        CATALOG_REPLICA_SYNCS_TOTAL.labels(reason=reason).inc()
+
+    def apply(self, change: dict):
+        """Apply one feed entry and invalidate the cached response for its product"""
+        product_id = change["id"]
+        applied = self._applied[change["op"]]
+        if change["op"] == "upsert":
+            self.products[product_id] = replica_entry(change["product"])
+        else:
+            self.products.pop(product_id, None)
+        if self.cache is not None:
+            self.cache.invalidate(f"/catalog/{product_id}")
+        applied.inc()
@@ -0,0 +1,156 @@
+import random
+import asyncio
+import httpx
+import pytest
+import sys
+import os
+
+# Add the repository root to path to import the common module
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from common.balancer import LoadBalancer, parse_urls
+from common.resilience import OPEN
+from common.upstream import UpstreamClient, UpstreamConfig
+
+URLS = ["http://a:8001", "http://b:8001", "http://c:8001"]
+
+def make_balancer(policy="p2c") -> LoadBalancer:
+    return LoadBalancer("test", URLS, policy, rng=random.Random(7))
+
+def test_parse_urls():
+    """Test comma-separated replica lists"""
+    assert parse_urls("http://a:8001/, http://b:8001,,") == ["http://a:8001", "http://b:8001"]
+    with pytest.raises(ValueError):
+        LoadBalancer("test", parse_urls(" , "))
+    with pytest.raises(ValueError):
+        LoadBalancer("test", URLS, "random")
+
+def test_p2c_prefers_less_loaded():
+    """Test power of two choices never picks the busiest of three replicas"""
+    balancer = make_balancer()
+    busy, idle, other = balancer.endpoints
+    busy.outstanding, idle.outstanding, other.outstanding = 10, 0, 5
+    picks = [balancer.pick() for _ in range(300)]
+    assert busy not in picks
+    assert picks.count(idle) > picks.count(other)
+
+def test_least_outstanding_picks_minimum():
+    """Test least-outstanding always picks the idlest replica"""
+    balancer = make_balancer("least_outstanding")
+    for endpoint, load in zip(balancer.endpoints, (3, 1, 2)):
+        endpoint.outstanding = load
+    assert {balancer.pick().url for _ in range(50)} == {"http://b:8001"}
+
+def test_ejected_endpoints_are_skipped_unless_all_are():
+    """Test ejected replicas receive no traffic until every replica is ejected"""
+    balancer = make_balancer()
+    first, second, third = balancer.endpoints
+    balancer.mark(first, False)
+    balancer.mark(second, False)
+    assert {balancer.pick() for _ in range(50)} == {third}
+    assert balancer.counts() == {"healthy": 1, "ejected": 2}
+    balancer.mark(third, False)
+    assert len({balancer.pick() for _ in range(100)}) == 3
+
+def test_pick_avoids_excluded_endpoint():
+    """Test retries go to a different replica when one is available"""
+    balancer = make_balancer()
+    failed = balancer.endpoints[0]
+    assert all(balancer.pick(exclude=failed) is not failed for _ in range(50))
+    single = LoadBalancer("test", URLS[:1])
+    assert single.pick(exclude=single.endpoints[0]) is single.endpoints[0]
+
+def test_set_endpoints_keeps_state():
+    """Test re-resolution keeps the health and load of replicas that remain"""
+    balancer = make_balancer()
+    balancer.mark(balancer.endpoints[1], False)
+    balancer.set_endpoints(["http://b:8001", "http://d:8001"])
+    assert [endpoint.url for endpoint in balancer.endpoints] == ["http://b:8001", "http://d:8001"]
+    assert [endpoint.healthy for endpoint in balancer.endpoints] == [False, True]
+
+def test_resolve_expands_hostname():
+    """Test DNS resolution balances over the addresses of a name"""
+    balancer = LoadBalancer("test", ["http://localhost:8001"])
+    asyncio.run(balancer.resolve())
+    assert balancer.endpoints
+    assert all(endpoint.url.endswith(":8001") and "localhost" not in endpoint.url for endpoint in balancer.endpoints)
+
+def test_health_check_ejects_and_readmits():
+    """Test replicas failing /healthz are ejected and readmitted once they pass"""
+    down = {"b"}
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/healthz":
+            return httpx.Response(503 if request.url.host in down else 200)
+        return httpx.Response(200, json={"host": request.url.host})
+
+    async def scenario():
+        upstream = UpstreamClient("balanced", ",".join(URLS), UpstreamConfig(), httpx.MockTransport(handler))
+        try:
+            await upstream.check_health()
+            hosts = {(await upstream.get("/catalog/1")).json()["host"] for _ in range(50)}
+            down.clear()
+            await upstream.check_health()
+            return hosts, upstream.balancer.counts()
+        finally:
+            await upstream.close()
+
+    hosts, counts = asyncio.run(scenario())
+    assert hosts == {"a", "c"}
+    assert counts == {"healthy": 3, "ejected": 0}
+
+def test_retry_moves_to_another_replica():
+    """Test a connection failure on one replica is retried on another"""
+    hosts = []
+    def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        if request.url.host == "a":
+            raise httpx.ConnectError("Connection refused")
+        return httpx.Response(200)
+
+    config = UpstreamConfig(retry_backoff=0.0, retry_budget_ratio=1.0)
+    upstream = UpstreamClient("balanced", "http://a:8001,http://b:8001", config, httpx.MockTransport(handler))
+    async def scenario():
+        try:
+            return [(await upstream.get("/")).status_code for _ in range(20)]
+        finally:
+            await upstream.close()
+    assert asyncio.run(scenario()) == [200] * 20
+    assert hosts.count("b") == 20
+    assert all(host == "b" for previous, host in zip(hosts, hosts[1:]) if previous == "a")
+
+def test_keyed_writes_stay_on_the_replica_their_key_hashes_to():
+    """Test keyed POSTs always reach one replica per key, and are retried there rather than elsewhere"""
+    hosts = []
+    def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append((request.headers["idempotency-key"], request.url.host))
+        if len(hosts) % 2:
+            raise httpx.ConnectError("Connection refused")
+        return httpx.Response(200)
+
+    config = UpstreamConfig(retry_backoff=0.0, retry_budget_ratio=1.0)
+    upstream = UpstreamClient("keyed", ",".join(URLS), config, httpx.MockTransport(handler))
+    async def scenario():
+        try:
+            for key in [f"key-{i}" for i in range(10)] * 2:
+                assert (await upstream.post("/", headers={"Idempotency-Key": key})).status_code == 200
+        finally:
+            await upstream.close()
+    asyncio.run(scenario())
+    by_key = {}
+    for key, host in hosts:
+        by_key.setdefault(key, set()).add(host)
+    assert all(len(key_hosts) == 1 for key_hosts in by_key.values())
+    assert len(set.union(*by_key.values())) > 1
+
+def test_open_breakers_are_skipped():
+    """Test replicas with an open circuit breaker get no traffic, and none is picked when all are open"""
+    balancer = make_balancer()
+    for endpoint in balancer.endpoints[:2]:
+        endpoint.breaker.state = OPEN
+        endpoint.breaker.opened_at = float("inf")
+    assert {balancer.pick() for _ in range(50)} == {balancer.endpoints[2]}
+    balancer.mark(balancer.endpoints[2], False)
+    assert balancer.pick() is balancer.endpoints[2]
+    balancer.endpoints[2].breaker.state = OPEN
+    balancer.endpoints[2].breaker.opened_at = float("inf")
+    assert balancer.pick() is None
@@ -0,0 +1,134 @@
+import pytest
+import asyncio
+import time
+import httpx
+from fastapi.testclient import TestClient
+import sys
+import os
+
+# Add parent directory to path to import the app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app import app, catalog_cache, catalog_upstream
+from common.cache import ResponseCache
+
+def test_cache_hit_and_expiry(monkeypatch):
+    """Test entries are served until their TTL passes"""
+    cache = ResponseCache("test_expiry", ttl=10.0)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.set("a", (200, {"id": "a"}))
+    assert cache.get("a") == (200, {"id": "a"})
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_cache_lru_eviction():
+    """Test the least recently used entry is evicted at capacity"""
+    cache = ResponseCache("test_lru", max_entries=2)
+    cache.set("a", (200, 1))
+    cache.set("b", (200, 2))
+    cache.get("a")
+    cache.set("c", (200, 3))
+    assert cache.get("b") is None
+    assert cache.get("a") == (200, 1)
+    assert cache.get("c") == (200, 3)
+
+def test_cache_only_stores_cacheable_statuses():
+    """Test 404s are negatively cached and errors are not cached"""
+    cache = ResponseCache("test_status", negative_ttl=5.0)
+    cache.set("missing", (404, None))
+    cache.set("broken", (500, None))
+    assert cache.get("missing") == (404, None)
+    assert cache.get("broken") is None
+
+def test_cache_coalesces_concurrent_misses():
+    """Test a burst of misses for one key issues a single load"""
+    cache = ResponseCache("test_coalesce")
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return 200, {"id": "123"}
+
+    async def burst():
+        return await asyncio.gather(*(cache.get_or_load("123", loader) for _ in range(20)))
+
+    results = asyncio.run(burst())
+    assert calls == 1
+    assert all(result == (200, {"id": "123"}) for result in results)
+
+def test_cache_load_error_is_shared_and_not_cached():
+    """Test a failed load propagates to waiters and the next call retries"""
+    cache = ResponseCache("test_error")
+    calls = 0
+
+    async def failing_loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def burst():
+        return await asyncio.gather(*(cache.get_or_load("k", failing_loader) for _ in range(5)), return_exceptions=True)
+
+    results = asyncio.run(burst())
+    assert calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    asyncio.run(burst())
+    assert calls == 2
+
+def test_gateway_caches_catalog_reads():
+    """Test repeated product reads and 404s hit the catalog service once"""
+    requests = []
+
+    def mock_catalog(request):
+        requests.append(request.url.path)
+        if request.url.path == "/catalog/123":
+            return httpx.Response(200, json={"id": "123"})
+        return httpx.Response(404, json={"detail": "Product not found"})
+
+    catalog_upstream.transport = httpx.MockTransport(mock_catalog)
+    catalog_cache.clear()
+    try:
+        with TestClient(app) as client:
+            for _ in range(3):
+                assert client.get("/catalog/123").status_code == 200
+                assert client.get("/catalog/999").status_code == 404
+            metrics = client.get("/metrics").text
+    finally:
+        catalog_upstream.transport = None
+        catalog_cache.clear()
+
+    assert requests == ["/catalog/123", "/catalog/999"]
+    assert 'cache_requests_total{cache="catalog",result="hit"}' in metrics
+    assert 'cache_entries{cache="catalog"}' in metrics
+
+def test_cache_cancelled_load_is_retried_by_waiters():
+    """Test cancelling the loading request does not cancel requests coalesced onto it"""
+    cache = ResponseCache("test_cancel")
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return 200, {"id": "k"}
+
+    async def scenario():
+        leader = asyncio.ensure_future(cache.get_or_load("k", loader))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(cache.get_or_load("k", loader)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return results
+
+    results = asyncio.run(scenario())
+    assert results == [(200, {"id": "k"})] * 3
+    assert calls == 2
@@ -0,0 +1,88 @@
+import pytest
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+import sys
+import os
+
+# Add parent directory to path to import the app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import app as gateway
+from app import app, catalog_cache, catalog_upstream, cart_upstream
+
+PRICES = {str(i): float(i) for i in range(100)}
+
+def mock_cart(request: httpx.Request) -> httpx.Response:
+    """Cart with 60 distinct products plus one unknown product"""
+    if request.url.path != "/cart/cart_u1":
+        return httpx.Response(404, json={"detail": "Cart not found"})
+    items = [{"product_id": str(i), "quantity": 2, "user_id": "u1"} for i in range(60)]
+    items.append({"product_id": "gone", "quantity": 1, "user_id": "u1"})
+    return httpx.Response(200, json={"cart_id": "cart_u1", "items": items})
+
+def catalog_handler(delay=0.0, in_flight=None):
+    """Catalog multi-get stand-in that records peak concurrency"""
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if in_flight is not None:
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            if in_flight is not None:
+                in_flight["now"] -= 1
+        ids = request.url.params["ids"].split(",")
+        return httpx.Response(200, json={
+            "items": [{"id": i, "name": f"P{i}", "price": PRICES[i]} for i in ids if i in PRICES],
+            "missing": [i for i in ids if i not in PRICES],
+        })
+    return handler
+
+def view_client(catalog):
+    """Gateway client with the mocked cart and the given catalog handler"""
+    cart_upstream.transport = httpx.MockTransport(mock_cart)
+    catalog_upstream.transport = httpx.MockTransport(catalog)
+    catalog_cache.clear()
+    return TestClient(app)
+
+@pytest.fixture(autouse=True)
+def reset_transports():
+    yield
+    catalog_upstream.transport = None
+    cart_upstream.transport = None
+
+def test_cart_view_totals():
+    """Test products are joined into the cart with line and cart totals"""
+    in_flight = {"now": 0, "peak": 0}
+    with view_client(catalog_handler(delay=0.01, in_flight=in_flight)) as client:
+        response = client.get("/cart/cart_u1/view")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["degraded"] is False
+    assert data["missing"] == ["gone"]
+    assert data["items"][5]["line_total"] == 10.0
+    assert data["items"][5]["product"]["name"] == "P5"
+    assert data["items"][-1]["product"] is None
+    assert data["item_count"] == 121
+    assert data["total"] == sum(i * 2.0 for i in range(60))
+    # 61 ids in chunks of 25 is 3 calls, capped at 4 concurrent
+    assert 1 <= in_flight["peak"] <= gateway.CART_VIEW_CONCURRENCY
+
+def test_cart_view_degrades_when_catalog_slow(monkeypatch):
+    """Test a slow catalog yields the cart without product details instead of an error"""
+    monkeypatch.setattr(gateway, "CART_VIEW_CATALOG_TIMEOUT", 0.05)
+    with view_client(catalog_handler(delay=1.0)) as client:
+        response = client.get("/cart/cart_u1/view")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["degraded"] is True
+    assert len(data["unavailable"]) == 61
+    assert data["total"] == 0
+    assert all(line["product"] is None for line in data["items"])
+
+def test_cart_view_not_found():
+    """Test unknown carts return 404"""
+    with view_client(catalog_handler()) as client:
+        response = client.get("/cart/cart_nobody/view")
+    assert response.status_code == 404
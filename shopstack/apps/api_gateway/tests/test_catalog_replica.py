@@ -0,0 +1,140 @@
+import pytest
+import time
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+import sys
+import os
+
+# Add parent directory to path to import the app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import app as gateway
+from app import app, catalog_cache, catalog_upstream
+from catalog_replica import CatalogReplica
+from common.cache import ResponseCache
+from common.responses import make_etag, render_json
+from common.upstream import UpstreamClient
+
+def product(product_id: str, price: float = 10.0) -> dict:
+    return {"id": product_id, "name": f"Item {product_id}", "description": "", "price": price, "category": "Home"}
+
+class FakeCatalog:
+    """Stand-in for the catalog's listing and change feed"""
+
+    def __init__(self, count: int):
+        self.epoch = "epoch-1"
+        self.products = {str(i): product(str(i)) for i in range(count)}
+        self.changes = []
+        self.product_reads = 0
+
+    def upsert(self, item: dict):
+        self.products[item["id"]] = item
+        self.changes.append({"version": len(self.changes) + 1, "op": "upsert", "id": item["id"], "product": item})
+
+    def delete(self, product_id: str):
+        del self.products[product_id]
+        self.changes.append({"version": len(self.changes) + 1, "op": "delete", "id": product_id})
+
+    def restart(self):
+        self.epoch = "epoch-2"
+        self.changes = []
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        if request.url.path == "/catalog/changes":
+            if "since" not in params:
+                return httpx.Response(200, json={"epoch": self.epoch, "version": len(self.changes), "reset": False, "changes": []})
+            since = int(params["since"])
+            if params["epoch"] != self.epoch or since > len(self.changes):
+                return httpx.Response(200, json={"epoch": self.epoch, "version": len(self.changes), "reset": True, "changes": []})
+            # Short stand-in for a long-poll
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, json={
+                "epoch": self.epoch, "version": len(self.changes), "reset": False, "changes": self.changes[since:],
+            })
+        if request.url.path == "/catalog":
+            ids = sorted(self.products, key=int)
+            start = int(params.get("cursor", 0))
+            end = start + int(params["limit"])
+            return httpx.Response(200, json={
+                "items": [self.products[i] for i in ids[start:end]],
+                "next_cursor": str(end) if end < len(ids) else None,
+            })
+        self.product_reads += 1
+        return httpx.Response(404, json={"detail": "Product not found"})
+
+async def until(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+def test_replica_copies_follows_and_resyncs():
+    """Test the replica pages in the catalog, applies feed changes with precise invalidation, and recopies after a reset"""
+    async def scenario():
+        catalog = FakeCatalog(5)
+        upstream = UpstreamClient("replica_test", "http://catalog", transport=httpx.MockTransport(catalog.handle))
+        cache = ResponseCache("replica_test")
+        replica = CatalogReplica(upstream, cache, page_size=2, poll_timeout=0.01)
+        await replica.start()
+        try:
+            await until(lambda: replica.fresh)
+            assert sorted(replica.products) == ["0", "1", "2", "3", "4"]
+            assert replica.get("2")[1:] == (render_json(product("2")), make_etag(render_json(product("2"))))
+
+            for product_id in ("1", "2"):
+                cache.set(f"/catalog/{product_id}", (200, (b"cached", {})))
+            catalog.upsert(product("1", price=5.0))
+            catalog.delete("3")
+            await until(lambda: "3" not in replica.products)
+            assert replica.get("1")[0]["price"] == 5.0
+            assert cache.get("/catalog/1") is None
+            assert cache.get("/catalog/2") is not None
+
+            catalog.restart()
+            catalog.products["2"] = product("2", price=99.0)
+            await until(lambda: replica.epoch == "epoch-2")
+            assert replica.get("2")[0]["price"] == 99.0
+            assert cache.get("/catalog/2") is None
+        finally:
+            await replica.stop()
+            await upstream.close()
+
+    asyncio.run(scenario())
+
+@pytest.fixture
+def replica_client(monkeypatch):
+    """Gateway client serving catalog reads from a replica of a fake catalog"""
+    catalog = FakeCatalog(3)
+    catalog_upstream.transport = httpx.MockTransport(catalog.handle)
+    catalog_cache.clear()
+    monkeypatch.setattr(gateway, "catalog_replica", CatalogReplica(catalog_upstream, catalog_cache, poll_timeout=0.01))
+    with TestClient(app) as test_client:
+        deadline = time.monotonic() + 2.0
+        while not gateway.catalog_replica.fresh:
+            assert time.monotonic() < deadline, "replica did not sync"
+            time.sleep(0.005)
+        yield test_client, catalog
+    catalog_upstream.transport = None
+
+def test_gateway_serves_catalog_reads_from_replica(replica_client):
+    """Test product reads and multi-gets are answered locally, with the catalog's bodies and ETags"""
+    client, catalog = replica_client
+    response = client.get("/catalog/1")
+    assert response.status_code == 200
+    assert response.content == render_json(product("1"))
+    assert client.get("/catalog/1", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+    assert client.get("/catalog/42").status_code == 404
+
+    data = client.get("/catalog", params={"ids": "2,42,0"}).json()
+    assert [p["id"] for p in data["items"]] == ["2", "0"]
+    assert data["missing"] == ["42"]
+    assert catalog.product_reads == 0
+
+def test_gateway_falls_back_to_upstream_when_replica_is_stale(replica_client, monkeypatch):
+    """Test reads go to the catalog once the replica has not heard from the feed for too long"""
+    client, catalog = replica_client
+    monkeypatch.setattr(gateway.catalog_replica, "max_staleness", -1.0)
+    assert client.get("/catalog/1").status_code == 404
+    assert catalog.product_reads == 1
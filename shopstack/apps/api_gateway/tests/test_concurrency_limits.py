@@ -0,0 +1,219 @@
+import time
+import asyncio
+import logging
+import httpx
+import pytest
+import sys
+import os
+
+# Add the repository root to path to import the common module
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from common.latency import parse_latency_model
+from common.resilience import AIMDLimit, ConcurrencyLimiter, GradientLimit, LimitExceededError
+from common.upstream import UpstreamClient, UpstreamConfig
+
+CAPACITY = 8
+CLIENTS = 64
+
+class SimulatedBackend(httpx.AsyncBaseTransport):
+    """Service with `capacity` workers drawing service times from a latency model
+
+    Requests beyond the busy workers queue; with `max_queue` set, requests
+    that find the queue full are shed with 503 as admission control would.
+    """
+
+    def __init__(self, capacity: int, latency_spec: str, max_queue: int = None):
+        self.workers = asyncio.Semaphore(capacity)
+        self.latency = parse_latency_model(latency_spec, seed=7)
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.shed = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.max_queue is not None and self.waiting >= self.max_queue:
+            self.shed += 1
+            return httpx.Response(503)
+        self.waiting += 1
+        try:
+            await self.workers.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            await self.latency.wait()
+        finally:
+            self.workers.release()
+        return httpx.Response(200)
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop whose clock jumps to the next timer instead of sleeping
+
+    Simulations run in a fraction of their simulated time and give the same
+    result on every run, however loaded the machine running them is.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+        select = self._selector.select
+
+        def virtual_select(timeout=None):
+            if timeout:
+                self.now += timeout
+            return select(0)
+
+        self._selector.select = virtual_select
+
+    def time(self) -> float:
+        return self.now
+
+def simulate(concurrency_limit: str, backend: SimulatedBackend, monkeypatch, duration: float = 1.0):
+    """Run `drive` on a virtual clock; time.monotonic and time.perf_counter follow it"""
+    with asyncio.Runner(loop_factory=VirtualTimeLoop) as runner:
+        loop = runner.get_loop()
+        with monkeypatch.context() as patch:
+            patch.setattr(time, "monotonic", loop.time)
+            patch.setattr(time, "perf_counter", loop.time)
+            return runner.run(drive(concurrency_limit, backend, duration))
+
+async def drive(concurrency_limit: str, backend: SimulatedBackend, duration: float):
+    """Closed-loop clients calling the backend through an UpstreamClient
+
+    Returns (latencies of successful calls, upstream client).
+    """
+    config = UpstreamConfig(retries=0, breaker_failures=0, concurrency_limit=concurrency_limit)
+    upstream = UpstreamClient(f"sim_{concurrency_limit}", "http://sim", config, backend)
+    latencies = []
+    deadline = time.monotonic() + duration
+
+    async def client():
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await upstream.get("/catalog/1")
+            except LimitExceededError:
+                await asyncio.sleep(0.002)
+                continue
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                await asyncio.sleep(0.002)
+
+    try:
+        await asyncio.gather(*(client() for _ in range(CLIENTS)))
+    finally:
+        await upstream.close()
+    return sorted(latencies), upstream
+
+def median(values):
+    return values[len(values) // 2]
+
+@pytest.fixture(autouse=True)
+def quiet_logs():
+    """Keep per-request httpx logging out of the simulation"""
+    logging.disable(logging.INFO)
+    yield
+    logging.disable(logging.NOTSET)
+
+@pytest.mark.parametrize("latency_spec", ["uniform:0.002,0.006", "lognormal:0.004,0.5"])
+def test_gradient_limit_finds_backend_capacity(latency_spec, monkeypatch):
+    """Test the gradient limit settles near the backend's capacity, cutting queueing without losing throughput"""
+    unlimited, _ = simulate("off", SimulatedBackend(CAPACITY, latency_spec), monkeypatch)
+    limited, upstream = simulate("gradient", SimulatedBackend(CAPACITY, latency_spec), monkeypatch)
+
+    assert CAPACITY <= upstream.limiter.limit <= CAPACITY * 3
+    assert median(limited) < median(unlimited) / 2
+    assert len(limited) > len(unlimited) * 0.8
+
+def test_aimd_limit_backs_off_when_backend_sheds(monkeypatch):
+    """Test AIMD learns from 503s to reject locally instead of sending calls the backend would shed"""
+    unlimited_backend = SimulatedBackend(CAPACITY, "uniform:0.002,0.006", max_queue=CAPACITY)
+    unlimited, _ = simulate("off", unlimited_backend, monkeypatch)
+    limited_backend = SimulatedBackend(CAPACITY, "uniform:0.002,0.006", max_queue=CAPACITY)
+    limited, upstream = simulate("aimd", limited_backend, monkeypatch)
+
+    assert upstream.limiter.limit <= CAPACITY * 3
+    assert limited_backend.shed < unlimited_backend.shed / 3
+    assert len(limited) > len(unlimited) * 0.8
+
+def test_limiter_rejects_at_limit_and_releases():
+    """Test calls beyond the limit are refused and slots return on release"""
+    limiter = ConcurrencyLimiter("unit", AIMDLimit(initial=2, min_limit=1, max_limit=10))
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release(0.01)
+    assert limiter.limit == 3
+    limiter.release(0.01, dropped=True)
+    assert limiter.in_flight == 0
+    assert limiter.limit == 2
+
+def test_gradient_limit_probes_no_load_rtt():
+    """Test the limit drops to its minimum to measure RTT, skipping calls that were already queued"""
+    limit = GradientLimit(initial=20, min_limit=4, probe_samples=5, probe_every=10)
+    assert limit.probing and limit.limit == 4
+    for _ in range(5):
+        limit.update(0.004, in_flight=4, dropped=False)
+    assert not limit.probing
+    assert limit.no_load_rtt == pytest.approx(0.004)
+    assert limit.limit == 20
+
+    # The probe is repeated after probe_every x limit samples
+    for _ in range(199):
+        limit.update(0.004, in_flight=15, dropped=False)
+    assert not limit.probing
+    limit.update(0.004, in_flight=15, dropped=False)
+    assert limit.probing and limit.limit == 4
+
+    # The 14 calls still in flight were queued behind the old limit and are not measured
+    for _ in range(14):
+        limit.update(0.05, in_flight=10, dropped=False)
+    for _ in range(5):
+        limit.update(0.002, in_flight=4, dropped=False)
+    assert limit.no_load_rtt == pytest.approx(0.002)
+    assert limit.limit > 20
+
+def test_gradient_limit_ignores_idle_samples():
+    """Test the limit only grows while at least half of it is in use, and shrinks under queueing"""
+    limit = GradientLimit(initial=20, probe_samples=1)
+    limit.update(0.005, in_flight=1, dropped=False)
+    for _ in range(50):
+        limit.update(0.005, in_flight=1, dropped=False)
+    assert limit.limit == 20
+    for _ in range(50):
+        limit.update(0.005, in_flight=15, dropped=False)
+    assert limit.limit > 20
+    grown = limit.limit
+    for _ in range(50):
+        limit.update(0.05, in_flight=30, dropped=False)
+    assert limit.limit < grown
+
+def test_upstream_rejects_beyond_limit():
+    """Test the upstream client fails fast once its limit is reached, without calling the backend"""
+    calls = []
+    async def scenario():
+        release = asyncio.Event()
+        class HeldTransport(httpx.AsyncBaseTransport):
+            async def handle_async_request(self, request):
+                calls.append(request.url.path)
+                await release.wait()
+                return httpx.Response(200)
+
+        config = UpstreamConfig(concurrency_limit="aimd", initial_limit=2, min_limit=1)
+        upstream = UpstreamClient("held", "http://held", config, HeldTransport())
+        held = [asyncio.create_task(upstream.get("/a")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(LimitExceededError):
+            await upstream.get("/b")
+        release.set()
+        statuses = [(await task).status_code for task in held]
+        await upstream.close()
+        return statuses
+
+    assert asyncio.run(scenario()) == [200, 200]
+    assert calls == ["/a", "/a"]
+
+def test_unknown_algorithm_is_rejected():
+    """Test a misspelt limit algorithm fails at startup"""
+    with pytest.raises(ValueError):
+        UpstreamConfig(concurrency_limit="vegas").limit_algorithm()
+    assert UpstreamConfig(concurrency_limit="off").limit_algorithm() is None
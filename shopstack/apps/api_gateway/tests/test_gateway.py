@@ -1,4 +1,6 @@
 import pytest
+import json
+import httpx
 from fastapi.testclient import TestClient
 import sys
 import os
@@ -6,7 +8,8 @@ import os
 # Add parent directory to path to import the app
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from app import app
+from app import app, catalog_cache, catalog_upstream, cart_upstream
+from common.upstream import UpstreamClient, UpstreamConfig
 
 client = TestClient(app)
 
@@ -40,6 +43,164 @@ def test_metrics():
     assert "http_requests_total" in response.text
     assert "http_request_duration_seconds" in response.text
 
-# Note: Integration tests for proxying to catalog/cart services
-# would require running those services or mocking them
-# These tests focus on the gateway's own endpoints
+def mock_catalog(request: httpx.Request) -> httpx.Response:
+    """Stand-in for the catalog service"""
+    if request.url.path == "/catalog/123":
+        return httpx.Response(200, json={"id": "123", "name": "Wireless Headphones"}, headers={
+            "ETag": '"v1"', "Date": "Mon, 01 Jan 2024 00:00:00 GMT", "Server": "catalog",
+        })
+    if request.url.path == "/catalog" and "ids" in request.url.params:
+        ids = request.url.params["ids"].split(",")
+        return httpx.Response(200, json={
+            "items": [{"id": product_id} for product_id in ids if product_id in ("123", "456")],
+            "missing": [product_id for product_id in ids if product_id not in ("123", "456")],
+        })
+    if request.url.path == "/catalog":
+        return httpx.Response(200, json={"items": [{"id": "123"}], "next_cursor": None, "query": dict(request.url.params)})
+    return httpx.Response(404, json={"detail": "Product not found"})
+
+def mock_cart(request: httpx.Request) -> httpx.Response:
+    """Stand-in for the cart service"""
+    if request.url.path == "/cart/add/batch":
+        items = json.loads(request.content)
+        return httpx.Response(200, json={"added": len(items), "failed": 0, "results": []})
+    if request.method == "POST":
+        if json.loads(request.content)["quantity"] <= 0:
+            return httpx.Response(422, json={"detail": "Quantity must be greater than 0"})
+        return httpx.Response(200, json={"message": "Item added to cart successfully", "cart_id": "cart_1"})
+    return httpx.Response(200, json={"cart_id": "cart_1", "items": []})
+
+@pytest.fixture
+def proxy_client():
+    """Gateway client with mocked upstream services"""
+    catalog_upstream.transport = httpx.MockTransport(mock_catalog)
+    cart_upstream.transport = httpx.MockTransport(mock_cart)
+    catalog_cache.clear()
+    with TestClient(app) as test_client:
+        yield test_client
+    catalog_upstream.transport = None
+    cart_upstream.transport = None
+
+def test_proxy_get_product(proxy_client):
+    """Test product requests are proxied to the catalog service"""
+    response = proxy_client.get("/catalog/123")
+    assert response.status_code == 200
+    assert response.json()["name"] == "Wireless Headphones"
+
+def test_proxy_get_product_not_found(proxy_client):
+    """Test upstream 404s are passed through"""
+    response = proxy_client.get("/catalog/999")
+    assert response.status_code == 404
+
+def test_proxy_cart_add(proxy_client):
+    """Test cart additions are proxied to the cart service"""
+    response = proxy_client.post("/cart/add", json={"product_id": "123", "quantity": 1, "user_id": "user_1"})
+    assert response.status_code == 200
+    assert response.json()["cart_id"] == "cart_1"
+
+def test_proxy_cart_add_batch(proxy_client):
+    """Test batch cart additions are proxied to the cart service"""
+    items = [{"product_id": "123", "quantity": 1, "user_id": "user_1"}] * 3
+    response = proxy_client.post("/cart/add/batch", json=items)
+    assert response.status_code == 200
+    assert response.json()["added"] == 3
+
+def test_proxy_retries_cart_add_with_idempotency_key():
+    """Test a keyed cart write is passed through with its key and resent whole after a 503"""
+    seen = []
+    def flaky_cart(request: httpx.Request) -> httpx.Response:
+        seen.append((request.headers.get("idempotency-key"), json.loads(request.content)))
+        if len(seen) == 1:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"message": "Item added to cart successfully", "cart_id": "cart_1"})
+
+    item = {"product_id": "123", "quantity": 1, "user_id": "user_1"}
+    cart_upstream.transport = httpx.MockTransport(flaky_cart)
+    try:
+        with TestClient(app) as test_client:
+            response = test_client.post("/cart/add", json=item, headers={"Idempotency-Key": "retry-me"})
+    finally:
+        cart_upstream.transport = None
+    assert response.status_code == 200
+    assert seen == [("retry-me", item), ("retry-me", item)]
+
+def test_proxy_passes_through_headers_and_errors(proxy_client):
+    """Test upstream headers and error bodies are forwarded unchanged"""
+    response = proxy_client.get("/catalog/123")
+    assert response.headers["etag"] == '"v1"'
+    response = proxy_client.post("/cart/add", json={"product_id": "123", "quantity": 0, "user_id": "user_1"})
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Quantity must be greater than 0"
+
+def test_proxy_cached_not_modified(proxy_client):
+    """Test the gateway answers If-None-Match from its cache"""
+    proxy_client.get("/catalog/123")
+    response = proxy_client.get("/catalog/123", headers={"If-None-Match": '"v1"'})
+    assert response.status_code == 304
+
+def test_proxy_cache_drops_per_response_headers(proxy_client):
+    """Test cached responses are not replayed with the upstream's Date and Server"""
+    for _ in range(2):
+        response = proxy_client.get("/catalog/123")
+        assert response.headers["etag"] == '"v1"'
+        assert "date" not in response.headers
+        assert "server" not in response.headers
+
+def test_proxy_streams_cart_reads(proxy_client):
+    """Test uncached routes stream the upstream body"""
+    response = proxy_client.get("/cart/cart_1")
+    assert response.status_code == 200
+    assert response.json() == {"cart_id": "cart_1", "items": []}
+
+def test_proxy_list_products_forwards_filters(proxy_client):
+    """Test listing filters are forwarded to the catalog service"""
+    response = proxy_client.get("/catalog", params={"category": "Electronics", "limit": 10})
+    assert response.status_code == 200
+    assert response.json()["query"] == {"category": "Electronics", "limit": "10"}
+
+def test_multi_get_products(proxy_client):
+    """Test multi-get combines cached products with one catalog call and reports missing ids"""
+    proxy_client.get("/catalog/123")
+    response = proxy_client.get("/catalog", params={"ids": "456,123,999"})
+    assert response.status_code == 200
+    data = response.json()
+    assert [p["id"] for p in data["items"]] == ["456", "123"]
+    assert data["missing"] == ["999"]
+
+def test_upstream_client_reused_across_requests(proxy_client):
+    """Test the pooled client is shared between requests and closed on shutdown"""
+    proxy_client.get("/catalog/123")
+    first = catalog_upstream.client
+    proxy_client.get("/catalog")
+    assert catalog_upstream.client is first
+
+def test_upstream_unavailable():
+    """Test connection failures map to 503"""
+    def refuse(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    catalog_upstream.transport = httpx.MockTransport(refuse)
+    catalog_cache.clear()
+    try:
+        with TestClient(app) as test_client:
+            response = test_client.get("/catalog/123")
+    finally:
+        catalog_upstream.transport = None
+    assert response.status_code == 503
+
+def test_upstream_config_from_env(monkeypatch):
+    """Test per-upstream settings override the shared defaults"""
+    monkeypatch.setenv("UPSTREAM_MAX_CONNECTIONS", "50")
+    monkeypatch.setenv("TESTSVC_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("UPSTREAM_READ_TIMEOUT", "2.5")
+    config = UpstreamConfig.from_env("testsvc")
+    assert config.max_connections == 7
+    assert config.read_timeout == 2.5
+    assert config.http2 is False
+
+def test_upstream_pool_metrics(proxy_client):
+    """Test pool occupancy metrics are exported"""
+    response = proxy_client.get("/metrics")
+    assert 'upstream_pool_max_connections{upstream="catalog"}' in response.text
+    assert 'upstream_pool_connections{state="idle",upstream="cart"}' in response.text
+    assert "upstream_requests_in_flight" in response.text
@@ -0,0 +1,163 @@
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+import sys
+import os
+
+# Add parent directory to path to import the app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app import app, catalog_cache, catalog_upstream
+from common.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, RetryBudget
+from common.upstream import UpstreamClient, UpstreamConfig
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_upstream(handler, **config) -> UpstreamClient:
+    config.setdefault("retry_backoff", 0.0)
+    return UpstreamClient("resilience", "http://resilience", UpstreamConfig(**config), httpx.MockTransport(handler))
+
+def run(upstream: UpstreamClient, method: str, path: str = "/"):
+    async def go():
+        try:
+            return await upstream.request(method, path)
+        finally:
+            await upstream.close()
+    return asyncio.run(go())
+
+def test_breaker_opens_probes_and_closes():
+    """Test consecutive failures open the breaker and a single half-open probe decides"""
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=5.0, clock=clock)
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    clock.now = 5.0
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now = 10.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.allow()
+
+def test_retry_budget_limits_retries_to_a_ratio():
+    """Test retries are capped by deposits plus the time-based minimum"""
+    clock = FakeClock()
+    budget = RetryBudget(ratio=0.1, min_per_second=1.0, clock=clock)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    for _ in range(20):
+        budget.deposit()
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    clock.now = 1.0
+    assert budget.withdraw()
+
+def test_idempotent_requests_are_retried():
+    """Test a GET answered with 503 is retried until it succeeds"""
+    calls = []
+    def flaky(request: httpx.Request) -> httpx.Response:
+        calls.append(request.method)
+        return httpx.Response(503 if len(calls) < 3 else 200)
+    response = run(make_upstream(flaky), "GET")
+    assert response.status_code == 200
+    assert len(calls) == 3
+
+def test_non_idempotent_requests_are_not_retried():
+    """Test a POST is sent once even when it fails"""
+    calls = []
+    def failing(request: httpx.Request) -> httpx.Response:
+        calls.append(request.method)
+        raise httpx.ConnectError("Connection refused")
+    with pytest.raises(httpx.ConnectError):
+        run(make_upstream(failing), "POST")
+    assert calls == ["POST"]
+
+def test_keyed_requests_are_not_retried_after_a_timeout():
+    """Test a keyed POST that may have been applied is not sent again, while a refused one is"""
+    calls = []
+    def timing_out(request: httpx.Request) -> httpx.Response:
+        calls.append(request.headers["idempotency-key"])
+        if request.headers["idempotency-key"] == "refused" and len(calls) == 1:
+            raise httpx.ConnectError("Connection refused")
+        raise httpx.ReadTimeout("Timed out waiting for the response")
+    upstream = make_upstream(timing_out, retry_budget_ratio=1.0)
+    async def go():
+        try:
+            for key in ("refused", "timeout"):
+                with pytest.raises(httpx.ReadTimeout):
+                    await upstream.request("POST", "/", headers={"Idempotency-Key": key})
+        finally:
+            await upstream.close()
+    asyncio.run(go())
+    assert calls == ["refused", "refused", "timeout"]
+
+def test_exhausted_budget_stops_retries():
+    """Test retries stop when the budget is empty"""
+    calls = []
+    def failing(request: httpx.Request) -> httpx.Response:
+        calls.append(request.method)
+        return httpx.Response(503)
+    upstream = make_upstream(failing, retries=5, retry_budget_min_per_second=0.0, retry_budget_ratio=0.0)
+    assert run(upstream, "GET").status_code == 503
+    assert len(calls) == 1
+
+def test_open_breaker_fails_fast():
+    """Test an open breaker rejects calls without reaching the upstream"""
+    calls = []
+    def failing(request: httpx.Request) -> httpx.Response:
+        calls.append(request.method)
+        raise httpx.ConnectError("Connection refused")
+    upstream = make_upstream(failing, retries=0, breaker_failures=2)
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            run(upstream, "GET")
+    with pytest.raises(CircuitOpenError):
+        run(upstream, "GET")
+    assert len(calls) == 2
+
+def test_gateway_returns_503_while_breaker_open():
+    """Test the gateway maps an open breaker to 503"""
+    catalog_cache.clear()
+    [endpoint] = catalog_upstream.balancer.endpoints
+    endpoint.breaker.state = OPEN
+    endpoint.breaker.opened_at = float("inf")
+    try:
+        with TestClient(app) as client:
+            response = client.get("/catalog/123")
+    finally:
+        endpoint.breaker.reset()
+    assert response.status_code == 503
+
+def test_slow_request_is_hedged():
+    """Test a GET slower than the recent p95 is raced by a second copy"""
+    calls = []
+    class SlowFirstTransport(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            calls.append(request.method)
+            if len(calls) == 1:
+                await asyncio.sleep(5)
+            return httpx.Response(200, json={"attempt": len(calls)})
+
+    upstream = UpstreamClient("resilience", "http://resilience", UpstreamConfig(hedge=True), SlowFirstTransport())
+    for _ in range(upstream.latency.min_samples):
+        upstream.latency.observe(0.001)
+    response = run(upstream, "GET")
+    assert response.json() == {"attempt": 2}
+    assert len(calls) == 2
@@ -0,0 +1,146 @@
+import pytest
+import httpx
+from fastapi.testclient import TestClient
+import sys
+import os
+
+# Add parent directory to path to import the app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, Decision
+from opentelemetry.trace import SpanKind
+
+from app import app, catalog_cache, catalog_upstream, cart_upstream
+from common.tracing import sampler_from_env
+
+# One in-memory provider for the test session; the global provider can only be set once
+exporter = InMemorySpanExporter()
+provider = TracerProvider(sampler=ALWAYS_ON)
+provider.add_span_processor(SimpleSpanProcessor(exporter))
+trace.set_tracer_provider(provider)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+received = []
+
+def mock_catalog(request: httpx.Request) -> httpx.Response:
+    """Catalog stand-in that records the propagated trace context"""
+    received.append(request.headers.get("traceparent"))
+    if request.url.path == "/catalog":
+        ids = request.url.params["ids"].split(",")
+        return httpx.Response(200, json={"items": [{"id": i, "price": 1.0} for i in ids], "missing": []})
+    return httpx.Response(200, json={"id": "123"})
+
+def mock_cart(request: httpx.Request) -> httpx.Response:
+    received.append(request.headers.get("traceparent"))
+    items = [{"product_id": str(i), "quantity": 1, "user_id": "u1"} for i in range(30)]
+    return httpx.Response(200, json={"cart_id": "cart_u1", "items": items})
+
+@pytest.fixture
+def traced_client():
+    """Gateway client with mocked upstreams and a clean span exporter"""
+    catalog_upstream.transport = httpx.MockTransport(mock_catalog)
+    cart_upstream.transport = httpx.MockTransport(mock_cart)
+    catalog_cache.clear()
+    received.clear()
+    with TestClient(app) as client:
+        exporter.clear()
+        yield client
+    catalog_upstream.transport = None
+    cart_upstream.transport = None
+
+def spans_by_kind(kind):
+    return [span for span in exporter.get_finished_spans() if span.kind == kind]
+
+def test_server_and_client_spans_form_a_tree(traced_client):
+    """Test the gateway server span parents the upstream client span, which is propagated"""
+    response = traced_client.get("/catalog/123")
+    assert response.status_code == 200
+
+    [server] = spans_by_kind(SpanKind.SERVER)
+    [client] = spans_by_kind(SpanKind.CLIENT)
+    assert server.name == "GET /catalog/{product_id}"
+    assert server.attributes["http.route"] == "/catalog/{product_id}"
+    assert server.attributes["http.status_code"] == 200
+    assert server.parent is None
+    assert client.parent.span_id == server.context.span_id
+    assert client.context.trace_id == server.context.trace_id
+    assert client.attributes["peer.service"] == "catalog"
+    assert client.attributes["http.status_code"] == 200
+
+    # The catalog receives the client span as its parent
+    trace_id, span_id = received[0].split("-")[1:3]
+    assert int(trace_id, 16) == server.context.trace_id
+    assert int(span_id, 16) == client.context.span_id
+
+def test_incoming_trace_context_is_continued(traced_client):
+    """Test a request carrying traceparent joins the caller's trace"""
+    traced_client.get("/catalog/123", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+
+    [server] = spans_by_kind(SpanKind.SERVER)
+    assert format(server.context.trace_id, "032x") == TRACE_ID
+    assert format(server.parent.span_id, "016x") == PARENT_ID
+    assert server.parent.is_remote
+    assert received[0].startswith(f"00-{TRACE_ID}-")
+
+def test_concurrent_lookups_share_the_request_trace(traced_client):
+    """Test each concurrent catalog call of a cart view is a child of the request span"""
+    response = traced_client.get("/cart/cart_u1/view")
+    assert response.status_code == 200
+
+    [server] = spans_by_kind(SpanKind.SERVER)
+    clients = spans_by_kind(SpanKind.CLIENT)
+    assert len(clients) == len(received) > 2
+    assert {span.attributes["peer.service"] for span in clients} == {"cart", "catalog"}
+    assert all(span.parent.span_id == server.context.span_id for span in clients)
+    assert all(header.split("-")[1] == format(server.context.trace_id, "032x") for header in received)
+
+def test_upstream_errors_mark_spans():
+    """Test unavailable upstreams set error status on the server span and every attempt's client span"""
+    def failing(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("Connection refused")
+    catalog_upstream.transport = httpx.MockTransport(failing)
+    catalog_cache.clear()
+    try:
+        with TestClient(app) as client:
+            exporter.clear()
+            response = client.get("/catalog/123")
+    finally:
+        catalog_upstream.transport = None
+        catalog_upstream.balancer.endpoints[0].breaker.reset()
+    assert response.status_code == 503
+
+    [server] = spans_by_kind(SpanKind.SERVER)
+    attempts = spans_by_kind(SpanKind.CLIENT)
+    assert len(attempts) == 1 + catalog_upstream.config.retries
+    assert not server.status.is_ok
+    assert all(not span.status.is_ok and span.events[0].name == "exception" for span in attempts)
+
+def test_access_log_and_exemplar_carry_trace_id(traced_client, caplog):
+    """Test the metrics middleware sees the server span"""
+    with caplog.at_level("INFO"):
+        traced_client.get("/catalog/123")
+    [server] = spans_by_kind(SpanKind.SERVER)
+    trace_id = format(server.context.trace_id, "032x")
+
+    [access] = [r for r in caplog.records if r.getMessage() == "Request completed"]
+    assert access.trace_id == trace_id
+    metrics = traced_client.get("/metrics", headers={"Accept": "application/openmetrics-text"}).text
+    assert f'trace_id="{trace_id}"' in metrics
+
+def test_sampler_follows_parent_and_ratio(monkeypatch):
+    """Test new traces are sampled by ratio while child spans follow their parent"""
+    from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags, set_span_in_context
+
+    monkeypatch.setenv("TRACE_SAMPLE_RATIO", "0")
+    sampler = sampler_from_env()
+    assert sampler.should_sample(None, 1, "root").decision == Decision.DROP
+
+    parent = SpanContext(int(TRACE_ID, 16), int(PARENT_ID, 16), is_remote=True, trace_flags=TraceFlags(TraceFlags.SAMPLED))
+    context = set_span_in_context(NonRecordingSpan(parent))
+    assert sampler.should_sample(context, parent.trace_id, "child").decision == Decision.RECORD_AND_SAMPLE
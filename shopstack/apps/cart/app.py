@@ -1,23 +1,46 @@
 import os
 import random
-import time
 import logging
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+from fastapi import Body, FastAPI, HTTPException
+from pydantic import BaseModel, Field, ValidationError
 
 # Add parent directory to path to import common module
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
+from common.admission import AdmissionControlMiddleware
+from common.idempotency import IdempotencyMiddleware
 from common.observability import add_observability_routes, setup_otel_instrumentation
+from common.latency import latency_model_from_env
+from cart_store import cart_backend_from_env, idempotency_table_for
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
 # Setup OpenTelemetry if configured
-setup_otel_instrumentation()
+setup_otel_instrumentation("cart")
 
-app = FastAPI(title="Cart Service", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the cart store's background persistence and flush it on shutdown"""
+    await store.start()
+    yield
+    await store.stop()
+
+app = FastAPI(title="Cart Service", version="1.0.0", lifespan=lifespan)
+
+# Cart storage, one cart per user (memory, sqlite or log, see CART_BACKEND)
+store = cart_backend_from_env()
+
+# Replay responses to retried writes that carry an Idempotency-Key; innermost, so
+# replays are still admitted and measured like any other request. Keys are kept
+# with the carts, so workers sharing a SQLite cart file also share its keys
+app.add_middleware(IdempotencyMiddleware, table=idempotency_table_for(store))
+
+# Cap in-flight requests per worker; added before observability so shed requests are still measured
+app.add_middleware(AdmissionControlMiddleware)
 
 # Add observability routes
 add_observability_routes(app)
@@ -31,64 +54,112 @@ class CartResponse(BaseModel):
     message: str
     cart_id: str
 
-# Simulate cart storage
-cart_counter = 0
-carts = {}
+# Simulated database write latency (30-90ms by default)
+write_latency = latency_model_from_env("CART_WRITE", "uniform:0.03,0.09")
+
+# Simulated failure rate of cart writes (1% by default)
+CART_FAILURE_RATE = float(os.getenv("CART_FAILURE_RATE", "0.01"))
+
+# Largest accepted POST /cart/add/batch
+CART_MAX_BATCH_ITEMS = int(os.getenv("CART_MAX_BATCH_ITEMS", "100"))
+
+def render_cart(cart_id: str, user_id: str, items) -> dict:
+    return {
+        "cart_id": cart_id,
+        "items": [
+            {"product_id": product_id, "quantity": quantity, "user_id": user_id}
+            for product_id, quantity in items
+        ],
+    }
 
 @app.post("/cart/add")
 async def add_to_cart(item: CartItem):
-    """Add item to cart with simulated write latency and 1% failure rate"""
-    global cart_counter
-    
-    logger.info(f"Adding item to cart: {item.product_id} x{item.quantity} for user {item.user_id}")
+    """Add item to the user's cart with simulated write latency and failure rate"""
+    logger.info("Adding item to cart: %s x%d for user %s", item.product_id, item.quantity, item.user_id)
     
-    # Simulate database write latency (30-90ms)
-    latency = random.uniform(0.03, 0.09)
-    time.sleep(latency)
+    # Simulate database write latency without blocking the event loop
+    await write_latency.wait()
     
-    # Simulate 1% failure rate
-    if random.random() < 0.01:
-        logger.error(f"Simulated failure for cart operation: {item}")
+    # Simulate write failures
+    if random.random() < CART_FAILURE_RATE:
+        logger.error("Simulated failure for cart operation: %s", item)
         raise HTTPException(status_code=500, detail="Internal server error - simulated failure")
     
-    # Generate cart ID
-    cart_counter += 1
-    cart_id = f"cart_{cart_counter}"
+    cart_id = store.add_items(item.user_id, [(item.product_id, item.quantity)])
     
-    # Store cart item
-    if cart_id not in carts:
-        carts[cart_id] = []
-    
-    carts[cart_id].append(item)
-    
-    logger.info(f"Successfully added item to cart {cart_id}")
+    logger.info("Successfully added item to cart %s", cart_id)
     
     return CartResponse(
         message="Item added to cart successfully",
         cart_id=cart_id
     )
 
+@app.post("/cart/add/batch")
+async def add_to_cart_batch(items: List[Dict[str, Any]] = Body(...)):
+    """Add several items in one write, paying the simulated write latency once"""
+    logger.info("Adding batch of %d items to carts", len(items))
+    
+    if len(items) > CART_MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=422, detail=f"Batch exceeds {CART_MAX_BATCH_ITEMS} items")
+    
+    # Validate every item up front; invalid items are reported, not applied
+    results = []
+    by_user: Dict[str, list] = {}
+    for index, raw in enumerate(items):
+        try:
+            item = CartItem.model_validate(raw)
+        except ValidationError as e:
+            error = e.errors()[0]
+            results.append({"index": index, "status": "invalid", "error": f"{'.'.join(map(str, error['loc']))}: {error['msg']}"})
+            continue
+        results.append({"index": index, "status": "added", "product_id": item.product_id, "user_id": item.user_id})
+        by_user.setdefault(item.user_id, []).append((item.product_id, item.quantity))
+    
+    if by_user:
+        # Simulate a single database write for the whole batch
+        await write_latency.wait()
+        
+        if random.random() < CART_FAILURE_RATE:
+            logger.error("Simulated failure for cart batch of %d items", len(items))
+            raise HTTPException(status_code=500, detail="Internal server error - simulated failure")
+        
+        cart_ids = {user_id: store.add_items(user_id, user_items) for user_id, user_items in by_user.items()}
+        for result in results:
+            if result["status"] == "added":
+                result["cart_id"] = cart_ids[result["user_id"]]
+    
+    added = sum(1 for result in results if result["status"] == "added")
+    logger.info("Batch added %d of %d items", added, len(items))
+    
+    return {
+        "message": f"Added {added} of {len(items)} items",
+        "added": added,
+        "failed": len(items) - added,
+        "results": results,
+    }
+
 @app.get("/cart/{cart_id}")
 async def get_cart(cart_id: str):
     """Get cart contents"""
-    logger.info(f"Fetching cart {cart_id}")
+    logger.info("Fetching cart %s", cart_id)
     
-    if cart_id not in carts:
-        logger.warning(f"Cart {cart_id} not found")
+    cart = store.get(cart_id)
+    if cart is None:
+        logger.warning("Cart %s not found", cart_id)
         raise HTTPException(status_code=404, detail="Cart not found")
     
-    return {"cart_id": cart_id, "items": carts[cart_id]}
+    user_id, items = cart
+    return render_cart(cart_id, user_id, items)
 
 @app.delete("/cart/{cart_id}")
 async def clear_cart(cart_id: str):
     """Clear cart contents"""
-    logger.info(f"Clearing cart {cart_id}")
+    logger.info("Clearing cart %s", cart_id)
     
-    if cart_id not in carts:
-        logger.warning(f"Cart {cart_id} not found")
+    if not store.clear(cart_id):
+        logger.warning("Cart %s not found", cart_id)
         raise HTTPException(status_code=404, detail="Cart not found")
     
-    carts[cart_id] = []
     return {"message": "Cart cleared successfully"}
 
 if __name__ == "__main__":
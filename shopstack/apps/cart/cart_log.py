@@ -0,0 +1,292 @@
+# Append-only mutation log with snapshots, persisting the cart store write-behind
+import os
+import json
+import time
+import fcntl
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from common.observability import (
+    CART_LOG_FLUSH_SECONDS,
+    CART_LOG_PENDING_RECORDS,
+    CART_LOG_RECORDS_TOTAL,
+    CART_LOG_SNAPSHOT_SECONDS,
+    CART_LOG_WRITE_ERRORS_TOTAL,
+    set_gauge_function,
+)
+
+logger = logging.getLogger(__name__)
+
+# Recovered state: cart_id -> (user_id, {product_id: quantity})
+State = Dict[str, Tuple[str, Dict[str, int]]]
+
+# Snapshot contents: [(cart_id, user_id, [(product_id, quantity), ...])]
+Carts = List[Tuple[str, str, List[Tuple[str, int]]]]
+
+
+def apply_records(state: State, records):
+    """Fold log records into `state`
+
+    Records are JSON arrays: ["a", cart_id, user_id, [[product_id, quantity], ...]]
+    adds quantities and ["c", cart_id] empties a cart.
+    """
+    for record in records:
+        if record[0] == "a":
+            _, cart_id, user_id, items = record
+            cart = state.get(cart_id)
+            if cart is None:
+                cart = state[cart_id] = (user_id, {})
+            quantities = cart[1]
+            for product_id, quantity in items:
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+        elif record[0] == "c":
+            cart = state.get(record[1])
+            if cart is not None:
+                cart[1].clear()
+
+
+def read_segment(path: str) -> list:
+    """Parse one log segment, dropping a torn final record left by a crash mid-write"""
+    with open(path, "rb") as f:
+        data = f.read()
+    lines = data.split(b"\n")
+    if lines[-1]:
+        logger.warning(f"Ignoring torn record at the end of {path}")
+    lines = [line for line in lines[:-1] if line]
+    try:
+        # One C-level parse of the whole segment is much faster than a loads() per line
+        return json.loads(b"[" + b",".join(lines) + b"]")
+    except ValueError:
+        records = []
+        for number, line in enumerate(lines):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.error(f"Corrupt record at line {number + 1} of {path}; ignoring the rest of the segment")
+                break
+        return records
+
+
+class CartLog:
+    """Write-behind log of cart mutations in a local directory
+
+    Mutations are buffered in memory by `append` and written by a background
+    task every `flush_interval` seconds as one group commit (a single write
+    and fsync per batch), so request handlers never wait on the disk. A
+    crash loses at most the last interval of acknowledged writes.
+
+    Every `snapshot_interval` seconds, once `snapshot_min_records` mutations
+    have accumulated, the task writes a compact snapshot of the whole store
+    and deletes the log segments it covers. Recovery loads the newest
+    snapshot and replays the segments written after it.
+
+    Files: `log-<n>.jsonl` segments and `snapshot-<n>.json`, where snapshot n
+    holds the state after every segment below n. A lock file keeps a second
+    process from writing the same directory.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        flush_interval: float = 0.05,
+        snapshot_interval: float = 300.0,
+        snapshot_min_records: int = 10000,
+        fsync: bool = True,
+    ):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_min_records = snapshot_min_records
+        self.fsync = fsync
+        self.pending: list = []
+        self.segment = 0
+        self.records_since_snapshot = 0
+        self._file = None
+        self._pending_lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._stopping = None
+        self._task = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, "LOCK"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            raise RuntimeError(
+                f"Cart log directory {directory} is in use by another process; "
+                "CART_BACKEND=log needs one worker per CART_LOG_DIR (gunicorn --workers 1)"
+            )
+        set_gauge_function(CART_LOG_PENDING_RECORDS, lambda: len(self.pending))
+
+    def _files(self, prefix: str) -> List[Tuple[int, str]]:
+        """(sequence number, path) of files named `<prefix>-<n>.*`, oldest first"""
+        found = []
+        for name in os.listdir(self.directory):
+            stem, _, extension = name.partition(".")
+            if stem.startswith(prefix + "-") and extension in ("json", "jsonl"):
+                found.append((int(stem[len(prefix) + 1:]), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def recover(self) -> State:
+        """Load the newest snapshot, replay later segments and open a fresh segment for new writes"""
+        state: State = {}
+        snapshots = self._files("snapshot")
+        covered = 0
+        if snapshots:
+            covered, path = snapshots[-1]
+            with open(path) as f:
+                snapshot = json.load(f)
+            for cart_id, user_id, items in snapshot["carts"]:
+                state[cart_id] = (user_id, dict(items))
+
+        segments = self._files("log")
+        replayed = 0
+        for number, path in segments:
+            if number < covered:
+                continue
+            records = read_segment(path)
+            apply_records(state, records)
+            replayed += len(records)
+        self.records_since_snapshot = replayed
+
+        last = max([covered - 1] + [number for number, _ in segments])
+        self._open_segment(last + 1)
+        return state
+
+    def _open_segment(self, number: int):
+        if self._file is not None:
+            self._file.close()
+        self.segment = number
+        self._file = open(os.path.join(self.directory, f"log-{number:08d}.jsonl"), "ab")
+        self._sync_directory()
+
+    def _sync_directory(self):
+        if not self.fsync:
+            return
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def append(self, record: list):
+        """Buffer one mutation; it reaches the disk with the next flush"""
+        with self._pending_lock:
+            self.pending.append(record)
+
+    def take_pending(self) -> list:
+        with self._pending_lock:
+            records, self.pending = self.pending, []
+        return records
+
+    def _write(self, records: list):
+        """Append records to the current segment as one write and fsync; on error nothing is kept"""
+        if not records:
+            return
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records).encode()
+        started = time.perf_counter()
+        offset = self._file.tell()
+        try:
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError:
+            # Cut off a partial batch so retrying it cannot apply some adds twice
+            self._file.seek(offset)
+            self._file.truncate()
+            raise
+        CART_LOG_FLUSH_SECONDS.observe(time.perf_counter() - started)
+        CART_LOG_RECORDS_TOTAL.inc(len(records))
+        self.records_since_snapshot += len(records)
+
+    def flush(self):
+        """Write everything buffered so far; failed batches go back to the front of the buffer"""
+        with self._io_lock:
+            records = self.take_pending()
+            try:
+                self._write(records)
+            except OSError:
+                with self._pending_lock:
+                    self.pending[:0] = records
+                raise
+
+    def snapshot(self, records: list, carts: Carts):
+        """Write `records`, start a new segment and store `carts` as the state up to that point
+
+        `records` and `carts` must be taken together so the snapshot matches
+        the end of the log exactly; the next segment holds everything after.
+        """
+        with self._io_lock:
+            started = time.perf_counter()
+            try:
+                self._write(records)
+            except OSError:
+                with self._pending_lock:
+                    self.pending[:0] = records
+                raise
+            self._open_segment(self.segment + 1)
+
+            path = os.path.join(self.directory, f"snapshot-{self.segment:08d}.json")
+            with open(path + ".tmp", "w") as f:
+                json.dump({"segment": self.segment, "carts": carts}, f, separators=(",", ":"))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+            self._sync_directory()
+            self.records_since_snapshot = 0
+
+            for number, old in self._files("snapshot") + self._files("log"):
+                if number < self.segment:
+                    os.remove(old)
+            CART_LOG_SNAPSHOT_SECONDS.observe(time.perf_counter() - started)
+            logger.info(f"Wrote cart snapshot {path} with {len(carts)} carts")
+
+    def snapshot_due(self, now: float, last_snapshot: float) -> bool:
+        return (
+            now - last_snapshot >= self.snapshot_interval
+            and self.records_since_snapshot >= self.snapshot_min_records
+        )
+
+    async def run(self, cut: Callable[[], Tuple[list, Carts]]):
+        """Flush and snapshot until stop(); `cut` returns (pending records, carts) taken atomically"""
+        last_snapshot = time.monotonic()
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                now = time.monotonic()
+                if self.snapshot_due(now, last_snapshot):
+                    last_snapshot = now
+                    records, carts = cut()
+                    await asyncio.to_thread(self.snapshot, records, carts)
+                else:
+                    await asyncio.to_thread(self.flush)
+            except OSError:
+                CART_LOG_WRITE_ERRORS_TOTAL.inc()
+                logger.exception(f"Writing cart log in {self.directory} failed; retrying")
+
+    def start(self, cut: Callable[[], Tuple[list, Carts]]):
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self.run(cut))
+
+    async def stop(self):
+        """Finish the background task and write what is still buffered"""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def close(self):
+        with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        self._lock_file.close()
@@ -0,0 +1,360 @@
+# Cart storage engines for the cart service
+import os
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from common.idempotency import IdempotencyTable, idempotency_table_from_env
+from common.observability import CART_STORE_CARTS, CART_STORE_EVICTIONS_TOTAL, set_gauge_function
+from cart_log import CartLog
+
+logger = logging.getLogger(__name__)
+
+# (product_id, quantity) pairs
+Items = List[Tuple[str, int]]
+
+
+def cart_id_for(user_id: str) -> str:
+    """Each user has exactly one cart"""
+    return f"cart_{user_id}"
+
+
+class CartBackend:
+    """Interface for cart storage; carts are keyed by user and items merged per product"""
+
+    name = "base"
+
+    def add_items(self, user_id: str, items: Iterable[Tuple[str, int]]) -> str:
+        """Add quantities to the user's cart in one write and return its cart id"""
+        raise NotImplementedError
+
+    def get(self, cart_id: str) -> Optional[Tuple[str, Items]]:
+        """Return (user_id, items) for a cart, or None if it does not exist"""
+        raise NotImplementedError
+
+    def clear(self, cart_id: str) -> bool:
+        """Remove all items from a cart; returns False if it does not exist"""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    async def start(self):
+        """Start background work such as write-behind persistence"""
+
+    async def stop(self):
+        """Finish background work before shutdown"""
+
+    def close(self):
+        pass
+
+
+class Cart:
+    """One user's cart with quantities merged per product"""
+
+    __slots__ = ("user_id", "items", "last_access")
+
+    def __init__(self, user_id: str, now: float):
+        self.user_id = user_id
+        self.items: Dict[str, int] = {}
+        self.last_access = now
+
+
+class _Shard:
+    __slots__ = ("lock", "carts")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.carts: "OrderedDict[str, Cart]" = OrderedDict()
+
+
+class MemoryCartBackend(CartBackend):
+    """In-process cart store split into lock-striped shards
+
+    Each shard keeps its carts in least-recently-used order, so idle carts
+    are evicted from the front on every write and the oldest cart is dropped
+    when a shard reaches its share of `max_carts`.
+    """
+
+    name = "memory"
+
+    def __init__(self, shards: int = 16, max_carts: int = 100000, idle_ttl: float = 3600.0):
+        self.shards = [_Shard() for _ in range(shards)]
+        self.shard_capacity = max(1, max_carts // shards)
+        self.idle_ttl = idle_ttl
+        self._idle_evictions = CART_STORE_EVICTIONS_TOTAL.labels(reason="idle")
+        self._capacity_evictions = CART_STORE_EVICTIONS_TOTAL.labels(reason="capacity")
+        set_gauge_function(CART_STORE_CARTS, self.__len__)
+
+    def _shard(self, cart_id: str) -> _Shard:
+        return self.shards[zlib.crc32(cart_id.encode()) % len(self.shards)]
+
+    def _evict(self, shard: _Shard, now: float):
+        carts = shard.carts
+        while carts:
+            oldest = next(iter(carts.values()))
+            if now - oldest.last_access < self.idle_ttl:
+                break
+            carts.popitem(last=False)
+            self._idle_evictions.inc()
+        while len(carts) > self.shard_capacity:
+            carts.popitem(last=False)
+            self._capacity_evictions.inc()
+
+    def add_items(self, user_id: str, items: Iterable[Tuple[str, int]]) -> str:
+        cart_id = cart_id_for(user_id)
+        shard = self._shard(cart_id)
+        now = time.monotonic()
+        with shard.lock:
+            cart = shard.carts.get(cart_id)
+            if cart is None:
+                cart = shard.carts[cart_id] = Cart(user_id, now)
+            else:
+                cart.last_access = now
+                shard.carts.move_to_end(cart_id)
+            for product_id, quantity in items:
+                cart.items[product_id] = cart.items.get(product_id, 0) + quantity
+            self._evict(shard, now)
+        return cart_id
+
+    def get(self, cart_id: str) -> Optional[Tuple[str, Items]]:
+        shard = self._shard(cart_id)
+        now = time.monotonic()
+        with shard.lock:
+            cart = shard.carts.get(cart_id)
+            if cart is None:
+                return None
+            if now - cart.last_access >= self.idle_ttl:
+                del shard.carts[cart_id]
+                self._idle_evictions.inc()
+                return None
+            cart.last_access = now
+            shard.carts.move_to_end(cart_id)
+            return cart.user_id, list(cart.items.items())
+
+    def clear(self, cart_id: str) -> bool:
+        shard = self._shard(cart_id)
+        with shard.lock:
+            cart = shard.carts.get(cart_id)
+            if cart is None:
+                return False
+            cart.items.clear()
+            cart.last_access = time.monotonic()
+            shard.carts.move_to_end(cart_id)
+            return True
+
+    def __len__(self) -> int:
+        return sum(len(shard.carts) for shard in self.shards)
+
+    def dump(self) -> List[Tuple[str, str, Items]]:
+        """Copy of every cart as (cart_id, user_id, items), least recently used first per shard"""
+        carts = []
+        for shard in self.shards:
+            with shard.lock:
+                carts.extend(
+                    (cart_id, cart.user_id, list(cart.items.items())) for cart_id, cart in shard.carts.items()
+                )
+        return carts
+
+
+class SQLiteCartBackend(CartBackend):
+    """Cart store in a local SQLite file, shared by every worker on the host"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, idle_ttl: float = 3600.0, sweep_interval: float = 60.0):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS carts (
+                cart_id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cart_items (
+                cart_id TEXT NOT NULL,
+                product_id TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                PRIMARY KEY (cart_id, product_id)
+            );
+            CREATE INDEX IF NOT EXISTS carts_updated_at ON carts (updated_at);
+        """)
+        self._idle_evictions = CART_STORE_EVICTIONS_TOTAL.labels(reason="idle")
+        set_gauge_function(CART_STORE_CARTS, self.__len__)
+
+    def _sweep(self, now: float):
+        """Delete idle carts, at most once per sweep interval"""
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        cutoff = now - self.idle_ttl
+        self._db.execute("DELETE FROM cart_items WHERE cart_id IN (SELECT cart_id FROM carts WHERE updated_at < ?)", (cutoff,))
+        deleted = self._db.execute("DELETE FROM carts WHERE updated_at < ?", (cutoff,)).rowcount
+        if deleted > 0:
+            self._idle_evictions.inc(deleted)
+
+    def add_items(self, user_id: str, items: Iterable[Tuple[str, int]]) -> str:
+        cart_id = cart_id_for(user_id)
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT INTO carts (cart_id, user_id, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (cart_id) DO UPDATE SET updated_at = excluded.updated_at",
+                    (cart_id, user_id, now),
+                )
+                self._db.executemany(
+                    "INSERT INTO cart_items (cart_id, product_id, quantity) VALUES (?, ?, ?) "
+                    "ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = quantity + excluded.quantity",
+                    [(cart_id, product_id, quantity) for product_id, quantity in items],
+                )
+                self._sweep(now)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return cart_id
+
+    def get(self, cart_id: str) -> Optional[Tuple[str, Items]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT user_id FROM carts WHERE cart_id = ? AND updated_at >= ?",
+                (cart_id, time.time() - self.idle_ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            items = self._db.execute(
+                "SELECT product_id, quantity FROM cart_items WHERE cart_id = ? ORDER BY rowid",
+                (cart_id,),
+            ).fetchall()
+        return row[0], [(product_id, quantity) for product_id, quantity in items]
+
+    def clear(self, cart_id: str) -> bool:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                updated = self._db.execute(
+                    "UPDATE carts SET updated_at = ? WHERE cart_id = ?", (time.time(), cart_id)
+                ).rowcount
+                self._db.execute("DELETE FROM cart_items WHERE cart_id = ?", (cart_id,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return updated > 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM carts").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class WriteBehindCartBackend(CartBackend):
+    """Memory cart store persisted write-behind to a CartLog
+
+    Reads and writes are served from memory; each mutation is also queued
+    on the log, which a background task flushes in batches and compacts
+    with periodic snapshots. On construction the log is recovered into the
+    memory store. Idle and capacity evictions are not logged, so a cart
+    evicted since the last snapshot can return after a restart and then
+    age out again. Use one worker process per log directory.
+    """
+
+    name = "log"
+
+    def __init__(self, memory: MemoryCartBackend, log: CartLog):
+        self.memory = memory
+        self.log = log
+        self._lock = threading.Lock()
+
+        started = time.perf_counter()
+        state = log.recover()
+        for user_id, items in state.values():
+            memory.add_items(user_id, items.items())
+        logger.info(
+            f"Recovered {len(state)} carts from {log.directory} in {time.perf_counter() - started:.2f}s"
+        )
+
+    def add_items(self, user_id: str, items: Iterable[Tuple[str, int]]) -> str:
+        items = list(items)
+        # The lock keeps memory and log order identical, so a snapshot cut matches the log
+        with self._lock:
+            cart_id = self.memory.add_items(user_id, items)
+            self.log.append(["a", cart_id, user_id, items])
+        return cart_id
+
+    def get(self, cart_id: str) -> Optional[Tuple[str, Items]]:
+        return self.memory.get(cart_id)
+
+    def clear(self, cart_id: str) -> bool:
+        with self._lock:
+            cleared = self.memory.clear(cart_id)
+            if cleared:
+                self.log.append(["c", cart_id])
+        return cleared
+
+    def __len__(self) -> int:
+        return len(self.memory)
+
+    def _cut(self):
+        """Buffered log records and a copy of the store, taken at the same point"""
+        with self._lock:
+            return self.log.take_pending(), self.memory.dump()
+
+    async def start(self):
+        self.log.start(self._cut)
+
+    async def stop(self):
+        await self.log.stop()
+
+    def close(self):
+        self.log.close()
+
+
+def cart_backend_from_env() -> CartBackend:
+    """Select the backend with CART_BACKEND (memory, sqlite or log)"""
+    backend = os.getenv("CART_BACKEND", "memory").lower()
+    idle_ttl = float(os.getenv("CART_IDLE_TTL", "3600"))
+    if backend == "sqlite":
+        path = os.getenv("CART_SQLITE_PATH", "/tmp/shopstack-carts.db")
+        logger.info(f"Using SQLite cart backend at {path}")
+        return SQLiteCartBackend(path, idle_ttl=idle_ttl)
+    if backend not in ("memory", "log"):
+        logger.warning(f"Unknown CART_BACKEND {backend!r}, using memory")
+    memory = MemoryCartBackend(
+        shards=int(os.getenv("CART_SHARDS", "16")),
+        max_carts=int(os.getenv("CART_MAX_CARTS", "100000")),
+        idle_ttl=idle_ttl,
+    )
+    if backend != "log":
+        return memory
+    directory = os.getenv("CART_LOG_DIR", "/tmp/shopstack-cart-log")
+    logger.info(f"Using write-behind cart log in {directory}")
+    return WriteBehindCartBackend(memory, CartLog(
+        directory,
+        flush_interval=float(os.getenv("CART_LOG_FLUSH_INTERVAL", "0.05")),
+        snapshot_interval=float(os.getenv("CART_LOG_SNAPSHOT_INTERVAL", "300")),
+        snapshot_min_records=int(os.getenv("CART_LOG_SNAPSHOT_MIN_RECORDS", "10000")),
+        fsync=os.getenv("CART_LOG_FSYNC", "true").lower() in ("1", "true", "yes"),
+    ))
+
+
+def idempotency_table_for(backend: CartBackend) -> IdempotencyTable:
+    """Keep Idempotency-Keys where the carts are: in the SQLite file when the carts are shared through one"""
+    if isinstance(backend, SQLiteCartBackend):
+        return idempotency_table_from_env(backend.path)
+    return idempotency_table_from_env()
@@ -6,6 +6,9 @@ import os
 # Add parent directory to path to import the app
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
+# Disable simulated write failures so results are deterministic
+os.environ.setdefault("CART_FAILURE_RATE", "0")
+
 from app import app
 
 client = TestClient(app)
@@ -53,6 +56,42 @@ def test_get_cart_success():
     assert len(data["items"]) == 1
     assert data["items"][0]["product_id"] == "456"
 
+def test_add_to_cart_merges_per_user():
+    """Test repeated adds go to the user's single cart with merged quantities"""
+    first = client.post("/cart/add", json={"product_id": "123", "quantity": 1, "user_id": "user_merge"})
+    second = client.post("/cart/add", json={"product_id": "123", "quantity": 2, "user_id": "user_merge"})
+    client.post("/cart/add", json={"product_id": "456", "quantity": 1, "user_id": "user_merge"})
+    cart_id = first.json()["cart_id"]
+    assert second.json()["cart_id"] == cart_id
+
+    items = client.get(f"/cart/{cart_id}").json()["items"]
+    assert {item["product_id"]: item["quantity"] for item in items} == {"123": 3, "456": 1}
+
+def test_add_to_cart_batch():
+    """Test a batch is applied in one call with per-item results"""
+    items = [
+        {"product_id": "123", "quantity": 1, "user_id": "user_batch"},
+        {"product_id": "456", "quantity": 0, "user_id": "user_batch"},
+        {"product_id": "123", "quantity": 2, "user_id": "user_batch"},
+        {"product_id": "789", "user_id": "user_batch"},
+    ]
+    response = client.post("/cart/add/batch", json=items)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["added"] == 2
+    assert data["failed"] == 2
+    assert [r["status"] for r in data["results"]] == ["added", "invalid", "added", "invalid"]
+    assert data["results"][1]["error"].startswith("quantity")
+
+    cart = client.get(f"/cart/{data['results'][0]['cart_id']}").json()
+    assert cart["items"] == [{"product_id": "123", "quantity": 3, "user_id": "user_batch"}]
+
+def test_add_to_cart_batch_too_large():
+    """Test oversized batches are rejected"""
+    items = [{"product_id": "123", "quantity": 1, "user_id": "u"}] * 101
+    response = client.post("/cart/add/batch", json=items)
+    assert response.status_code == 422
+
 def test_get_cart_not_found():
     """Test cart not found"""
     response = client.get("/cart/nonexistent_cart")
@@ -98,3 +137,58 @@ def test_metrics():
     assert response.status_code == 200
     assert "http_requests_total" in response.text
     assert "http_request_duration_seconds" in response.text
+
+def test_metrics_cardinality_is_bounded():
+    """Test unique cart ids and unknown paths do not create new time series"""
+    def series_count(text):
+        return sum(1 for line in text.splitlines() if line.startswith(("http_requests_total{", "http_request_duration_seconds_bucket{")))
+
+    client.get("/cart/warmup")
+    client.get("/no/such/path/warmup")
+    before = client.get("/metrics").text
+    for i in range(300):
+        client.get(f"/cart/cart_unique_{i}")
+        client.get(f"/no/such/path/{i}")
+    after = client.get("/metrics").text
+
+    assert series_count(after) == series_count(before)
+    assert 'endpoint="/cart/{cart_id}"' in after
+    assert 'endpoint="unmatched"' in after
+    assert "cart_unique_" not in after
+    # Only counter values change, so the scrape barely grows
+    assert len(after) - len(before) < 2000
+
+def test_metrics_endpoint_overflow():
+    """Test templates beyond the cap are folded into the overflow label"""
+    from common.observability import MetricsMiddleware, OVERFLOW_ENDPOINT
+    middleware = MetricsMiddleware(app=None, max_endpoints=2)
+    labels = [middleware.endpoint_label({"route": type("Route", (), {"path": f"/r{i}"})()}) for i in range(5)]
+    assert labels == ["/r0", "/r1", OVERFLOW_ENDPOINT, OVERFLOW_ENDPOINT, OVERFLOW_ENDPOINT]
+
+def test_requests_answered_before_routing_keep_their_route_label():
+    """Test a response sent by a middleware ahead of the router is counted under the route template"""
+    from fastapi import FastAPI
+    from common.observability import HTTP_REQUESTS_TOTAL, MetricsMiddleware
+
+    early = FastAPI()
+
+    @early.get("/early-test/{item_id}")
+    async def get_item(item_id: str):
+        return {"id": item_id}
+
+    class Unavailable:
+        def __init__(self, app):
+            self.app = app
+
+        async def __call__(self, scope, receive, send):
+            if scope["type"] != "http":
+                return await self.app(scope, receive, send)
+            await send({"type": "http.response.start", "status": 503, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+    early.add_middleware(Unavailable)
+    early.add_middleware(MetricsMiddleware)
+
+    assert TestClient(early).get("/early-test/1").status_code == 503
+    series = HTTP_REQUESTS_TOTAL.labels(method="GET", endpoint="/early-test/{item_id}", status="503")
+    assert series._value.get() == 1
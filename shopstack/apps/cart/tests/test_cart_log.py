@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add parent directory to path to import the app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from cart_log import CartLog
+from cart_store import MemoryCartBackend, WriteBehindCartBackend
+
+def open_store(directory, **log_options) -> WriteBehindCartBackend:
+    return WriteBehindCartBackend(MemoryCartBackend(shards=4), CartLog(str(directory), **log_options))
+
+def run_briefly(store: WriteBehindCartBackend, mutate, seconds: float = 0.05):
+    """Apply `mutate` while the background task runs, then stop it"""
+    async def scenario():
+        await store.start()
+        mutate(store)
+        await asyncio.sleep(seconds)
+        await store.stop()
+    asyncio.run(scenario())
+
+def test_mutations_are_written_behind_and_recovered(tmp_path):
+    """Test writes only reach the disk on flush and a restarted store sees them all"""
+    store = open_store(tmp_path, flush_interval=0.01)
+    cart_id = store.add_items("u1", [("123", 1), ("456", 2)])
+    store.add_items("u2", [("789", 1)])
+    store.clear("cart_u2")
+    assert os.path.getsize(tmp_path / "log-00000000.jsonl") == 0
+    assert len(store.log.pending) == 3
+
+    run_briefly(store, lambda s: s.add_items("u1", [("123", 4)]))
+    assert not store.log.pending
+    store.close()
+
+    recovered = open_store(tmp_path)
+    assert recovered.get(cart_id) == ("u1", [("123", 5), ("456", 2)])
+    assert recovered.get("cart_u2") == ("u2", [])
+    assert recovered.log.segment == 1
+    recovered.close()
+
+def test_snapshot_compacts_log_and_tail_is_replayed(tmp_path):
+    """Test a snapshot replaces the segments it covers and later writes replay on top of it"""
+    store = open_store(tmp_path, flush_interval=0.01, snapshot_interval=0.0, snapshot_min_records=2)
+    for i in range(10):
+        store.add_items(f"user_{i}", [("123", i + 1)])
+    run_briefly(store, lambda s: None)
+    assert [name for name in sorted(os.listdir(tmp_path)) if name != "LOCK"] == [
+        "log-00000001.jsonl", "snapshot-00000001.json"
+    ]
+
+    store.add_items("user_0", [("456", 1)])
+    store.clear("cart_user_1")
+    asyncio.run(store.stop())
+    store.close()
+
+    recovered = open_store(tmp_path)
+    assert len(recovered) == 10
+    assert recovered.get("cart_user_0") == ("user_0", [("123", 1), ("456", 1)])
+    assert recovered.get("cart_user_1") == ("user_1", [])
+    assert recovered.get("cart_user_9") == ("user_9", [("123", 10)])
+    recovered.close()
+
+def test_torn_final_record_is_ignored(tmp_path):
+    """Test recovery keeps every complete record when a crash cut the last write short"""
+    store = open_store(tmp_path)
+    store.add_items("u1", [("123", 1)])
+    asyncio.run(store.stop())
+    store.close()
+    with open(tmp_path / "log-00000000.jsonl", "ab") as f:
+        f.write(b'["a","cart_u1","u1",[["123",')
+
+    recovered = open_store(tmp_path)
+    assert recovered.get("cart_u1") == ("u1", [("123", 1)])
+    recovered.close()
+
+def test_directory_is_locked_to_one_process(tmp_path):
+    """Test a second log on the same directory fails instead of interleaving writes"""
+    log = CartLog(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        CartLog(str(tmp_path))
+    log.close()
+    CartLog(str(tmp_path)).close()
+
+def test_gunicorn_runs_one_worker_for_the_log_backend(monkeypatch):
+    """Test the shipped gunicorn config caps workers at one when CART_BACKEND=log"""
+    import logging
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(
+        "gunicorn_conf", os.path.join(os.path.dirname(__file__), '..', '..', '..', 'common', 'gunicorn_conf.py')
+    )
+    conf = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(conf)
+    server = type("Arbiter", (), {"log": logging.getLogger("gunicorn.test"), "num_workers": 2})()
+
+    monkeypatch.setenv("CART_BACKEND", "sqlite")
+    conf.nworkers_changed(server, 2, None)
+    assert server.num_workers == 2
+
+    monkeypatch.setenv("CART_BACKEND", "log")
+    conf.nworkers_changed(server, 2, None)
+    assert server.num_workers == 1
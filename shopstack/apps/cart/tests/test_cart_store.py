@@ -0,0 +1,75 @@
+import pytest
+import threading
+import time
+import sys
+import os
+
+# Add parent directory to path to import the app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from cart_log import CartLog
+from cart_store import MemoryCartBackend, SQLiteCartBackend, WriteBehindCartBackend
+
+@pytest.fixture(params=["memory", "sqlite", "log"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryCartBackend(shards=4, max_carts=1000)
+    elif request.param == "log":
+        store = WriteBehindCartBackend(MemoryCartBackend(shards=4, max_carts=1000), CartLog(str(tmp_path / "log")))
+    else:
+        store = SQLiteCartBackend(str(tmp_path / "carts.db"))
+    yield store
+    store.close()
+
+def test_add_get_clear(backend):
+    """Test the basic cart lifecycle on every backend"""
+    cart_id = backend.add_items("u1", [("123", 1), ("456", 2)])
+    assert backend.add_items("u1", [("123", 4)]) == cart_id
+    assert backend.get(cart_id) == ("u1", [("123", 5), ("456", 2)])
+    assert backend.clear(cart_id)
+    assert backend.get(cart_id) == ("u1", [])
+    assert backend.get("cart_nobody") is None
+    assert not backend.clear("cart_nobody")
+
+def test_concurrent_adds_are_not_lost(backend):
+    """Test lock striping keeps merged quantities exact under threads"""
+    def worker():
+        for _ in range(200):
+            backend.add_items("shared", [("123", 1)])
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert backend.get("cart_shared") == ("shared", [("123", 1600)])
+
+def test_memory_capacity_eviction():
+    """Test the store stays bounded by evicting least recently used carts"""
+    store = MemoryCartBackend(shards=2, max_carts=10)
+    for i in range(100):
+        store.add_items(f"user_{i}", [("123", 1)])
+    assert len(store) <= 10
+    assert store.get("cart_user_99") is not None
+
+def test_memory_idle_eviction(monkeypatch):
+    """Test idle carts expire"""
+    store = MemoryCartBackend(shards=1, idle_ttl=60)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    store.add_items("idle", [("123", 1)])
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    store.add_items("active", [("123", 1)])
+    assert store.get("cart_idle") is None
+    assert len(store) == 1
+
+def test_sqlite_shared_between_instances(tmp_path):
+    """Test two workers opening the same file see the same carts"""
+    path = str(tmp_path / "carts.db")
+    worker_a = SQLiteCartBackend(path)
+    worker_b = SQLiteCartBackend(path)
+    cart_id = worker_a.add_items("u1", [("123", 1)])
+    worker_b.add_items("u1", [("123", 2)])
+    assert worker_a.get(cart_id) == ("u1", [("123", 3)])
+    worker_a.close()
+    worker_b.close()
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import time
+import sys
+import os
+
+from fastapi.testclient import TestClient
+
+# Add parent directory to path to import the app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Disable simulated write failures so results are deterministic
+os.environ.setdefault("CART_FAILURE_RATE", "0")
+
+from app import app
+from common.idempotency import IdempotencyMiddleware, IdempotencyTable, SQLiteIdempotencyTable
+from common.observability import IDEMPOTENCY_REQUESTS_TOTAL
+
+client = TestClient(app)
+
+def counting_app(calls: list, statuses=(200,), release: asyncio.Event = None):
+    """ASGI app answering with the next status in `statuses`, optionally held until `release`"""
+    async def app(scope, receive, send):
+        message = await receive()
+        calls.append(message["body"])
+        if release is not None:
+            await release.wait()
+        status = statuses[min(len(calls), len(statuses)) - 1]
+        await send({"type": "http.response.start", "status": status, "headers": []})
+        await send({"type": "http.response.body", "body": json.dumps({"call": len(calls)}).encode()})
+    return app
+
+async def call(middleware, key="k1", body=b'{"a":1}'):
+    """POST through the middleware; returns (status, headers, body)"""
+    messages = []
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+    async def send(message):
+        messages.append(message)
+    scope = {
+        "type": "http", "method": "POST", "path": "/cart/add", "query_string": b"",
+        "headers": [(b"idempotency-key", key.encode())],
+    }
+    await middleware(scope, receive, send)
+    return messages[0]["status"], dict(messages[0]["headers"]), messages[1]["body"]
+
+def test_retried_add_is_replayed_without_a_second_write():
+    """Test a retry with the same key returns the stored response and adds nothing"""
+    replays_before = IDEMPOTENCY_REQUESTS_TOTAL.labels(result="replayed")._value.get()
+    item = {"product_id": "123", "quantity": 2, "user_id": "user_idempotent"}
+    headers = {"Idempotency-Key": "add-once"}
+    first = client.post("/cart/add", json=item, headers=headers)
+    second = client.post("/cart/add", json=item, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert client.get("/cart/cart_user_idempotent").json()["items"][0]["quantity"] == 2
+    assert IDEMPOTENCY_REQUESTS_TOTAL.labels(result="replayed")._value.get() - replays_before == 1
+
+def test_key_reused_for_a_different_request_is_rejected():
+    """Test the same key with another body gets 422 instead of the wrong response"""
+    headers = {"Idempotency-Key": "reused"}
+    client.post("/cart/add", json={"product_id": "123", "quantity": 1, "user_id": "user_reuse"}, headers=headers)
+    response = client.post("/cart/add", json={"product_id": "456", "quantity": 1, "user_id": "user_reuse"}, headers=headers)
+    assert response.status_code == 422
+
+def test_concurrent_duplicates_are_coalesced():
+    """Test duplicates arriving while the first is running wait for its response"""
+    async def scenario():
+        calls, release = [], asyncio.Event()
+        middleware = IdempotencyMiddleware(counting_app(calls, release=release))
+        tasks = [asyncio.create_task(call(middleware)) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return calls, await asyncio.gather(*tasks)
+
+    calls, responses = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert {body for _, _, body in responses} == {b'{"call": 1}'}
+    assert sum(b"idempotent-replayed" in headers for _, headers, _ in responses) == 4
+
+def test_server_errors_are_not_stored():
+    """Test a retry after a 5xx runs the request again"""
+    async def scenario():
+        calls = []
+        middleware = IdempotencyMiddleware(counting_app(calls, statuses=(500, 200)))
+        return calls, [await call(middleware) for _ in range(3)]
+
+    calls, responses = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert [status for status, _, _ in responses] == [500, 200, 200]
+
+def test_table_is_bounded_and_expires(monkeypatch):
+    """Test keys are evicted least recently used first and expire after the TTL"""
+    table = IdempotencyTable(max_keys=2, ttl=60)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    for key in ("a", "b", "c"):
+        table.set(key, "fp", (200, [], b""))
+    assert table.get("a") is None
+    assert table.get("b") == ("fp", (200, [], b""))
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert table.get("c") is None
+
+def test_workers_sharing_a_sqlite_table_replay_each_others_keys(tmp_path):
+    """Test a retry reaching another worker is replayed, and a duplicate there waits for the first"""
+    path = str(tmp_path / "carts.db")
+    async def scenario():
+        calls, release = [], asyncio.Event()
+        handler = counting_app(calls, release=release)
+        first = IdempotencyMiddleware(handler, table=SQLiteIdempotencyTable(path, poll_interval=0.001))
+        second = IdempotencyMiddleware(handler, table=SQLiteIdempotencyTable(path, poll_interval=0.001))
+        running = asyncio.create_task(call(first))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.create_task(call(second))
+        await asyncio.sleep(0.01)
+        release.set()
+        responses = [await running, await waiting, await call(second)]
+        mismatch = await call(second, body=b'{"a":2}')
+        return calls, responses, mismatch
+
+    calls, responses, mismatch = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert {body for _, _, body in responses} == {b'{"call": 1}'}
+    assert [b"idempotent-replayed" in headers for _, headers, _ in responses] == [False, True, True]
+    assert mismatch[0] == 422
+
+def test_sqlite_claim_released_after_server_error(tmp_path):
+    """Test a 5xx releases the key, so a retry through another worker runs again"""
+    path = str(tmp_path / "carts.db")
+    async def scenario():
+        calls = []
+        handler = counting_app(calls, statuses=(500, 200))
+        first = IdempotencyMiddleware(handler, table=SQLiteIdempotencyTable(path))
+        second = IdempotencyMiddleware(handler, table=SQLiteIdempotencyTable(path))
+        return calls, [await call(first), await call(second), await call(first)]
+
+    calls, responses = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert [status for status, _, _ in responses] == [500, 200, 200]
+    assert b"idempotent-replayed" in responses[2][1]
@@ -1,23 +1,44 @@
 import os
-import random
-import time
 import logging
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 
 # Add parent directory to path to import common module
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
+from common.admission import EXEMPT_PATHS, AdmissionControlMiddleware
 from common.observability import add_observability_routes, setup_otel_instrumentation
+from common.latency import latency_model_from_env
+from common.responses import json_response, make_etag
+from common.upstream import UpstreamClient
+from product_store import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ProductStore, load_product_store
+from change_feed import ChangeFeed, StoreFollower
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
 # Setup OpenTelemetry if configured
-setup_otel_instrumentation()
+setup_otel_instrumentation("catalog")
 
-app = FastAPI(title="Catalog Service", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Follow the catalog writer while running, if this process is a follower"""
+    if follower is not None:
+        await writer_upstream.start()
+        await follower.start()
+    yield
+    if follower is not None:
+        await follower.stop()
+        await writer_upstream.close()
+
+app = FastAPI(title="Catalog Service", version="1.0.0", lifespan=lifespan)
+
+# Cap in-flight requests per worker; added first so shed requests are still measured.
+# Parked change-feed long-polls do no work, so they do not take a slot.
+app.add_middleware(AdmissionControlMiddleware, exempt_paths=EXEMPT_PATHS + ("/catalog/changes",))
 
 # Add observability routes
 add_observability_routes(app)
@@ -29,7 +50,10 @@ class Product(BaseModel):
     price: float
     category: str
 
-# Simulate product database
+# Simulated database read latency (20-60ms by default)
+read_latency = latency_model_from_env("CATALOG_READ", "uniform:0.02,0.06")
+
+# Seed products, always present for demos and smoke tests
 PRODUCTS = {
     "123": Product(
         id="123",
@@ -54,29 +78,156 @@ PRODUCTS = {
     )
 }
 
+# Indexed product store: seed products plus an optional JSONL/CSV file and synthetic products
+CATALOG_DATA_FILE = os.getenv("CATALOG_DATA_FILE")
+CATALOG_SYNTHETIC_PRODUCTS = int(os.getenv("CATALOG_SYNTHETIC_PRODUCTS", "0"))
+
+store = load_product_store(
+    (product.model_dump() for product in PRODUCTS.values()),
+    data_file=CATALOG_DATA_FILE,
+    synthetic_count=CATALOG_SYNTHETIC_PRODUCTS,
+)
+
+# One writer process accepts admin changes and publishes them on a versioned feed.
+# Followers copy the writer's catalog and apply its feed to their own store, so
+# every catalog process converges on the writer's data.
+CATALOG_ROLE = os.getenv("CATALOG_ROLE", "writer").lower()
+CATALOG_WRITER_URL = os.getenv("CATALOG_WRITER_URL")
+CATALOG_FEED_MAX_CHANGES = int(os.getenv("CATALOG_FEED_MAX_CHANGES", "10000"))
+CATALOG_FEED_MAX_WAIT = 60.0
+
+if CATALOG_ROLE not in ("writer", "follower"):
+    raise ValueError(f"Unknown CATALOG_ROLE {CATALOG_ROLE!r}; expected writer or follower")
+if CATALOG_ROLE == "follower" and not CATALOG_WRITER_URL:
+    raise ValueError("CATALOG_ROLE=follower needs CATALOG_WRITER_URL")
+
+def use_store(new_store: ProductStore):
+    global store
+    store = new_store
+
+feed = ChangeFeed(CATALOG_FEED_MAX_CHANGES) if CATALOG_ROLE == "writer" else None
+writer_upstream = UpstreamClient("catalog_writer", CATALOG_WRITER_URL) if CATALOG_ROLE == "follower" else None
+follower = StoreFollower(writer_upstream, store, use_store) if CATALOG_ROLE == "follower" else None
+
+def require_writer():
+    """Admin changes and the feed are served only by the writer"""
+    if feed is None:
+        raise HTTPException(status_code=403, detail=f"Catalog changes are handled by the writer at {CATALOG_WRITER_URL}")
+
+@app.get("/catalog/changes")
+async def get_changes(
+    since: Optional[int] = Query(None, ge=0),
+    epoch: Optional[str] = None,
+    timeout: float = Query(0.0, ge=0, le=CATALOG_FEED_MAX_WAIT),
+):
+    """Product changes after version `since`, waiting up to `timeout` seconds for one
+
+    Returns `{"epoch", "version", "reset", "changes": [...]}`. Pass `version`
+    (and `epoch`) back as `since` on the next call. `reset` means the
+    changes since then are no longer held and the consumer must copy the
+    catalog again; without `since` only the current version is returned.
+    """
+    require_writer()
+    if since is not None and feed.is_current(since, epoch):
+        await feed.wait(since, timeout)
+    return Response(content=feed.page(since, epoch), media_type="application/json")
+
 @app.get("/catalog/{product_id}")
-async def get_product(product_id: str):
+async def get_product(product_id: str, request: Request):
     """Get product by ID with simulated database read latency"""
-    logger.info(f"Fetching product {product_id}")
+    logger.info("Fetching product %s", product_id)
     
-    # Simulate database read latency (20-60ms)
-    latency = random.uniform(0.02, 0.06)
-    time.sleep(latency)
+    # Simulate database read latency without blocking the event loop
+    await read_latency.wait()
     
-    if product_id not in PRODUCTS:
-        logger.warning(f"Product {product_id} not found")
+    rendered = store.get_rendered(product_id)
+    if rendered is None:
+        logger.warning("Product %s not found", product_id)
         raise HTTPException(status_code=404, detail="Product not found")
     
-    product = PRODUCTS[product_id]
-    logger.info(f"Successfully retrieved product {product_id}: {product.name}")
+    logger.info("Successfully retrieved product %s", product_id)
     
-    return product
+    body, etag = rendered
+    return json_response(request, body, etag)
 
 @app.get("/catalog")
-async def list_products():
-    """List all products"""
-    logger.info("Listing all products")
-    return list(PRODUCTS.values())
+async def list_products(
+    request: Request,
+    category: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    limit: int = Query(DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    ids: Optional[List[str]] = Query(None, description="Comma-separated product ids to fetch in one request"),
+):
+    """List products one page at a time, optionally filtered by category and price range
+
+    With `ids`, fetch those products in one read instead and report missing ids.
+    """
+    if ids is not None:
+        return await get_products(request, ids)
+    
+    logger.info(
+        "Listing products (category=%s, min_price=%s, max_price=%s, limit=%s)",
+        category, min_price, max_price, limit,
+    )
+    
+    try:
+        body = store.query_page(category, min_price, max_price, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    return json_response(request, body, make_etag(body))
+
+async def get_products(request: Request, ids: List[str]):
+    """Multi-get: resolve many product ids with a single simulated read"""
+    product_ids = list(dict.fromkeys(
+        product_id.strip()
+        for value in ids
+        for product_id in value.split(",")
+        if product_id.strip()
+    ))
+    if len(product_ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_PAGE_SIZE} ids per request")
+    
+    logger.info("Fetching %d products", len(product_ids))
+    
+    # One simulated database read for the whole batch
+    await read_latency.wait()
+    
+    body = store.get_many_page(product_ids)
+    return json_response(request, body, make_etag(body))
+
+@app.put("/admin/products/{product_id}")
+async def upsert_product(product_id: str, product: Product, response: Response):
+    """Create or replace a product and publish the change to the feed"""
+    require_writer()
+    if product.id != product_id:
+        raise HTTPException(status_code=422, detail="Product id does not match the path")
+    
+    try:
+        created = store.upsert(product.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    body, _ = store.get_rendered(product_id)
+    version = feed.publish("upsert", product_id, body)
+    logger.info("%s product %s at version %d", "Created" if created else "Updated", product_id, version)
+    
+    response.status_code = 201 if created else 200
+    return {"product": product, "version": version}
+
+@app.delete("/admin/products/{product_id}")
+async def delete_product(product_id: str):
+    """Delete a product and publish the change to the feed"""
+    require_writer()
+    if not store.delete(product_id):
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    version = feed.publish("delete", product_id)
+    logger.info("Deleted product %s at version %d", product_id, version)
+    
+    return {"message": "Product deleted", "product_id": product_id, "version": version}
 
 if __name__ == "__main__":
     import uvicorn
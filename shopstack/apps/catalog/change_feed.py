@@ -0,0 +1,117 @@
+# Versioned feed of product changes for downstream replicas of the catalog
+import uuid
+import asyncio
+from collections import deque
+from itertools import islice
+from typing import Callable, List, Optional
+
+from common.feed_follower import CatalogFollower
+from common.responses import render_json
+from common.upstream import UpstreamClient
+from product_store import ProductStore, load_product_store
+
+# Changes returned by one feed response; consumers that are further behind poll again
+MAX_CHANGES_PER_PAGE = 1000
+
+
+class ChangeFeed:
+    """Bounded, versioned log of product upserts and deletes with long-poll waiting
+
+    Every change gets the next version number and is kept pre-rendered as
+    `{"version", "op", "id", "product"}` JSON. The last `max_changes`
+    changes are retained; a consumer that asks for changes since an older
+    version, or one from a different `epoch` (a restarted process), is told
+    to reset and copy the catalog again. The feed, like the store it
+    describes, belongs to one process: the catalog writer. Every other
+    catalog process follows it with a StoreFollower.
+    """
+
+    def __init__(self, max_changes: int = 10000):
+        self.epoch = uuid.uuid4().hex
+        self.version = 0
+        self._changes: deque = deque(maxlen=max_changes)
+        self._waiters: set = set()
+
+    def publish(self, op: str, product_id: str, product: Optional[bytes] = None) -> int:
+        """Record an `upsert` (with the product's JSON bytes) or a `delete`; returns its version"""
+        self.version += 1
+        change = (
+            b'{"version":' + render_json(self.version)
+            + b',"op":' + render_json(op)
+            + b',"id":' + render_json(product_id)
+        )
+        if product is not None:
+            change += b',"product":' + product
+        self._changes.append(change + b"}")
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+        return self.version
+
+    def is_current(self, since: int, epoch: Optional[str] = None) -> bool:
+        """Whether a consumer at version `since` of `epoch` can catch up from the retained changes"""
+        if epoch is not None and epoch != self.epoch:
+            return False
+        return self.version - len(self._changes) <= since <= self.version
+
+    def changes_since(self, since: int, limit: int = MAX_CHANGES_PER_PAGE) -> List[bytes]:
+        """Rendered changes after version `since`, oldest first; `since` must be current"""
+        start = since - (self.version - len(self._changes))
+        return list(islice(self._changes, start, start + limit))
+
+    async def wait(self, since: int, timeout: float):
+        """Wait up to `timeout` seconds for a change after version `since`"""
+        if self.version > since or timeout <= 0:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.add(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=timeout)
+        finally:
+            self._waiters.discard(waiter)
+
+    def page(self, since: Optional[int], epoch: Optional[str] = None) -> bytes:
+        """Feed response for a consumer at `since`: the changes after it, or a reset
+
+        `version` in the response is what the consumer passes as `since`
+        next. Without `since` the response only reports the current version,
+        which is where a consumer starts following after copying the catalog.
+        """
+        if since is None:
+            return self._render(self.version, False, [])
+        if not self.is_current(since, epoch):
+            return self._render(self.version, True, [])
+        changes = self.changes_since(since)
+        return self._render(since + len(changes), False, changes)
+
+    def _render(self, version: int, reset: bool, changes: List[bytes]) -> bytes:
+        return (
+            b'{"epoch":' + render_json(self.epoch)
+            + b',"version":' + render_json(version)
+            + b',"reset":' + render_json(reset)
+            + b',"changes":[' + b",".join(changes) + b"]}"
+        )
+
+
+class StoreFollower(CatalogFollower):
+    """Keeps a follower's product store in step with the catalog writer
+
+    A copy of the writer's catalog becomes a new store, handed to
+    `on_replace`; feed changes are applied to the current one in place.
+    """
+
+    def __init__(self, upstream: UpstreamClient, store: ProductStore, on_replace: Callable[[ProductStore], None], **options):
+        super().__init__(upstream, **options)
+        self.store = store
+        self.on_replace = on_replace
+
+    def replace(self, products: List[dict], reason: str):
+        self.store = load_product_store(products)
+        self.on_replace(self.store)
+
+    def apply(self, change: dict):
+        if change["op"] == "upsert":
+            self.store.upsert(change["product"])
+        else:
+            self.store.delete(change["id"])
@@ -0,0 +1,366 @@
+# Column-oriented, indexed product store for the catalog service
+import os
+import csv
+import json
+import base64
+import random
+import logging
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from common.responses import make_etag, render_json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class ProductStore:
+    """Products stored as parallel columns with secondary indexes
+
+    Each product is also pre-rendered to its JSON bytes and a strong ETag when
+    it is added, so reads never re-serialize.
+
+    Rows are addressed by a stable integer position. Indexes hold row numbers
+    in compact `array('I')` columns:
+
+    - all rows, in row order
+    - by category, in row order
+    - by price, ordered by (price, row)
+    - by category and price, ordered by (price, row)
+
+    so a filtered listing is a bisect plus a slice and costs O(log n + page).
+    `upsert()` and `delete()` change one product after loading and update the
+    indexes in place. A deleted product's row is left as an unindexed
+    tombstone, so other rows keep their positions and cursors stay valid.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.descriptions: List[str] = []
+        self.prices = array("d")
+        self.category_codes = array("I")
+        self.rendered: List[bytes] = []
+        self.etags: List[str] = []
+        self.categories: List[str] = []
+        self._category_code: Dict[str, int] = {}
+        self._row_by_id: Dict[str, int] = {}
+        self._all = array("I")
+        self._by_category: Dict[int, array] = {}
+        self._by_price = array("I")
+        self._by_category_price: Dict[int, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self._row_by_id
+
+    def _encode_category(self, category: str) -> int:
+        code = self._category_code.get(category)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(category)
+            self._category_code[category] = code
+        return code
+
+    def add(self, product: dict):
+        """Add or overwrite a product; call `build_indexes()` after bulk loading"""
+        product_id = str(product["id"])
+        name = str(product["name"])
+        description = str(product.get("description") or "")
+        price = float(product["price"])
+        category = str(product["category"])
+        body = render_json({
+            "id": product_id,
+            "name": name,
+            "description": description,
+            "price": price,
+            "category": category,
+        })
+        etag = make_etag(body)
+        # Only once the product has rendered, so a rejected one leaves no unindexed category behind
+        code = self._encode_category(category)
+        row = self._row_by_id.get(product_id)
+        if row is None:
+            self._row_by_id[product_id] = len(self.ids)
+            self.ids.append(product_id)
+            self.names.append(name)
+            self.descriptions.append(description)
+            self.prices.append(price)
+            self.category_codes.append(code)
+            self.rendered.append(body)
+            self.etags.append(etag)
+        else:
+            self.names[row] = name
+            self.descriptions[row] = description
+            self.prices[row] = price
+            self.category_codes[row] = code
+            self.rendered[row] = body
+            self.etags[row] = etag
+
+    def upsert(self, product: dict) -> bool:
+        """Add or replace one product, keeping the indexes current; returns True if it is new
+
+        Raises KeyError, TypeError or ValueError for a malformed product and
+        leaves the store unchanged.
+        """
+        product_id = str(product["id"])
+        row = self._row_by_id.get(product_id)
+        if row is None:
+            self.add(product)
+            self._index(self._row_by_id[product_id])
+            return True
+        self._unindex(row)
+        try:
+            self.add(product)
+        finally:
+            # Under the new price and category, or the old ones if the product was rejected
+            self._index(row)
+        return False
+
+    def delete(self, product_id: str) -> bool:
+        """Remove a product; returns False if it does not exist"""
+        row = self._row_by_id.get(product_id)
+        if row is None:
+            return False
+        self._unindex(row)
+        del self._row_by_id[product_id]
+        self.rendered[row] = b""
+        return True
+
+    def _index(self, row: int):
+        code = self.category_codes[row]
+        insort(self._all, row)
+        insort(self._by_category.setdefault(code, array("I")), row)
+        insort(self._by_price, row, key=self._price_key)
+        insort(self._by_category_price.setdefault(code, array("I")), row, key=self._price_key)
+
+    def _unindex(self, row: int):
+        code = self.category_codes[row]
+        key = self._price_key(row)
+        for rows in (self._all, self._by_category[code]):
+            del rows[bisect_left(rows, row)]
+        for rows in (self._by_price, self._by_category_price[code]):
+            del rows[bisect_left(rows, key, key=self._price_key)]
+
+    def build_indexes(self):
+        """Rebuild the secondary indexes from the columns"""
+        prices = self.prices
+        live = sorted(self._row_by_id.values())
+        by_category: Dict[int, array] = {}
+        for row in live:
+            code = self.category_codes[row]
+            rows = by_category.get(code)
+            if rows is None:
+                rows = by_category[code] = array("I")
+            rows.append(row)
+
+        # sorted() is stable, so equal prices stay in row order
+        self._all = array("I", live)
+        self._by_price = array("I", sorted(live, key=prices.__getitem__))
+        self._by_category = by_category
+        self._by_category_price = {
+            code: array("I", sorted(rows, key=prices.__getitem__))
+            for code, rows in by_category.items()
+        }
+
+    def row(self, row: int) -> dict:
+        return {
+            "id": self.ids[row],
+            "name": self.names[row],
+            "description": self.descriptions[row],
+            "price": self.prices[row],
+            "category": self.categories[self.category_codes[row]],
+        }
+
+    def get(self, product_id: str) -> Optional[dict]:
+        """Return a product as a dict, or None if it does not exist"""
+        row = self._row_by_id.get(product_id)
+        if row is None:
+            return None
+        return self.row(row)
+
+    def get_rendered(self, product_id: str) -> Optional[Tuple[bytes, str]]:
+        """Return the pre-rendered JSON body and ETag of a product, or None"""
+        row = self._row_by_id.get(product_id)
+        if row is None:
+            return None
+        return self.rendered[row], self.etags[row]
+
+    def get_many_page(self, product_ids: Iterable[str]) -> bytes:
+        """Return `{"items": [...], "missing": [...]}` JSON bytes for a multi-get, in request order"""
+        rendered = []
+        missing = []
+        for product_id in product_ids:
+            row = self._row_by_id.get(product_id)
+            if row is None:
+                missing.append(product_id)
+            else:
+                rendered.append(self.rendered[row])
+        return b'{"items":[' + b",".join(rendered) + b'],"missing":' + render_json(missing) + b"}"
+
+    def _price_key(self, row: int) -> Tuple[float, int]:
+        return (self.prices[row], row)
+
+    def query(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Return one page of matching products and the cursor for the next page"""
+        rows, next_cursor = self.query_rows(category, min_price, max_price, limit, cursor)
+        return [self.row(row) for row in rows], next_cursor
+
+    def query_page(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+    ) -> bytes:
+        """Return one page as JSON bytes assembled from the pre-rendered products"""
+        rows, next_cursor = self.query_rows(category, min_price, max_price, limit, cursor)
+        items = b",".join([self.rendered[row] for row in rows])
+        return b'{"items":[' + items + b'],"next_cursor":' + render_json(next_cursor) + b"}"
+
+    def query_rows(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+    ) -> Tuple[Sequence[int], Optional[str]]:
+        """Return the rows of one page of matching products and the next-page cursor
+
+        Unfiltered and category-only listings are in load order; any price
+        filter switches to ascending price order. Raises ValueError for a
+        cursor that does not belong to this kind of query.
+        """
+        by_price = min_price is not None or max_price is not None
+        if category is not None:
+            code = self._category_code.get(category)
+            if code is None:
+                return (), None
+            index = (self._by_category_price if by_price else self._by_category).get(code, ())
+        else:
+            index = self._by_price if by_price else self._all
+
+        after = decode_cursor(cursor) if cursor else None
+        lo, hi = 0, len(index)
+        if by_price:
+            if min_price is not None:
+                lo = bisect_left(index, (min_price, -1), key=self._price_key)
+            if max_price is not None:
+                hi = bisect_right(index, (max_price, float("inf")), key=self._price_key)
+            if after is not None:
+                if len(after) != 2:
+                    raise ValueError("Cursor does not match a price-ordered query")
+                lo = max(lo, bisect_right(index, after, key=self._price_key))
+        elif after is not None:
+            if len(after) != 1:
+                raise ValueError("Cursor does not match a load-ordered query")
+            lo = bisect_right(index, after[0])
+
+        end = min(lo + limit, hi)
+        rows = index[lo:end]
+
+        next_cursor = None
+        if end < hi and rows:
+            last = rows[-1]
+            next_cursor = encode_cursor((self.prices[last], last) if by_price else (last,))
+        return rows, next_cursor
+
+
+def encode_cursor(position: tuple) -> str:
+    """Encode an index position as an opaque cursor"""
+    raw = ":".join(repr(value) for value in position)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by `encode_cursor`; raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        parts = raw.split(":")
+        if len(parts) == 1:
+            return (int(parts[0]),)
+        if len(parts) == 2:
+            return (float(parts[0]), int(parts[1]))
+    except (ValueError, UnicodeDecodeError):
+        pass
+    raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_csv(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def synthetic_products(count: int, seed: int = 42) -> Iterator[dict]:
+    """Generate `count` reproducible products with ids "0" .. str(count - 1)"""
+    rng = random.Random(seed)
+    categories = ["Electronics", "Sports", "Home", "Books", "Toys", "Clothing", "Garden", "Beauty"]
+    for i in range(count):
+        category = categories[i % len(categories)]
+        yield {
+            "id": str(i),
+            "name": f"{category} item {i}",
+            "description": f"Synthetic {category.lower()} product {i}",
+            "price": round(rng.uniform(1.0, 500.0), 2),
+            "category": category,
+        }
+
+
+def load_products(store: ProductStore, products: Iterable[dict]) -> int:
+    """Add products to the store, skipping malformed rows; returns rows loaded"""
+    loaded = 0
+    skipped = 0
+    for product in products:
+        try:
+            store.add(product)
+            loaded += 1
+        except (KeyError, TypeError, ValueError):
+            skipped += 1
+    if skipped:
+        logger.warning(f"Skipped {skipped} malformed product rows")
+    return loaded
+
+
+def load_product_store(
+    seed_products: Iterable[dict] = (),
+    data_file: Optional[str] = None,
+    synthetic_count: int = 0,
+) -> ProductStore:
+    """Build an indexed store from seed products, an optional JSONL/CSV file and synthetic products"""
+    store = ProductStore()
+    load_products(store, seed_products)
+
+    if data_file:
+        reader = read_csv if os.path.splitext(data_file)[1].lower() == ".csv" else read_jsonl
+        loaded = load_products(store, reader(data_file))
+        logger.info(f"Loaded {loaded} products from {data_file}")
+
+    if synthetic_count:
+        existing = set(store.ids)
+        load_products(store, (p for p in synthetic_products(synthetic_count) if p["id"] not in existing))
+
+    store.build_indexes()
+    logger.info(f"Product store ready with {len(store)} products in {len(store.categories)} categories")
+    return store
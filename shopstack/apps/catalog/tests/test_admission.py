@@ -0,0 +1,171 @@
+import sys
+import asyncio
+import os
+
+import pytest
+
+# Add the repository root to path to import the common module
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from common.admission import AdmissionController, AdmissionControlMiddleware, Overloaded
+from common.observability import ADMISSION_QUEUE_DEPTH, ADMISSION_REQUESTS_IN_FLIGHT, ADMISSION_SHED_TOTAL
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+def blocking_app(release: asyncio.Event, started: list):
+    """ASGI app that holds every request until `release` is set"""
+    async def app(scope, receive, send):
+        started.append(scope["path"])
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+    return app
+
+async def call(middleware, path="/catalog/1"):
+    """Run one request through the middleware; returns (status, headers)"""
+    messages = []
+    async def send(message):
+        messages.append(message)
+    await middleware({"type": "http", "method": "GET", "path": path, "headers": []}, receive, send)
+    start = messages[0]
+    return start["status"], dict(start["headers"])
+
+def test_excess_requests_are_shed_with_retry_after():
+    """Test requests beyond the in-flight cap and queue get 503 with Retry-After"""
+    async def scenario():
+        release, started = asyncio.Event(), []
+        middleware = AdmissionControlMiddleware(
+            blocking_app(release, started), max_in_flight=2, max_queue=1, queue_timeout=5.0, retry_after=3
+        )
+        tasks = [asyncio.create_task(call(middleware)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        shed = await call(middleware)
+        assert len(started) == 2
+        assert middleware.controller.in_flight == 2 and len(middleware.controller.waiters) == 1
+        release.set()
+        return shed, [await task for task in tasks], started
+
+    shed_before = ADMISSION_SHED_TOTAL.labels(reason="queue_full")._value.get()
+    shed, admitted, started = asyncio.run(scenario())
+    status, headers = shed
+    assert status == 503
+    assert headers[b"retry-after"] == b"3"
+    assert [status for status, _ in admitted] == [200, 200, 200]
+    assert len(started) == 3
+    assert ADMISSION_SHED_TOTAL.labels(reason="queue_full")._value.get() - shed_before == 1
+
+def test_queued_request_times_out():
+    """Test a queued request is shed once its queue deadline passes"""
+    async def scenario():
+        release, started = asyncio.Event(), []
+        middleware = AdmissionControlMiddleware(
+            blocking_app(release, started), max_in_flight=1, max_queue=10, queue_timeout=0.02
+        )
+        first = asyncio.create_task(call(middleware))
+        await asyncio.sleep(0.01)
+        status, _ = await call(middleware)
+        release.set()
+        await first
+        return status, middleware.controller
+
+    timeouts_before = ADMISSION_SHED_TOTAL.labels(reason="timeout")._value.get()
+    status, controller = asyncio.run(scenario())
+    assert status == 503
+    assert controller.in_flight == 0 and not controller.waiters
+    assert ADMISSION_SHED_TOTAL.labels(reason="timeout")._value.get() - timeouts_before == 1
+
+def test_health_and_metrics_bypass_admission():
+    """Test probes and scrapes are served even when every slot is taken"""
+    async def scenario():
+        release, started = asyncio.Event(), []
+        middleware = AdmissionControlMiddleware(blocking_app(release, started), max_in_flight=1, max_queue=0)
+        busy = asyncio.create_task(call(middleware))
+        await asyncio.sleep(0.01)
+        release.set()
+        statuses = [await call(middleware, path) for path in ("/healthz", "/metrics")]
+        await busy
+        return statuses
+
+    assert [status for status, _ in asyncio.run(scenario())] == [200, 200]
+
+def test_slots_are_handed_over_in_order_and_gauges_return_to_zero():
+    """Test a released slot goes to the oldest waiter and cancelled waiters give up their place"""
+    in_flight_before = ADMISSION_REQUESTS_IN_FLIGHT._value.get()
+    queued_before = ADMISSION_QUEUE_DEPTH._value.get()
+
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=5, queue_timeout=5.0)
+        order = []
+        async def worker(name):
+            await controller.acquire()
+            order.append(name)
+            await asyncio.sleep(0.01)
+            controller.release()
+
+        await controller.acquire()
+        tasks = {name: asyncio.create_task(worker(name)) for name in "abc"}
+        await asyncio.sleep(0.01)
+        assert ADMISSION_QUEUE_DEPTH._value.get() - queued_before == 3
+        tasks["b"].cancel()
+        await asyncio.sleep(0)
+        controller.release()
+        await asyncio.gather(tasks["a"], tasks["c"])
+        return order, controller
+
+    order, controller = asyncio.run(scenario())
+    assert order == ["a", "c"]
+    assert controller.in_flight == 0
+    assert ADMISSION_REQUESTS_IN_FLIGHT._value.get() == in_flight_before
+    assert ADMISSION_QUEUE_DEPTH._value.get() == queued_before
+
+def test_disabled_when_max_in_flight_is_zero():
+    """Test a cap of 0 turns admission control off"""
+    async def scenario():
+        release, started = asyncio.Event(), []
+        release.set()
+        middleware = AdmissionControlMiddleware(blocking_app(release, started), max_in_flight=0)
+        return await asyncio.gather(*(call(middleware) for _ in range(50)))
+
+    assert all(status == 200 for status, _ in asyncio.run(scenario()))
+
+def test_controller_rejects_when_queue_is_full():
+    """Test the controller raises Overloaded with the reason"""
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=0, queue_timeout=1.0)
+        await controller.acquire()
+        with pytest.raises(Overloaded) as exc_info:
+            await controller.acquire()
+        return exc_info.value.reason
+
+    assert asyncio.run(scenario()) == "queue_full"
+
+def test_shed_requests_keep_their_route_label():
+    """Test requests shed before routing are counted under their route template, not `unmatched`"""
+    import httpx
+    from fastapi import FastAPI
+    from common.observability import HTTP_REQUESTS_TOTAL, MetricsMiddleware
+
+    release = asyncio.Event()
+    app = FastAPI()
+
+    @app.get("/shed-test/{item_id}")
+    async def get_item(item_id: str):
+        await release.wait()
+        return {"id": item_id}
+
+    app.add_middleware(AdmissionControlMiddleware, max_in_flight=1, max_queue=0)
+    app.add_middleware(MetricsMiddleware)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = asyncio.create_task(client.get("/shed-test/1"))
+            await asyncio.sleep(0.01)
+            shed = await client.get("/shed-test/2")
+            release.set()
+            return (await first).status_code, shed.status_code
+
+    assert asyncio.run(scenario()) == (200, 503)
+    series = HTTP_REQUESTS_TOTAL.labels(method="GET", endpoint="/shed-test/{item_id}", status="503")
+    assert series._value.get() == 1
@@ -1,4 +1,7 @@
 import pytest
+import asyncio
+import time
+import httpx
 from fastapi.testclient import TestClient
 import sys
 import os
@@ -6,7 +9,10 @@ import os
 # Add parent directory to path to import the app
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
+import app as catalog_service
 from app import app
+from common.latency import FixedLatency, LognormalLatency, NoLatency, UniformLatency, parse_latency_model
+from common.observability import DEFAULT_DURATION_BUCKETS, MetricsMiddleware, get_metrics, parse_buckets
 
 client = TestClient(app)
 
@@ -25,16 +31,165 @@ def test_get_product_not_found():
     assert response.status_code == 404
     assert "Product not found" in response.json()["detail"]
 
+def test_get_product_matches_model_serialization():
+    """Test pre-rendered bytes are identical to serializing the Product model"""
+    response = client.get("/catalog/456")
+    assert response.headers["content-type"] == "application/json"
+    assert response.content == catalog_service.PRODUCTS["456"].model_dump_json().encode()
+
+def test_get_product_etag_not_modified():
+    """Test If-None-Match with the current ETag returns an empty 304"""
+    etag = client.get("/catalog/123").headers["etag"]
+    assert etag.startswith('"') and etag.endswith('"')
+
+    response = client.get("/catalog/123", headers={"If-None-Match": f'"stale", {etag}'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = client.get("/catalog/123", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+
+def test_list_products_etag_not_modified():
+    """Test list pages carry ETags and honor If-None-Match"""
+    etag = client.get("/catalog").headers["etag"]
+    response = client.get("/catalog", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert client.get("/catalog", params={"limit": 1}).headers["etag"] != etag
+
 def test_list_products():
     """Test listing all products"""
     response = client.get("/catalog")
     assert response.status_code == 200
-    products = response.json()
+    data = response.json()
+    products = data["items"]
     assert len(products) == 3
+    assert data["next_cursor"] is None
     assert any(p["id"] == "123" for p in products)
     assert any(p["id"] == "456" for p in products)
     assert any(p["id"] == "789" for p in products)
 
+def test_multi_get_products():
+    """Test fetching several products at once, reporting missing ids"""
+    response = client.get("/catalog", params={"ids": "789,123,999,123"})
+    assert response.status_code == 200
+    data = response.json()
+    assert [p["id"] for p in data["items"]] == ["789", "123"]
+    assert data["missing"] == ["999"]
+
+def test_multi_get_repeated_param():
+    """Test ids may also be given as repeated query parameters"""
+    response = client.get("/catalog?ids=123&ids=456")
+    assert [p["id"] for p in response.json()["items"]] == ["123", "456"]
+
+def test_multi_get_too_many_ids():
+    """Test the multi-get size limit"""
+    ids = ",".join(str(i) for i in range(1001))
+    response = client.get("/catalog", params={"ids": ids})
+    assert response.status_code == 422
+
+def test_list_products_filtered():
+    """Test category and price filters"""
+    response = client.get("/catalog", params={"category": "Electronics", "max_price": 250})
+    assert response.status_code == 200
+    assert [p["id"] for p in response.json()["items"]] == ["123"]
+
+def test_list_products_pagination():
+    """Test walking the listing with a cursor"""
+    first = client.get("/catalog", params={"limit": 2}).json()
+    assert len(first["items"]) == 2
+    assert first["next_cursor"]
+    second = client.get("/catalog", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [p["id"] for p in first["items"] + second["items"]] == ["123", "456", "789"]
+    assert second["next_cursor"] is None
+
+def test_list_products_invalid_cursor():
+    """Test malformed cursors are rejected"""
+    response = client.get("/catalog", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_parse_latency_model():
+    """Test latency model specs"""
+    assert isinstance(parse_latency_model("none"), NoLatency)
+    assert parse_latency_model("fixed:0.05").sample() == 0.05
+    uniform = parse_latency_model("uniform:0.02,0.06", seed=1)
+    assert isinstance(uniform, UniformLatency)
+    assert all(0.02 <= uniform.sample() <= 0.06 for _ in range(100))
+    lognormal = parse_latency_model("lognormal:0.04,0.5,0.2", seed=1)
+    assert isinstance(lognormal, LognormalLatency)
+    assert all(0 < lognormal.sample() <= 0.2 for _ in range(100))
+    with pytest.raises(ValueError):
+        parse_latency_model("uniform:0.02")
+
+def test_simulated_latency_does_not_block(monkeypatch):
+    """Test concurrent reads overlap instead of serializing on the event loop"""
+    monkeypatch.setattr(catalog_service, "read_latency", FixedLatency(0.1))
+
+    async def fetch_many():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://catalog") as async_client:
+            return await asyncio.gather(*(async_client.get("/catalog/123") for _ in range(50)))
+
+    start = time.perf_counter()
+    responses = asyncio.run(fetch_many())
+    elapsed = time.perf_counter() - start
+    assert all(r.status_code == 200 for r in responses)
+    # 50 sequential sleeps would take 5s
+    assert elapsed < 2.0
+
+def test_metrics_record_status_codes():
+    """Test the metrics middleware labels requests with their response status"""
+    client.get("/catalog/999")
+    response = client.get("/metrics")
+    assert 'http_requests_total{endpoint="/catalog/{product_id}",method="GET",status="404"}' in response.text
+
+def test_duration_buckets_resolve_storage_latency():
+    """Test the default buckets separate the 20-90ms storage latency range"""
+    response = client.get("/metrics")
+    assert 'http_request_duration_seconds_bucket{endpoint="/catalog/{product_id}",le="0.03",method="GET"}' in response.text
+    assert sum(1 for bound in DEFAULT_DURATION_BUCKETS if 0.02 <= bound <= 0.1) >= 6
+
+def test_parse_buckets():
+    """Test explicit, default and exponential bucket specs"""
+    assert parse_buckets("0.01, 0.05,0.1") == (0.01, 0.05, 0.1)
+    assert parse_buckets("default") == DEFAULT_DURATION_BUCKETS
+    assert parse_buckets("exponential:0.01,2,0.1") == (0.01, 0.02, 0.04, 0.08, 0.16)
+    high_resolution = parse_buckets("exponential")
+    assert high_resolution[0] == 0.001 and high_resolution[-1] >= 10.0
+    assert len(high_resolution) > 50
+    for spec in ("", "0.1,0.05", "-1,1", "exponential:1,1,2", "exponential:1,2", "fast"):
+        with pytest.raises(ValueError):
+            parse_buckets(spec)
+
+def test_metrics_exemplars_link_trace():
+    """Test traced requests attach their trace id as an OpenMetrics exemplar"""
+    from opentelemetry.sdk.trace import TracerProvider
+
+    async def endpoint(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    route = type("Route", (), {"path": "/exemplar/{item}"})()
+    scope = {"type": "http", "method": "GET", "path": "/exemplar/1", "route": route}
+    tracer = TracerProvider().get_tracer(__name__)
+    with tracer.start_as_current_span("request") as span:
+        asyncio.run(MetricsMiddleware(endpoint)(scope, receive, send))
+    trace_id = format(span.get_span_context().trace_id, "032x")
+
+    body = get_metrics("application/openmetrics-text").body.decode()
+    assert f'# {{trace_id="{trace_id}"}}' in body
+    assert "# EOF" in body
+    # The classic text format has no exemplars
+    assert trace_id not in get_metrics().body.decode()
+    assert trace_id not in client.get("/metrics").text
+    assert trace_id in client.get("/metrics", headers={"Accept": "application/openmetrics-text; version=1.0.0"}).text
+
 def test_healthz():
     """Test health check endpoint"""
     response = client.get("/healthz")
@@ -0,0 +1,131 @@
+import pytest
+import json
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+import sys
+import os
+
+# Add parent directory to path to import the app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import app as catalog_service
+from app import app
+from change_feed import ChangeFeed
+
+client = TestClient(app)
+
+PRODUCT = {"id": "feed-1", "name": "Desk Lamp", "description": "LED desk lamp", "price": 34.5, "category": "Home"}
+SEED_789 = catalog_service.PRODUCTS["789"].model_dump()
+
+@pytest.fixture
+def feed(monkeypatch):
+    """Fresh change feed, with products added by the test removed afterwards"""
+    fresh = ChangeFeed()
+    monkeypatch.setattr(catalog_service, "feed", fresh)
+    yield fresh
+    catalog_service.store.delete(PRODUCT["id"])
+
+def test_feed_versions_and_reset():
+    """Test changes are numbered, paged from any retained version, and older versions reset"""
+    feed = ChangeFeed(max_changes=3)
+    for i in range(5):
+        feed.publish("delete", str(i))
+    assert feed.is_current(2) and feed.is_current(5)
+    assert not feed.is_current(1)
+    assert not feed.is_current(6)
+    assert not feed.is_current(5, epoch="other")
+    assert [json.loads(change)["id"] for change in feed.changes_since(3)] == ["3", "4"]
+
+def test_admin_upsert_and_delete_publish_changes(feed):
+    """Test admin writes change the served product and appear in the feed in order"""
+    response = client.put(f"/admin/products/{PRODUCT['id']}", json=PRODUCT)
+    assert response.status_code == 201
+    assert response.json()["version"] == 1
+    assert client.get(f"/catalog/{PRODUCT['id']}").json() == PRODUCT
+
+    updated = {**PRODUCT, "price": 29.0}
+    assert client.put(f"/admin/products/{PRODUCT['id']}", json=updated).status_code == 200
+    assert client.get("/catalog", params={"category": "Home", "max_price": 30}).json()["items"] == [updated]
+    assert client.delete(f"/admin/products/{PRODUCT['id']}").json()["version"] == 3
+    assert client.get(f"/catalog/{PRODUCT['id']}").status_code == 404
+    assert client.delete(f"/admin/products/{PRODUCT['id']}").status_code == 404
+
+    data = client.get("/catalog/changes", params={"since": 0, "epoch": feed.epoch}).json()
+    assert data["epoch"] == feed.epoch
+    assert data["version"] == 3 and data["reset"] is False
+    assert [(c["version"], c["op"], c.get("product")) for c in data["changes"]] == [
+        (1, "upsert", PRODUCT), (2, "upsert", updated), (3, "delete", None),
+    ]
+    assert client.get("/catalog/changes").json()["changes"] == []
+    assert client.get("/catalog/changes", params={"since": 1, "epoch": "restarted"}).json()["reset"] is True
+
+def test_admin_upsert_rejects_mismatched_id(feed):
+    """Test the body id must match the path"""
+    response = client.put("/admin/products/other", json=PRODUCT)
+    assert response.status_code == 422
+    assert feed.version == 0
+
+def test_rejected_upsert_leaves_category_listing_working(feed):
+    """Test a product rejected for its price leaves no trace of its new category"""
+    response = client.put("/admin/products/zz", json={**PRODUCT, "id": "zz", "price": "NaN", "category": "brandnew"})
+    assert response.status_code == 422
+    assert feed.version == 0
+    response = client.get("/catalog", params={"category": "brandnew"})
+    assert response.status_code == 200
+    assert response.json() == {"items": [], "next_cursor": None}
+
+def test_changes_long_poll_wakes_on_publish(feed):
+    """Test a long-poll returns as soon as a change is published rather than at its timeout"""
+    async def poll_then_publish():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://catalog") as async_client:
+            poll = asyncio.ensure_future(async_client.get("/catalog/changes", params={"since": 0, "timeout": 5}))
+            await asyncio.sleep(0.05)
+            assert not poll.done()
+            await async_client.put(f"/admin/products/{PRODUCT['id']}", json=PRODUCT)
+            return await asyncio.wait_for(poll, 1.0)
+
+    response = asyncio.run(poll_then_publish())
+    assert [c["id"] for c in response.json()["changes"]] == [PRODUCT["id"]]
+
+def test_follower_copies_and_follows_the_writer(feed):
+    """Test a follower's store converges on the writer's, from a copy and then from the feed"""
+    from common.upstream import UpstreamClient
+    from change_feed import StoreFollower
+    from product_store import ProductStore
+
+    async def scenario():
+        upstream = UpstreamClient("writer_test", "http://writer", transport=httpx.ASGITransport(app=app))
+        replaced = []
+        follower = StoreFollower(upstream, ProductStore(), replaced.append, page_size=2, poll_timeout=0.05)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://writer") as writer:
+            await upstream.start()
+            await follower.start()
+            try:
+                while not follower.synced:
+                    await asyncio.sleep(0.01)
+                assert follower.store.get("123") == catalog_service.store.get("123")
+                assert replaced == [follower.store]
+
+                await writer.put(f"/admin/products/{PRODUCT['id']}", json=PRODUCT)
+                await writer.delete("/admin/products/789")
+                for _ in range(200):
+                    if follower.version == feed.version:
+                        break
+                    await asyncio.sleep(0.01)
+                assert follower.store.get(PRODUCT["id"]) == PRODUCT
+                assert follower.store.get("789") is None
+            finally:
+                await follower.stop()
+                await upstream.close()
+                await writer.put("/admin/products/789", json=SEED_789)
+
+    asyncio.run(scenario())
+
+def test_follower_refuses_changes(monkeypatch):
+    """Test admin writes and the feed are only served by the writer"""
+    monkeypatch.setattr(catalog_service, "feed", None)
+    assert client.put(f"/admin/products/{PRODUCT['id']}", json=PRODUCT).status_code == 403
+    assert client.delete("/admin/products/123").status_code == 403
+    assert client.get("/catalog/changes").status_code == 403
@@ -0,0 +1,102 @@
+import sys
+import json
+import queue
+import asyncio
+import logging
+import subprocess
+import os
+
+import pytest
+
+# Add the repository root to path to import the common module
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..', '..')
+sys.path.append(ROOT)
+
+from common.observability import LOG_RECORDS_DROPPED_TOTAL, MetricsMiddleware
+from common.structured_logging import AccessLogSampler, JsonFormatter, NonBlockingQueueHandler, parse_sample_rates
+
+def make_record(message, *args, **extra):
+    record = logging.LogRecord("catalog", logging.INFO, __file__, 1, message, args, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_json_formatter_escapes_and_includes_extra():
+    """Test messages with quotes stay valid JSON and extra fields are included"""
+    line = JsonFormatter().format(make_record('Product "%s" not found\n', 'a"b', status_code=404, trace_id=None))
+    entry = json.loads(line)
+    assert entry["message"] == 'Product "a"b" not found\n'
+    assert entry["level"] == "INFO"
+    assert entry["service"] == "catalog"
+    assert entry["status_code"] == 404
+    assert entry["trace_id"] is None
+    assert "args" not in entry and "msg" not in entry
+
+def test_json_formatter_includes_exception():
+    """Test exceptions are rendered into the record"""
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord("catalog", logging.ERROR, __file__, 1, "failed", None, sys.exc_info())
+    entry = json.loads(JsonFormatter().format(record))
+    assert "ValueError: boom" in entry["exception"]
+
+def test_queue_handler_drops_instead_of_blocking():
+    """Test a full queue drops records, counts them and leaves formatting to the listener"""
+    dropped = []
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1), on_drop=lambda: dropped.append(1))
+    handler.handle(make_record("first %s", "arg"))
+    handler.handle(make_record("second"))
+    assert len(dropped) == 1
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "first %s" and queued.args == ("arg",)
+
+def test_access_log_sampler():
+    """Test per-level sampling rates"""
+    sampler = AccessLogSampler({"INFO": 0.25, "WARNING": 0.0}, seed=1)
+    kept = sum(sampler.sample(logging.INFO) for _ in range(4000))
+    assert 800 < kept < 1200
+    assert not any(sampler.sample(logging.WARNING) for _ in range(100))
+    assert all(sampler.sample(logging.ERROR) for _ in range(100))
+
+def test_parse_sample_rates():
+    """Test sample rate specs are parsed, clamped and validated"""
+    assert parse_sample_rates("info=0.1, WARNING=2") == {"INFO": 0.1, "WARNING": 1.0}
+    assert parse_sample_rates("") == {}
+    for spec in ("INFO", "LOUD=0.5", "INFO=often"):
+        with pytest.raises(ValueError):
+            parse_sample_rates(spec)
+
+def test_access_log_sampled_out_is_counted(caplog):
+    """Test sampled-out access logs are not emitted but are counted"""
+    async def endpoint(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    sampled = LOG_RECORDS_DROPPED_TOTAL.labels(reason="sampled")
+    before = sampled._value.get()
+    middleware = MetricsMiddleware(endpoint, sampler=AccessLogSampler({"INFO": 0.0}))
+    scope = {"type": "http", "method": "GET", "path": "/sampled"}
+    with caplog.at_level(logging.INFO):
+        for _ in range(5):
+            asyncio.run(middleware(scope, receive, send))
+    assert sampled._value.get() - before == 5
+    assert not [r for r in caplog.records if r.getMessage() == "Request completed"]
+
+def test_logging_pipeline_writes_json_lines():
+    """Test a service process writes one JSON object per line and flushes at exit"""
+    script = (
+        "import sys, logging; sys.path.insert(0, sys.argv[1]);"
+        "import common.observability;"
+        "log = logging.getLogger('catalog');"
+        "[log.info('item \"%s\" %d', 'quoted', i) for i in range(500)]"
+    )
+    result = subprocess.run([sys.executable, "-c", script, ROOT], capture_output=True, text=True, check=True)
+    entries = [json.loads(line) for line in result.stdout.splitlines()]
+    messages = [entry["message"] for entry in entries if entry["service"] == "catalog"]
+    assert messages == [f'item "quoted" {i}' for i in range(500)]
@@ -0,0 +1,127 @@
+import os
+import sys
+import subprocess
+
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# Add the repository root to path to import the common module
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..', '..')
+sys.path.append(ROOT)
+
+from common.multiprocess_metrics import archive_dead_process, prepare_multiproc_dir, process_files
+
+# Records metrics the way a gunicorn worker would and prints its pid
+WORKER = """
+import os, sys
+sys.path.insert(0, sys.argv[1])
+from common.observability import CACHE_ENTRIES, HTTP_REQUESTS_TOTAL, HTTP_REQUEST_DURATION_SECONDS, set_gauge_function, refresh_function_gauges
+count = int(sys.argv[2])
+HTTP_REQUESTS_TOTAL.labels(method="GET", endpoint="/catalog/{product_id}", status="200").inc(count)
+for _ in range(count):
+    HTTP_REQUEST_DURATION_SECONDS.labels(method="GET", endpoint="/catalog/{product_id}").observe(0.2)
+set_gauge_function(CACHE_ENTRIES.labels(cache="catalog"), lambda: count)
+refresh_function_gauges()
+print(os.getpid())
+"""
+
+def run_worker(path, count):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(path))
+    result = subprocess.run(
+        [sys.executable, "-c", WORKER, ROOT, str(count)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return int(result.stdout.strip())
+
+def scrape(path):
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry, path=str(path))
+    samples = {}
+    for line in generate_latest(registry).decode().splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+REQUESTS = 'http_requests_total{endpoint="/catalog/{product_id}",method="GET",status="200"}'
+DURATION_COUNT = 'http_request_duration_seconds_count{endpoint="/catalog/{product_id}",method="GET"}'
+DURATION_BUCKET = 'http_request_duration_seconds_bucket{endpoint="/catalog/{product_id}",le="0.2",method="GET"}'
+CACHE = 'cache_entries{cache="catalog"}'
+
+def test_metrics_aggregate_across_workers(tmp_path):
+    """Test counters, histograms and function gauges are summed over worker files"""
+    prepare_multiproc_dir(str(tmp_path))
+    run_worker(tmp_path, 3)
+    run_worker(tmp_path, 4)
+
+    samples = scrape(tmp_path)
+    assert samples[REQUESTS] == 7
+    assert samples[DURATION_COUNT] == 7
+    assert samples[DURATION_BUCKET] == 7
+    assert samples[CACHE] == 7
+
+def test_dead_worker_is_archived(tmp_path):
+    """Test a dead worker's counters survive in the archive and its gauges are dropped"""
+    prepare_multiproc_dir(str(tmp_path))
+    pids = [run_worker(tmp_path, count) for count in (1, 2, 3)]
+
+    archive_dead_process(pids[0], str(tmp_path))
+    archive_dead_process(pids[1], str(tmp_path))
+
+    samples = scrape(tmp_path)
+    assert samples[REQUESTS] == 6
+    assert samples[DURATION_COUNT] == 6
+    assert samples[DURATION_BUCKET] == 6
+    assert samples[CACHE] == 3
+
+    files = process_files(str(tmp_path))
+    assert "counter_archive.db" in files
+    assert "histogram_archive.db" in files
+    assert not any(str(pid) in name for pid in pids[:2] for name in files)
+
+def test_prepare_multiproc_dir_removes_stale_files(tmp_path):
+    """Test files from a previous run are removed at startup"""
+    run_worker(tmp_path, 5)
+    assert process_files(str(tmp_path))
+    prepare_multiproc_dir(str(tmp_path))
+    assert process_files(str(tmp_path)) == []
+    assert scrape(tmp_path) == {}
+
+# Serves one traced request and scrapes in OpenMetrics format, as a worker answering Prometheus would
+TRACED_WORKER = """
+import sys, asyncio
+sys.path.insert(0, sys.argv[1])
+from opentelemetry.sdk.trace import TracerProvider
+from common.observability import MetricsMiddleware, get_metrics
+
+async def endpoint(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+async def ignore(*args):
+    return {"type": "http.request", "body": b""}
+
+route = type("Route", (), {"path": "/exemplar/{item}"})()
+scope = {"type": "http", "method": "GET", "path": "/exemplar/1", "route": route}
+with TracerProvider().get_tracer(__name__).start_as_current_span("request") as span:
+    asyncio.run(MetricsMiddleware(endpoint)(scope, ignore, ignore))
+print("TRACE", format(span.get_span_context().trace_id, "032x"))
+print(get_metrics("application/openmetrics-text").body.decode())
+"""
+
+def test_exemplars_are_exposed_in_multiprocess_mode(tmp_path):
+    """Test the scraping worker attaches its trace exemplars to buckets aggregated over every worker"""
+    prepare_multiproc_dir(str(tmp_path))
+    run_worker(tmp_path, 3)
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    result = subprocess.run(
+        [sys.executable, "-c", TRACED_WORKER, ROOT],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    body = result.stdout.partition("TRACE ")[2]
+    trace_id, body = body.split("\n", 1)
+
+    exemplars = [line for line in body.splitlines() if f'# {{trace_id="{trace_id}"}}' in line]
+    assert len(exemplars) == 1
+    assert exemplars[0].startswith('http_request_duration_seconds_bucket{endpoint="/exemplar/{item}"')
+    assert f"{DURATION_BUCKET} 3.0" in body
@@ -0,0 +1,102 @@
+import pytest
+import json
+import sys
+import os
+
+# Add parent directory to path to import the app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from product_store import ProductStore, load_product_store, synthetic_products
+
+def make_store(count=1000):
+    return load_product_store(synthetic_products(count))
+
+def walk(store, **filters):
+    """Collect every page of a query"""
+    items, cursor = store.query(limit=37, **filters)
+    while cursor:
+        page, cursor = store.query(limit=37, cursor=cursor, **filters)
+        items.extend(page)
+    return items
+
+def test_get_product():
+    """Test lookups by id"""
+    store = make_store(10)
+    assert store.get("3")["id"] == "3"
+    assert store.get("missing") is None
+    assert len(store) == 10
+
+def test_pagination_covers_everything_once():
+    """Test an unfiltered walk returns every product exactly once in load order"""
+    store = make_store()
+    items = walk(store)
+    assert [p["id"] for p in items] == [str(i) for i in range(1000)]
+
+def test_category_and_price_filters_match_full_scan():
+    """Test indexed queries agree with a brute-force filter"""
+    store = make_store()
+    all_products = list(synthetic_products(1000))
+    expected = sorted(
+        (p for p in all_products if p["category"] == "Books" and 50 <= p["price"] <= 200),
+        key=lambda p: (p["price"], int(p["id"])),
+    )
+    items = walk(store, category="Books", min_price=50, max_price=200)
+    assert [p["id"] for p in items] == [p["id"] for p in expected]
+
+def test_price_order_with_ties():
+    """Test cursors stay correct across products with equal prices"""
+    store = ProductStore()
+    for i in range(10):
+        store.add({"id": str(i), "name": "n", "price": 5.0 if i % 2 else 1.0, "category": "c"})
+    store.build_indexes()
+    items = walk(store, min_price=0)
+    assert [p["id"] for p in items] == ["0", "2", "4", "6", "8", "1", "3", "5", "7", "9"]
+
+def test_unknown_category_is_empty():
+    """Test filtering by a category that does not exist"""
+    store = make_store(10)
+    assert store.query(category="Nope") == ([], None)
+
+def test_cursor_kind_mismatch():
+    """Test a load-order cursor is rejected for a price query"""
+    store = make_store(10)
+    _, cursor = store.query(limit=2)
+    with pytest.raises(ValueError):
+        store.query(min_price=0, cursor=cursor)
+
+def test_load_from_jsonl_and_csv(tmp_path):
+    """Test loading products from files, skipping malformed rows"""
+    jsonl = tmp_path / "products.jsonl"
+    jsonl.write_text("\n".join([
+        json.dumps({"id": "a", "name": "A", "description": "", "price": 1.5, "category": "x"}),
+        json.dumps({"id": "b", "name": "B", "price": "oops", "category": "x"}),
+    ]))
+    csv_file = tmp_path / "products.csv"
+    csv_file.write_text("id,name,description,price,category\nc,C,desc,2.5,y\n")
+
+    store = load_product_store(data_file=str(jsonl))
+    assert store.get("a")["price"] == 1.5
+    assert store.get("b") is None
+    store = load_product_store(data_file=str(csv_file))
+    assert store.get("c")["category"] == "y"
+
+def test_upsert_and_delete_keep_indexes_current():
+    """Test in-place changes give the same pages as a store rebuilt from scratch"""
+    store = make_store(200)
+    store.upsert({"id": "7", "name": "Moved", "price": 0.5, "category": "Books"})
+    store.upsert({"id": "new", "name": "New", "price": 42.0, "category": "Brand new"})
+    assert store.delete("3") and not store.delete("3")
+    with pytest.raises(ValueError):
+        store.upsert({"id": "8", "name": "Bad", "price": "free", "category": "Books"})
+
+    expected = ProductStore()
+    for product in store.query(limit=1000)[0]:
+        expected.add(product)
+    expected.build_indexes()
+    for filters in ({}, {"category": "Books"}, {"min_price": 0}, {"category": "Books", "max_price": 100}):
+        assert walk(store, **filters) == walk(expected, **filters)
+    assert store.get("3") is None
+    assert store.get("7")["category"] == "Books"
+    assert [p["id"] for p in walk(store, category="Brand new")] == ["new"]
+    assert len(store) == 200
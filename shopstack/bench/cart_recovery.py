@@ -0,0 +1,123 @@
+"""Cart log write cost and startup recovery time for millions of mutations
+
+Writes `--mutations` cart mutations over `--carts` users through a
+WriteBehindCartBackend, flushing a group commit every `--batch` mutations
+as the background task would, then measures how long a restarting cart
+service takes to rebuild its store:
+
+- log:      no snapshot, every mutation replayed from the log
+- snapshot: a snapshot taken after `--snapshot-at` of the mutations, with
+            only the remainder replayed
+
+Also reports the request-path cost of add_items with and without the log.
+
+Usage: python bench/cart_recovery.py [--mutations N] [--carts N] [--batch N] [--snapshot-at F]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'apps', 'cart'))
+
+from cart_log import CartLog
+from cart_store import MemoryCartBackend, WriteBehindCartBackend
+
+
+def open_store(directory: str, carts: int, fsync: bool) -> WriteBehindCartBackend:
+    memory = MemoryCartBackend(max_carts=carts * 2, idle_ttl=float("inf"))
+    return WriteBehindCartBackend(memory, CartLog(directory, fsync=fsync))
+
+
+def write(directory: str, args, snapshot_after: int = None) -> float:
+    """Write the mutation stream; returns seconds spent flushing"""
+    rng = random.Random(42)
+    store = open_store(directory, args.carts, args.fsync)
+    flushing = 0.0
+    for i in range(args.mutations):
+        user_id = f"user_{rng.randrange(args.carts)}"
+        if rng.random() < 0.05:
+            store.clear(f"cart_{user_id}")
+        else:
+            store.add_items(user_id, [(str(rng.randrange(10000)), rng.randint(1, 3))])
+        if (i + 1) % args.batch == 0:
+            started = time.perf_counter()
+            store.log.flush()
+            flushing += time.perf_counter() - started
+        if snapshot_after is not None and i + 1 == snapshot_after:
+            store.log.snapshot(*store._cut())
+    store.log.flush()
+    store.close()
+    return flushing
+
+
+def recover(directory: str, args):
+    """Returns (seconds to rebuild the store, carts recovered)"""
+    started = time.perf_counter()
+    store = open_store(directory, args.carts, args.fsync)
+    elapsed = time.perf_counter() - started
+    carts = len(store)
+    store.close()
+    return elapsed, carts
+
+
+def request_path_cost(args) -> dict:
+    """Microseconds per add_items for the plain memory store and with the log"""
+    results = {}
+    directory = tempfile.mkdtemp(prefix="cart-log-bench-")
+    try:
+        stores = {
+            "memory": MemoryCartBackend(max_carts=args.carts * 2),
+            "log": open_store(directory, args.carts, args.fsync),
+        }
+        for name, store in stores.items():
+            started = time.perf_counter()
+            for i in range(100000):
+                store.add_items(f"user_{i % args.carts}", [("123", 1)])
+            results[name] = (time.perf_counter() - started) / 100000 * 1e6
+        stores["log"].close()
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def size_of(directory: str) -> float:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mutations", type=int, default=2000000)
+    parser.add_argument("--carts", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=1000, help="mutations per group commit")
+    parser.add_argument("--snapshot-at", type=float, default=0.9)
+    parser.add_argument("--no-fsync", dest="fsync", action="store_false")
+    args = parser.parse_args()
+    # Measure persistence, not log output
+    logging.disable(logging.WARNING)
+
+    cost = request_path_cost(args)
+    print(f"add_items: memory {cost['memory']:.1f}us, with write-behind log {cost['log']:.1f}us")
+
+    print(f"{'mode':<10}{'flush s':>10}{'MB on disk':>12}{'recovery s':>12}{'mutations/s':>14}{'carts':>10}")
+    for mode in ("log", "snapshot"):
+        directory = tempfile.mkdtemp(prefix="cart-log-bench-")
+        try:
+            snapshot_after = int(args.mutations * args.snapshot_at) if mode == "snapshot" else None
+            flushing = write(directory, args, snapshot_after)
+            elapsed, carts = recover(directory, args)
+            print(
+                f"{mode:<10}{flushing:>10.2f}{size_of(directory):>12.1f}{elapsed:>12.2f}"
+                f"{args.mutations / elapsed:>14,.0f}{carts:>10}"
+            )
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
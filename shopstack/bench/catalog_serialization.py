@@ -0,0 +1,95 @@
+"""Per-request CPU cost of serving catalog products: Pydantic models vs pre-rendered bytes
+
+Calls two minimal FastAPI apps directly over ASGI (no network, no simulated
+latency) and reports CPU time per request for:
+
+- model:       handler returns a Pydantic Product, FastAPI validates and re-encodes it
+- prerendered: handler returns the catalog store's pre-rendered bytes and ETag
+
+Usage: python bench/catalog_serialization.py [--requests N] [--page-size N]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+
+from fastapi import FastAPI, Response
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'apps', 'catalog'))
+
+from pydantic import BaseModel
+from product_store import load_product_store, synthetic_products
+from asgi import call
+
+
+class Product(BaseModel):
+    id: str
+    name: str
+    description: str
+    price: float
+    category: str
+
+
+def build_apps(page_size: int):
+    store = load_product_store(synthetic_products(10000))
+    models = {product_id: Product(**store.get(product_id)) for product_id in store.ids}
+    page_ids = store.ids[:page_size]
+
+    model_app = FastAPI()
+
+    @model_app.get("/catalog/{product_id}")
+    async def model_product(product_id: str):
+        return models[product_id]
+
+    @model_app.get("/catalog")
+    async def model_list():
+        return {"items": [models[product_id] for product_id in page_ids], "next_cursor": None}
+
+    prerendered_app = FastAPI()
+
+    @prerendered_app.get("/catalog/{product_id}")
+    async def prerendered_product(product_id: str):
+        body, etag = store.get_rendered(product_id)
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+    @prerendered_app.get("/catalog")
+    async def prerendered_list():
+        body = store.query_page(limit=page_size)
+        return Response(content=body, media_type="application/json")
+
+    return {"model": model_app, "prerendered": prerendered_app}
+
+
+async def measure(app: FastAPI, path: str, requests: int) -> float:
+    """Return CPU microseconds per request"""
+    for _ in range(100):
+        await call(app, path)
+    start = time.process_time()
+    for _ in range(requests):
+        await call(app, path)
+    return (time.process_time() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    apps = build_apps(args.page_size)
+    print(f"{'path':<16}{'mode':<14}{'cpu us/req':>12}")
+    for path in ("/catalog/123", "/catalog"):
+        results = {}
+        for mode, app in apps.items():
+            results[mode] = asyncio.run(measure(app, path, args.requests))
+            print(f"{path:<16}{mode:<14}{results[mode]:>12.1f}")
+        saving = 1 - results["prerendered"] / results["model"]
+        print(f"{path:<16}{'reduction':<14}{saving:>11.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Compare two benchmark result files written by bench/suite.py
+
+Runs are matched by request rate and endpoints by name. A latency
+percentile regresses when it grows by more than `--threshold` (relative)
+and by more than `--min-delta-ms`, so sub-millisecond jitter on fast
+endpoints is not flagged. Throughput regresses when it drops by more than
+the threshold, and errors when the error rate rises by more than
+`--max-error-increase`. p999 is reported but never flagged: a 20s run has
+too few samples in the tail for it to be stable.
+
+Exits 1 if anything regressed.
+
+Usage: python bench/compare.py BASELINE CURRENT [--threshold 0.25] [--min-delta-ms 2]
+"""
+import sys
+import json
+import argparse
+
+FLAGGED_PERCENTILES = ("p50", "p95", "p99")
+
+
+def error_rate(stats: dict) -> float:
+    return stats["errors"] / stats["requests"] if stats["requests"] else 0.0
+
+
+def compare(
+    baseline: dict,
+    current: dict,
+    threshold: float = 0.25,
+    min_delta_ms: float = 2.0,
+    max_error_increase: float = 0.01,
+):
+    """Regressions of `current` against `baseline` as (rate, endpoint, metric, before, after)"""
+    regressions = []
+    baseline_runs = {run["rate"]: run for run in baseline["runs"]}
+    for run in current["runs"]:
+        before_run = baseline_runs.get(run["rate"])
+        if before_run is None:
+            continue
+        for endpoint, after in run["endpoints"].items():
+            before = before_run["endpoints"].get(endpoint)
+            if before is None:
+                continue
+            for name in FLAGGED_PERCENTILES:
+                if name not in before or name not in after:
+                    continue
+                if after[name] > before[name] * (1 + threshold) and after[name] - before[name] > min_delta_ms:
+                    regressions.append((run["rate"], endpoint, name, before[name], after[name]))
+            if after["throughput"] < before["throughput"] * (1 - threshold):
+                regressions.append((run["rate"], endpoint, "throughput", before["throughput"], after["throughput"]))
+            if error_rate(after) - error_rate(before) > max_error_increase:
+                regressions.append((run["rate"], endpoint, "error_rate", error_rate(before), error_rate(after)))
+    return regressions
+
+
+def print_comparison(baseline: dict, current: dict, regressions):
+    print(f"\nBaseline {baseline['meta']['commit']} vs current {current['meta']['commit']}")
+    baseline_runs = {run["rate"]: run for run in baseline["runs"]}
+    print(f"{'rate':>6} {'endpoint':<28} {'p50 ms':^17} {'p99 ms':^17} {'p999 ms':^17} {'req/s':^17}")
+    for run in current["runs"]:
+        before_run = baseline_runs.get(run["rate"], {"endpoints": {}})
+        for endpoint, after in run["endpoints"].items():
+            before = before_run["endpoints"].get(endpoint, {})
+            cells = " ".join(
+                f"{before.get(name, 0.0):8.2f} {after.get(name, 0.0):<8.2f}"
+                for name in ("p50", "p99", "p999", "throughput")
+            )
+            print(f"{run['rate']:>6g} {endpoint:<28} {cells}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        for rate, endpoint, metric, before, after in regressions:
+            print(f"  {rate:g}/s {endpoint} {metric}: {before:.3f} -> {after:.3f}")
+    else:
+        print("\nNo regressions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--min-delta-ms", type=float, default=2.0)
+    parser.add_argument("--max-error-increase", type=float, default=0.01)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold, args.min_delta_ms, args.max_error_increase)
+    print_comparison(baseline, current, regressions)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Gateway cost of forwarding large catalog listings: decode/re-encode vs streaming passthrough
+
+Runs a stand-in catalog app serving a large pre-rendered listing and two
+in-process gateways that reach it over httpx's ASGI transport:
+
+- decode:      response.json() and return the dict, so FastAPI re-encodes it
+- passthrough: the generic proxy route, forwarding raw bytes and headers
+
+Reports mean wall-clock latency and peak Python memory allocated per request.
+
+Usage: python bench/gateway_proxy.py [--items N] [--requests N]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tracemalloc
+
+import httpx
+from fastapi import FastAPI, Response
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from asgi import call
+from common.proxy import ProxyRoute, add_proxy_routes
+from common.upstream import UpstreamClient
+
+
+def build_catalog(items: int) -> FastAPI:
+    page = json.dumps({
+        "items": [
+            {"id": str(i), "name": f"Product {i}", "description": "x" * 120, "price": i * 1.25, "category": "Bench"}
+            for i in range(items)
+        ],
+        "next_cursor": None,
+    }, separators=(",", ":")).encode()
+    catalog = FastAPI()
+
+    @catalog.get("/catalog")
+    async def list_products():
+        return Response(content=page, media_type="application/json")
+
+    return catalog
+
+
+def build_gateways(catalog: FastAPI):
+    upstream = UpstreamClient("bench_catalog", "http://catalog", transport=httpx.ASGITransport(app=catalog))
+
+    decode = FastAPI()
+
+    @decode.get("/catalog")
+    async def decode_list():
+        response = await upstream.get("/catalog")
+        response.raise_for_status()
+        return response.json()
+
+    passthrough = FastAPI()
+    add_proxy_routes(passthrough, [ProxyRoute("GET", "/catalog", upstream)])
+    return upstream, {"decode": decode, "passthrough": passthrough}
+
+
+async def measure(app: FastAPI, requests: int):
+    """Return (mean latency in ms, peak traced memory in KiB) per request"""
+    for _ in range(5):
+        await call(app, "/catalog")
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(app, "/catalog")
+    latency = (time.perf_counter() - start) / requests * 1e3
+
+    tracemalloc.start()
+    await call(app, "/catalog")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latency, peak / 1024
+
+
+async def run(items: int, requests: int):
+    upstream, gateways = build_gateways(build_catalog(items))
+    await upstream.start()
+    try:
+        print(f"{items} items per listing")
+        print(f"{'mode':<14}{'latency ms':>12}{'peak KiB':>12}")
+        for mode, app in gateways.items():
+            latency, peak = await measure(app, requests)
+            print(f"{mode:<14}{latency:>12.2f}{peak:>12.0f}")
+    finally:
+        await upstream.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.items, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Client-side load balancing across several local catalog replicas
+
+Starts `--replicas` catalog instances under uvicorn on consecutive ports,
+the last one with a slower simulated read latency, and sends `--requests`
+product lookups with `--concurrency` in flight through an UpstreamClient for
+each balancing policy. With `--kill`, one fast replica is stopped halfway
+through each run to show health-check ejection and retries onto the others.
+
+Reports per-replica request share and p50/p99 latency per policy.
+
+Usage: python bench/load_balancing.py [--replicas N] [--requests N] [--concurrency N] [--kill]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import subprocess
+from collections import Counter
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.append(ROOT)
+
+from common.balancer import POLICIES
+from common.upstream import UpstreamClient, UpstreamConfig
+
+
+def start_replicas(count: int, base_port: int, slow_latency: str):
+    """Start catalog replicas; returns (processes, urls)"""
+    processes, urls = [], []
+    for i in range(count):
+        port = base_port + i
+        env = dict(os.environ, CATALOG_READ_LATENCY="fixed:0.01" if i < count - 1 else slow_latency)
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.join(ROOT, "apps", "catalog"),
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ))
+        urls.append(f"http://127.0.0.1:{port}")
+    for url in urls:
+        for _ in range(100):
+            try:
+                if httpx.get(f"{url}/healthz").status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        else:
+            raise RuntimeError(f"Replica {url} did not start")
+    return processes, urls
+
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def run(urls, policy: str, requests: int, concurrency: int, kill=None):
+    config = UpstreamConfig(balancer=policy, health_check_interval=0.2, retry_budget_ratio=1.0)
+    upstream = UpstreamClient("bench_catalog", ",".join(urls), config)
+    await upstream.start()
+    served, latencies, errors = Counter(), [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in remaining:
+            if kill is not None and i == requests // 2:
+                kill.terminate()
+            start = time.perf_counter()
+            try:
+                response = await upstream.get("/catalog/123")
+                served[f"{response.url.host}:{response.url.port}"] += 1
+            except httpx.RequestError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        await upstream.close()
+    return served, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--base-port", type=int, default=18001)
+    parser.add_argument("--slow-latency", default="fixed:0.1")
+    parser.add_argument("--kill", action="store_true", help="stop one fast replica halfway through each run")
+    args = parser.parse_args()
+    # Measure balancing, not log output
+    logging.disable(logging.WARNING)
+
+    for policy in POLICIES:
+        processes, urls = start_replicas(args.replicas, args.base_port, args.slow_latency)
+        try:
+            kill = processes[0] if args.kill else None
+            served, latencies, errors = asyncio.run(run(urls, policy, args.requests, args.concurrency, kill))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+        share = "  ".join(f"{url.split(':')[-1]}={served[url.split('//')[1]] / args.requests:.0%}" for url in urls)
+        print(
+            f"{policy:<18} p50={percentile(latencies, 0.5) * 1e3:6.1f}ms p99={percentile(latencies, 0.99) * 1e3:6.1f}ms "
+            f"errors={errors:<4} {share}"
+        )
+
+
+if __name__ == "__main__":
+    main()
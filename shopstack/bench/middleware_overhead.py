@@ -0,0 +1,96 @@
+"""Per-request overhead of the metrics middleware: BaseHTTPMiddleware vs pure ASGI
+
+Calls a trivial FastAPI route directly over ASGI and reports CPU time per
+request for:
+
+- none:     no middleware (baseline)
+- basehttp: the previous BaseHTTPMiddleware implementation (kept here for comparison)
+- asgi:     the current pure ASGI MetricsMiddleware from common/observability.py
+
+Usage: python bench/middleware_overhead.py [--requests N]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+
+from fastapi import FastAPI, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from asgi import call
+from common.observability import HTTP_REQUESTS_TOTAL, HTTP_REQUEST_DURATION_SECONDS, MetricsMiddleware
+
+logger = logging.getLogger("bench")
+
+
+class BaseHTTPMetricsMiddleware(BaseHTTPMiddleware):
+    """The metrics middleware as it was before moving to pure ASGI"""
+
+    async def dispatch(self, request: Request, call_next):
+        start_time = time.time()
+        trace_id = None
+        span_id = None
+        try:
+            from opentelemetry import trace
+            current_span = trace.get_current_span()
+            if current_span:
+                trace_id = current_span.get_span_context().trace_id
+                span_id = current_span.get_span_context().span_id
+        except ImportError:
+            pass
+        logger.info("Request started", extra={"method": request.method, "url": str(request.url), "trace_id": trace_id, "span_id": span_id})
+        response = await call_next(request)
+        duration = time.time() - start_time
+        endpoint = request.url.path
+        HTTP_REQUESTS_TOTAL.labels(method=request.method, endpoint=endpoint, status=response.status_code).inc()
+        HTTP_REQUEST_DURATION_SECONDS.labels(method=request.method, endpoint=endpoint).observe(duration)
+        logger.info("Request completed", extra={"method": request.method, "url": str(request.url), "status_code": response.status_code, "duration": duration, "trace_id": trace_id, "span_id": span_id})
+        return response
+
+
+def build_app(middleware=None) -> FastAPI:
+    app = FastAPI()
+    if middleware is not None:
+        app.add_middleware(middleware)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def measure(app: FastAPI, requests: int) -> float:
+    """Return CPU microseconds per request"""
+    for _ in range(200):
+        await call(app, "/ping")
+    start = time.process_time()
+    for _ in range(requests):
+        await call(app, "/ping")
+    return (time.process_time() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    # Measure the middleware itself, not log output
+    logging.disable(logging.INFO)
+
+    apps = {
+        "none": build_app(),
+        "basehttp": build_app(BaseHTTPMetricsMiddleware),
+        "asgi": build_app(MetricsMiddleware),
+    }
+    results = {mode: asyncio.run(measure(app, args.requests)) for mode, app in apps.items()}
+    print(f"{'middleware':<12}{'cpu us/req':>12}{'overhead us':>14}")
+    for mode, cpu in results.items():
+        print(f"{mode:<12}{cpu:>12.1f}{cpu - results['none']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""End-to-end benchmark suite for catalog, cart and gateway
+
+Starts the three services locally under uvicorn on `--base-port` and up,
+then drives the gateway with an open-loop load generator at each rate in
+`--rates`. Arrivals are Poisson and the request mix is drawn from a seeded
+RNG, so every run sends the same requests at the same offsets. Latency is
+measured from each request's scheduled send time rather than the moment it
+went out, so a stalled service cannot hide its queueing delay by slowing
+the generator down.
+
+Writes throughput, error counts and p50/p95/p99/p999 latency per endpoint
+and rate to `--output` as JSON. With `--baseline`, the results are compared
+against a stored run (see bench/compare.py) and the script exits non-zero
+on a regression.
+
+Usage: python bench/suite.py [--rates 50,100,200] [--duration S] [--seed N]
+                             [--output PATH] [--baseline PATH]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import platform
+import argparse
+import subprocess
+from collections import Counter, defaultdict
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.append(ROOT)
+
+from compare import compare, print_comparison
+
+SERVICES = ("catalog", "cart", "api_gateway")
+PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99, "p999": 0.999}
+
+
+def start_services(base_port: int, products: int, seed: int):
+    """Start catalog, cart and gateway on consecutive ports; returns (processes, gateway url)"""
+    urls = {name: f"http://127.0.0.1:{base_port + i}" for i, name in enumerate(SERVICES)}
+    env = dict(
+        os.environ,
+        CATALOG_SYNTHETIC_PRODUCTS=str(products),
+        CATALOG_SERVICE_URL=urls["catalog"],
+        CART_SERVICE_URL=urls["cart"],
+        # Injected cart failures would show up as noise between runs
+        CART_FAILURE_RATE="0",
+        STORAGE_LATENCY_SEED=str(seed),
+    )
+    processes = []
+    try:
+        for i, name in enumerate(SERVICES):
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app:app", "--port", str(base_port + i), "--log-level", "warning"],
+                cwd=os.path.join(ROOT, "apps", name),
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            ))
+        for name, url in urls.items():
+            for _ in range(100):
+                try:
+                    if httpx.get(f"{url}/healthz").status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.1)
+            else:
+                raise RuntimeError(f"Service {name} at {url} did not start")
+    except BaseException:
+        stop_services(processes)
+        raise
+    return processes, urls["api_gateway"]
+
+
+def stop_services(processes):
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+class Workload:
+    """Seeded request mix against the gateway
+
+    Each draw returns (endpoint, method, path, json body). Cart reads only
+    target users an earlier draw has already added items for, so the
+    sequence stays the same regardless of how the services respond.
+    """
+
+    MIX = (
+        ("GET /catalog/{product_id}", 60),
+        ("GET /catalog?ids", 10),
+        ("POST /cart/add", 15),
+        ("GET /cart/{cart_id}", 10),
+        ("GET /cart/{cart_id}/view", 5),
+    )
+
+    def __init__(self, rng: random.Random, products: int, users: int):
+        self.rng = rng
+        self.products = products
+        self.users = users
+        self.carts = []
+        self.endpoints = [name for name, _ in self.MIX]
+        self.weights = [weight for _, weight in self.MIX]
+
+    def product_id(self) -> str:
+        return str(self.rng.randrange(self.products))
+
+    def draw(self):
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        if endpoint.startswith("GET /cart") and not self.carts:
+            endpoint = "POST /cart/add"
+
+        if endpoint == "GET /catalog/{product_id}":
+            return endpoint, "GET", f"/catalog/{self.product_id()}", None
+        if endpoint == "GET /catalog?ids":
+            ids = ",".join(self.product_id() for _ in range(10))
+            return endpoint, "GET", f"/catalog?ids={ids}", None
+        if endpoint == "POST /cart/add":
+            user_id = f"bench_{self.rng.randrange(self.users)}"
+            self.carts.append(f"cart_{user_id}")
+            body = {"product_id": self.product_id(), "quantity": self.rng.randint(1, 3), "user_id": user_id}
+            return endpoint, "POST", "/cart/add", body
+        cart_id = self.rng.choice(self.carts)
+        suffix = "/view" if endpoint.endswith("/view") else ""
+        return endpoint, "GET", f"/cart/{cart_id}{suffix}", None
+
+
+def schedule(seed: int, rate: float, duration: float, products: int, users: int):
+    """Poisson arrivals at `rate` per second for `duration` seconds: [(offset, request)]"""
+    rng = random.Random(f"{seed}:{rate}")
+    workload = Workload(rng, products, users)
+    plan, offset = [], rng.expovariate(rate)
+    while offset < duration:
+        plan.append((offset, workload.draw()))
+        offset += rng.expovariate(rate)
+    return plan
+
+
+def percentile(ordered, p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def summarize(latencies, errors: int, statuses: Counter, window: float) -> dict:
+    """Throughput, errors and latency percentiles (ms) for one endpoint"""
+    ordered = sorted(latencies)
+    summary = {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round((len(latencies) - errors) / window, 2),
+        "statuses": dict(sorted((str(status), count) for status, count in statuses.items())),
+    }
+    if ordered:
+        for name, p in PERCENTILES.items():
+            summary[name] = round(percentile(ordered, p) * 1e3, 3)
+        summary["max"] = round(ordered[-1] * 1e3, 3)
+    return summary
+
+
+async def run_rate(url: str, plan, warmup: float, timeout: float) -> dict:
+    """Send `plan` open-loop and summarize requests scheduled after `warmup`"""
+    latencies = defaultdict(list)
+    errors = Counter()
+    statuses = defaultdict(Counter)
+    lag = finished = 0.0
+
+    async def send(client, intended, endpoint, method, path, body):
+        nonlocal finished
+        try:
+            response = await client.request(method, path, json=body)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        if intended - start < warmup:
+            return
+        finished = time.perf_counter()
+        latencies[endpoint].append(finished - intended)
+        statuses[endpoint][status] += 1
+        if not isinstance(status, int) or status >= 500:
+            errors[endpoint] += 1
+
+    limits = httpx.Limits(max_connections=1000, max_keepalive_connections=1000)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        tasks = []
+        start = time.perf_counter()
+        for offset, (endpoint, method, path, body) in plan:
+            intended = start + offset
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                lag = max(lag, -delay)
+            tasks.append(asyncio.create_task(send(client, intended, endpoint, method, path, body)))
+        await asyncio.gather(*tasks)
+
+    # Throughput over the time it took to complete the measured requests, so
+    # a saturated service reports what it served rather than the offered rate
+    window = max(finished - start - warmup, 1e-9)
+    endpoints = {
+        endpoint: summarize(latencies[endpoint], errors[endpoint], statuses[endpoint], window)
+        for endpoint in sorted(latencies)
+    }
+    total = Counter()
+    for endpoint in latencies:
+        total.update(statuses[endpoint])
+    endpoints["all"] = summarize(
+        [latency for values in latencies.values() for latency in values], sum(errors.values()), total, window
+    )
+    return {"endpoints": endpoints, "max_send_lag_ms": round(lag * 1e3, 3)}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results: dict):
+    header = " ".join(f"{name + ' ms':>8}" for name in PERCENTILES)
+    print(f"{'rate':>6} {'endpoint':<28} {'req/s':>8} {'errors':>7} {header}")
+    for run in results["runs"]:
+        for endpoint, stats in run["endpoints"].items():
+            latency = " ".join(f"{stats.get(name, 0.0):8.2f}" for name in PERCENTILES)
+            print(f"{run['rate']:>6g} {endpoint:<28} {stats['throughput']:>8.1f} {stats['errors']:>7} {latency}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rates", default="50,100,200", help="comma-separated request rates per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load per rate")
+    parser.add_argument("--warmup", type=float, default=3.0, help="leading seconds excluded from the results")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--products", type=int, default=1000, help="synthetic catalog size")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--base-port", type=int, default=18101)
+    parser.add_argument("--output", default=os.path.join(ROOT, "bench", "results", "latest.json"))
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative latency/throughput change to flag")
+    args = parser.parse_args()
+    # Measure the services, not the generator's log output
+    logging.disable(logging.WARNING)
+
+    rates = [float(rate) for rate in args.rates.split(",")]
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "products": args.products,
+            "users": args.users,
+        },
+        "runs": [],
+    }
+
+    for rate in rates:
+        plan = schedule(args.seed, rate, args.duration, args.products, args.users)
+        # Fresh services per rate so cache and cart state do not carry over
+        processes, url = start_services(args.base_port, args.products, args.seed)
+        try:
+            run = asyncio.run(run_rate(url, plan, args.warmup, args.timeout))
+        finally:
+            stop_services(processes)
+        results["runs"].append({"rate": rate, "scheduled": len(plan), **run})
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+    print_results(results)
+    print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, threshold=args.threshold)
+        print_comparison(baseline, results, regressions)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Per-request overhead of server spans at different sampling ratios
+
+Calls a trivial FastAPI route directly over ASGI, behind the metrics
+middleware, and reports CPU time per request for:
+
+- none:      no tracing middleware (baseline)
+- noop:      TracingMiddleware without a tracer provider (OTEL not configured)
+- ratio=R:   tracer provider with ParentBased(TraceIdRatioBased(R)) and a
+             bounded BatchSpanProcessor feeding an exporter that discards spans
+
+Usage: python bench/tracing_overhead.py [--requests N] [--ratios 0,0.1,1]
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+
+from fastapi import FastAPI
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from asgi import call
+from common.observability import MetricsMiddleware
+from common.tracing import TracingMiddleware, batch_settings_from_env
+
+
+class DiscardExporter(SpanExporter):
+    """Counts spans instead of sending them, so only in-process cost is measured"""
+
+    def __init__(self):
+        self.exported = 0
+
+    def export(self, spans):
+        self.exported += len(spans)
+        return SpanExportResult.SUCCESS
+
+
+def build_app(tracer=None, traced: bool = True) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    if traced:
+        app.add_middleware(TracingMiddleware, tracer=tracer)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def measure(app: FastAPI, requests: int) -> float:
+    """Return CPU microseconds per request"""
+    for _ in range(200):
+        await call(app, "/ping")
+    start = time.process_time()
+    for _ in range(requests):
+        await call(app, "/ping")
+    return (time.process_time() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--ratios", default="0,0.1,1")
+    args = parser.parse_args()
+    # Measure tracing, not log output
+    logging.disable(logging.INFO)
+
+    apps = {
+        "none": build_app(traced=False),
+        "noop": build_app(trace.NoOpTracer()),
+    }
+    providers = []
+    for ratio in (float(r) for r in args.ratios.split(",")):
+        provider = TracerProvider(sampler=ParentBased(TraceIdRatioBased(ratio)))
+        provider.add_span_processor(BatchSpanProcessor(DiscardExporter(), **batch_settings_from_env()))
+        providers.append(provider)
+        apps[f"ratio={ratio:g}"] = build_app(provider.get_tracer("bench"))
+
+    results = {mode: asyncio.run(measure(app, args.requests)) for mode, app in apps.items()}
+    for provider in providers:
+        provider.shutdown()
+    print(f"{'tracing':<12}{'cpu us/req':>12}{'overhead us':>14}")
+    for mode, cpu in results.items():
+        print(f"{mode:<12}{cpu:>12.1f}{cpu - results['none']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
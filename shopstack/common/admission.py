@@ -0,0 +1,141 @@
+# Admission control: cap in-flight requests per worker and shed the excess
+import os
+import json
+import asyncio
+from collections import deque
+from typing import Iterable, Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from common.observability import ADMISSION_QUEUE_DEPTH, ADMISSION_REQUESTS_IN_FLIGHT, ADMISSION_SHED_TOTAL
+
+# Probes and scrapes bypass admission so an overloaded worker still reports itself
+EXEMPT_PATHS = ("/healthz", "/livez", "/metrics")
+
+
+class Overloaded(Exception):
+    """A request could not be admitted; `reason` is `queue_full` or `timeout`"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionController:
+    """Concurrency cap with a bounded FIFO wait queue
+
+    Up to `max_in_flight` requests run at once. Further requests wait in a
+    queue of at most `max_queue` for up to `queue_timeout` seconds, and a
+    finishing request hands its slot straight to the oldest waiter. Slots
+    and waiters are exported as gauges.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiters: deque = deque()
+
+    async def acquire(self):
+        """Take a slot, waiting briefly if none is free; raises Overloaded if shed"""
+        if self.in_flight < self.max_in_flight and not self.waiters:
+            self.in_flight += 1
+            ADMISSION_REQUESTS_IN_FLIGHT.inc()
+            return
+        if len(self.waiters) >= self.max_queue:
+            raise Overloaded("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        ADMISSION_QUEUE_DEPTH.inc()
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # Client went away while queued; pass on a slot it was just handed
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+                self.waiters.remove(waiter)
+            raise
+        finally:
+            ADMISSION_QUEUE_DEPTH.dec()
+        if not waiter.done():
+            waiter.cancel()
+            self.waiters.remove(waiter)
+            raise Overloaded("timeout")
+
+    def release(self):
+        """Free a slot, handing it to the oldest waiter if there is one"""
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+        ADMISSION_REQUESTS_IN_FLIGHT.dec()
+
+
+class AdmissionControlMiddleware:
+    """Pure ASGI middleware applying an AdmissionController to HTTP requests
+
+    Shed requests get 503 with `Retry-After`. Paths in `exempt_paths`
+    (health checks and metrics) are never queued or shed. Limits apply per
+    worker process; a `max_in_flight` of 0 disables admission control.
+    Add it before the observability middleware so shed requests are still
+    measured.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_in_flight: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+        retry_after: Optional[int] = None,
+        exempt_paths: Iterable[str] = EXEMPT_PATHS,
+    ):
+        self.app = app
+        self.controller = AdmissionController(
+            max_in_flight if max_in_flight is not None else int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "200")),
+            max_queue if max_queue is not None else int(os.getenv("ADMISSION_MAX_QUEUE", "100")),
+            queue_timeout if queue_timeout is not None else float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "0.1")),
+        )
+        self.retry_after = retry_after if retry_after is not None else int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+        self.exempt_paths = frozenset(exempt_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or self.controller.max_in_flight <= 0
+            or scope["path"] in self.exempt_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire()
+        except Overloaded as e:
+            # Counted here; the access log records the 503 itself
+            ADMISSION_SHED_TOTAL.labels(reason=e.reason).inc()
+            await self.shed(send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
+
+    async def shed(self, send: Send):
+        body = json.dumps({"detail": "Service overloaded, retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
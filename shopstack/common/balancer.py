@@ -0,0 +1,148 @@
+# Client-side load balancing across the replicas of one upstream service
+import zlib
+import socket
+import random
+import asyncio
+import logging
+from typing import Callable, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from common.resilience import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("p2c", "least_outstanding")
+
+
+def parse_urls(value: str) -> List[str]:
+    """Split a comma-separated URL list, dropping blanks and trailing slashes"""
+    return [url.strip().rstrip("/") for url in value.split(",") if url.strip()]
+
+
+class Endpoint:
+    """One replica of an upstream, with the load, health and circuit breaker the balancer picks by"""
+
+    def __init__(self, url: str, breaker: CircuitBreaker):
+        self.url = url
+        self.breaker = breaker
+        self.outstanding = 0
+        self.healthy = True
+
+    def __repr__(self) -> str:
+        state = "healthy" if self.healthy else "ejected"
+        return f"Endpoint({self.url!r}, outstanding={self.outstanding}, {state})"
+
+
+class LoadBalancer:
+    """Pick an endpoint per request by outstanding requests
+
+    `p2c` compares two random healthy endpoints and takes the less loaded
+    (power of two choices); `least_outstanding` scans them all. Endpoints
+    that fail their health check are ejected until they pass again. If every
+    endpoint is ejected, all are used rather than failing every request.
+    Endpoints whose circuit breaker is open are never picked.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        urls: Iterable[str],
+        policy: str = "p2c",
+        breaker: Optional[Callable[[], CircuitBreaker]] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown balancing policy {policy!r}; expected one of {', '.join(POLICIES)}")
+        self.name = name
+        self.urls = list(urls)
+        if not self.urls:
+            raise ValueError(f"No endpoints configured for {name}")
+        self.policy = policy
+        self.new_breaker = breaker or (lambda: CircuitBreaker(name))
+        self.rng = rng or random.Random()
+        self.endpoints = [Endpoint(url, self.new_breaker()) for url in self.urls]
+        self._resolved = {url: [url] for url in self.urls}
+
+    def counts(self) -> dict:
+        """Return the number of healthy and ejected endpoints"""
+        healthy = sum(1 for endpoint in self.endpoints if endpoint.healthy)
+        return {"healthy": healthy, "ejected": len(self.endpoints) - healthy}
+
+    def pick(self, exclude: Optional[Endpoint] = None) -> Optional[Endpoint]:
+        """Choose an endpoint, avoiding `exclude` (e.g. the one a retry just failed on) when possible
+
+        Returns None when every endpoint's circuit breaker is open.
+        """
+        candidates = self._candidates()
+        if not candidates:
+            return None
+        if exclude is not None and len(candidates) > 1:
+            candidates = [endpoint for endpoint in candidates if endpoint is not exclude] or candidates
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.policy == "p2c":
+            first, second = self.rng.sample(candidates, 2)
+            return first if first.outstanding <= second.outstanding else second
+        least = min(endpoint.outstanding for endpoint in candidates)
+        return self.rng.choice([endpoint for endpoint in candidates if endpoint.outstanding == least])
+
+    def pick_for_key(self, key: str) -> Optional[Endpoint]:
+        """Choose the endpoint `key` hashes to, so requests with the same key reach the same replica
+
+        Uses rendezvous hashing: while the endpoint set is stable a key always
+        maps to one endpoint, and an endpoint leaving only moves its own keys.
+        Returns None when every endpoint's circuit breaker is open.
+        """
+        candidates = self._candidates()
+        if not candidates:
+            return None
+        return max(candidates, key=lambda endpoint: zlib.crc32(f"{endpoint.url}\0{key}".encode()))
+
+    def _candidates(self) -> List[Endpoint]:
+        """Endpoints whose breaker admits requests, healthy ones only unless none are"""
+        available = [endpoint for endpoint in self.endpoints if endpoint.breaker.available()]
+        return [endpoint for endpoint in available if endpoint.healthy] or available
+
+    def set_endpoints(self, urls: Iterable[str]):
+        """Replace the endpoint set, keeping the state of endpoints that remain"""
+        current = {endpoint.url: endpoint for endpoint in self.endpoints}
+        endpoints = [current.get(url) or Endpoint(url, self.new_breaker()) for url in dict.fromkeys(urls)]
+        if not endpoints:
+            return
+        added = [endpoint.url for endpoint in endpoints if endpoint.url not in current]
+        removed = set(current) - {endpoint.url for endpoint in endpoints}
+        if added or removed:
+            logger.info(f"Upstream {self.name} endpoints changed: +{added} -{sorted(removed)}")
+        self.endpoints = endpoints
+
+    async def resolve(self):
+        """Re-resolve each configured URL's host and balance over every address it returns
+
+        Meant for headless Services, where the DNS name lists pod IPs. A
+        failed lookup keeps the previous endpoints for that URL.
+        """
+        loop = asyncio.get_running_loop()
+        for url in self.urls:
+            parts = urlsplit(url)
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            try:
+                infos = await loop.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+            except OSError as e:
+                logger.warning(f"Failed to resolve {parts.hostname} for upstream {self.name}: {e}")
+                continue
+            resolved = []
+            for family, _, _, _, sockaddr in infos:
+                host = f"[{sockaddr[0]}]" if family == socket.AF_INET6 else sockaddr[0]
+                resolved.append(f"{parts.scheme}://{host}:{port}{parts.path}")
+            self._resolved[url] = resolved or self._resolved[url]
+        self.set_endpoints(url for urls in self._resolved.values() for url in urls)
+
+    def mark(self, endpoint: Endpoint, healthy: bool) -> bool:
+        """Record a health check result; returns True if the endpoint was just ejected"""
+        ejected = endpoint.healthy and not healthy
+        if ejected:
+            logger.warning(f"Ejecting {endpoint.url} from upstream {self.name}: health check failed")
+        elif healthy and not endpoint.healthy:
+            logger.info(f"Readmitting {endpoint.url} to upstream {self.name}")
+        endpoint.healthy = healthy
+        return ejected
@@ -0,0 +1,133 @@
+# In-process read-through response cache
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+
+from common.observability import CACHE_ENTRIES, CACHE_EVICTIONS_TOTAL, CACHE_REQUESTS_TOTAL, set_gauge_function
+
+logger = logging.getLogger(__name__)
+
+# Cached value: (status_code, payload)
+CachedResponse = Tuple[int, Any]
+
+
+class ResponseCache:
+    """Bounded TTL + LRU cache of upstream responses with single-flight loading
+
+    Successful (200) responses are kept for `ttl` seconds and 404s for
+    `negative_ttl` seconds; any other status is returned but not cached.
+    Concurrent misses for the same key share one upstream call.
+    """
+
+    def __init__(self, name: str, max_entries: int = 10000, ttl: float = 30.0, negative_ttl: float = 5.0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, CachedResponse]]" = OrderedDict()
+        self._inflight: dict = {}
+
+        self._hits = CACHE_REQUESTS_TOTAL.labels(cache=name, result="hit")
+        self._misses = CACHE_REQUESTS_TOTAL.labels(cache=name, result="miss")
+        self._coalesced = CACHE_REQUESTS_TOTAL.labels(cache=name, result="coalesced")
+        self._capacity_evictions = CACHE_EVICTIONS_TOTAL.labels(cache=name, reason="capacity")
+        self._expired_evictions = CACHE_EVICTIONS_TOTAL.labels(cache=name, reason="expired")
+        set_gauge_function(CACHE_ENTRIES.labels(cache=name), lambda: len(self._entries))
+
+    @classmethod
+    def from_env(cls, name: str) -> "ResponseCache":
+        """Build a cache from `<NAME>_CACHE_MAX_ENTRIES`, `_TTL` and `_NEGATIVE_TTL`"""
+        prefix = name.upper()
+        return cls(
+            name,
+            max_entries=int(os.getenv(f"{prefix}_CACHE_MAX_ENTRIES", "10000")),
+            ttl=float(os.getenv(f"{prefix}_CACHE_TTL", "30.0")),
+            negative_ttl=float(os.getenv(f"{prefix}_CACHE_NEGATIVE_TTL", "5.0")),
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        """Return the cached response for key, or None if absent or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self._expired_evictions.inc()
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: CachedResponse):
+        """Store a response if its status is cacheable"""
+        status_code = value[0]
+        if status_code == 200:
+            ttl = self.ttl
+        elif status_code == 404:
+            ttl = self.negative_ttl
+        else:
+            return
+        if ttl <= 0:
+            return
+
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._capacity_evictions.inc()
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[CachedResponse]]) -> CachedResponse:
+        """Return the cached response for key, loading it at most once concurrently
+
+        If the request doing the load is cancelled, waiting requests are not:
+        they retry, and one of them becomes the new loader.
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                self._hits.inc()
+                return value
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            self._coalesced.inc()
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Re-raise only if this request itself is being cancelled
+                if not inflight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        self._misses.inc()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark as retrieved so an error with no waiters is not logged twice
+            future.exception()
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
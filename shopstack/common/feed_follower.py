@@ -0,0 +1,130 @@
+# Copy of the catalog kept current from the catalog writer's change feed
+import time
+import asyncio
+import logging
+from typing import List, Optional
+
+import httpx
+
+from common.upstream import UpstreamClient
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogFollower:
+    """Copies every product from the catalog writer, then follows its `/catalog/changes` feed
+
+    A background task copies the catalog page by page, then long-polls the
+    feed. Subclasses receive the copy in `replace()` and each upsert or
+    delete in `apply()`. A feed reset (changes no longer retained, or a
+    restarted writer) or a failed call starts a new copy. `upstream` must
+    point at the writer alone: versions and epochs belong to the one process
+    that publishes them, so a copy and the feed it is followed from have to
+    come from that process.
+    """
+
+    def __init__(
+        self,
+        upstream: UpstreamClient,
+        page_size: int = 1000,
+        poll_timeout: float = 25.0,
+        retry_interval: float = 1.0,
+    ):
+        self.upstream = upstream
+        self.page_size = page_size
+        self.poll_timeout = poll_timeout
+        self.retry_interval = retry_interval
+        self.epoch: Optional[str] = None
+        self.version: Optional[int] = None
+        self.synced = False
+        self.last_contact = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def staleness(self) -> float:
+        """Seconds since the feed was last heard from; infinite before the first copy"""
+        if not self.synced:
+            return float("inf")
+        return time.monotonic() - self.last_contact
+
+    def replace(self, products: List[dict], reason: str):
+        """Take a complete copy of the catalog; `reason` is `startup`, `reset` or `error`"""
+        raise NotImplementedError
+
+    def apply(self, change: dict):
+        """Apply one feed entry: `{"version", "op", "id"}` plus `product` for an upsert"""
+        raise NotImplementedError
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        """Copy the catalog and follow its feed, copying again after a reset or failure"""
+        reason = "startup"
+        while True:
+            endpoint = self.upstream.balancer.pick()
+            if endpoint is None:
+                await asyncio.sleep(self.retry_interval)
+                continue
+            try:
+                await self.sync(endpoint.url, reason)
+                await self.follow(endpoint.url)
+                reason = "reset"
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                logger.warning(f"Lost the catalog change feed at {endpoint.url}: {e!r}")
+                reason = "error"
+                await asyncio.sleep(self.retry_interval)
+
+    async def _get(self, url: str, params: dict, timeout: float) -> dict:
+        response = await self.upstream.client.get(url, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    async def sync(self, base_url: str, reason: str):
+        """Copy every product, starting from the feed version current before the first page
+
+        Changes made while the pages are read are applied again by `follow`;
+        upserts and deletes are idempotent, so the copy converges.
+        """
+        timeout = self.upstream.config.read_timeout
+        head = await self._get(f"{base_url}/catalog/changes", {}, timeout)
+        products: List[dict] = []
+        params = {"limit": self.page_size}
+        while True:
+            page = await self._get(f"{base_url}/catalog", params, timeout)
+            products.extend(page["items"])
+            if not page["next_cursor"]:
+                break
+            params["cursor"] = page["next_cursor"]
+
+        self.replace(products, reason)
+        self.epoch, self.version = head["epoch"], head["version"]
+        self.synced = True
+        self.last_contact = time.monotonic()
+        logger.info(f"Copied {len(products)} products from the catalog writer at version {self.version} ({reason})")
+
+    async def follow(self, base_url: str):
+        """Long-poll the change feed and apply changes until it asks for a reset"""
+        timeout = self.upstream.config.read_timeout + self.poll_timeout
+        while True:
+            data = await self._get(
+                f"{base_url}/catalog/changes",
+                {"since": self.version, "epoch": self.epoch, "timeout": self.poll_timeout},
+                timeout,
+            )
+            self.last_contact = time.monotonic()
+            if data["reset"] or data["epoch"] != self.epoch:
+                logger.info(f"Catalog change feed reset at version {self.version}; copying the catalog again")
+                return
+            for change in data["changes"]:
+                self.apply(change)
+            self.version = data["version"]
@@ -0,0 +1,47 @@
+# Gunicorn server hooks shared by all services (gunicorn -c common/gunicorn_conf.py)
+import os
+import sys
+
+# Make `common` importable when gunicorn loads this file by path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+
+def single_process_storage():
+    """Storage that one process must own, or None
+
+    The cart log locks its directory, and the catalog writer's store and
+    change feed live in its memory.
+    """
+    if os.getenv("CART_BACKEND", "").lower() == "log":
+        return "CART_BACKEND=log"
+    if os.getenv("CATALOG_ROLE", "").lower() == "writer":
+        return "CATALOG_ROLE=writer"
+    return None
+
+
+def nworkers_changed(server, new_value, old_value):
+    """Run a single worker when storage is single-process, whatever --workers or TTIN asked for
+
+    Called whenever the worker count is set: at startup, on reload and on TTIN/TTOU.
+    """
+    storage = single_process_storage()
+    if storage and new_value > 1:
+        server.log.warning(f"{storage} allows one process; running 1 worker instead of {new_value}")
+        server.num_workers = 1
+
+
+def on_starting(server):
+    """Start every run with an empty metrics directory so old counters are not re-exported"""
+    if MULTIPROC_DIR:
+        from common.multiprocess_metrics import prepare_multiproc_dir
+        prepare_multiproc_dir(MULTIPROC_DIR)
+        server.log.info(f"Prometheus multiprocess metrics in {MULTIPROC_DIR}")
+
+
+def child_exit(server, worker):
+    """Remove the dead worker's gauges and merge its counters into the archive"""
+    if MULTIPROC_DIR:
+        from common.multiprocess_metrics import archive_dead_process
+        archive_dead_process(worker.pid, MULTIPROC_DIR)
@@ -0,0 +1,393 @@
+# Idempotency-Key deduplication of non-idempotent requests
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common.observability import IDEMPOTENCY_KEYS, IDEMPOTENCY_REQUESTS_TOTAL, set_gauge_function
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAYED_HEADER = "idempotent-replayed"
+MAX_KEY_LENGTH = 255
+
+# Recorded response: (status, headers, body)
+StoredResponse = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+
+
+class IdempotencyTable:
+    """Bounded TTL + LRU table of responses by idempotency key, with single-flight execution
+
+    Each key remembers a fingerprint of the request that first used it and
+    the response it produced, for `ttl` seconds and up to `max_keys` keys.
+    Responses with a 5xx status are not kept, so a retry after a failure
+    runs again. While a key is in flight, duplicates wait for its response
+    instead of running the handler a second time. Keys are held in this
+    process only.
+    """
+
+    def __init__(self, max_keys: int = 100000, ttl: float = 3600.0):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str, StoredResponse]]" = OrderedDict()
+        self._inflight: dict = {}
+        set_gauge_function(IDEMPOTENCY_KEYS, self.__len__)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[str, StoredResponse]]:
+        """Return (fingerprint, response) stored for key, or None if absent or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, fingerprint, response = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return fingerprint, response
+
+    def set(self, key: str, fingerprint: str, response: StoredResponse):
+        if response[0] >= 500 or self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, fingerprint, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+
+    def begin(self, key: str, fingerprint: str) -> Optional[asyncio.Future]:
+        """Claim key for a new execution; returns the future its duplicates wait on
+
+        Returns None if the key was claimed elsewhere in the meantime.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, future)
+        return future
+
+    def inflight(self, key: str):
+        """(fingerprint, future) of the execution running for key, or None
+
+        The future resolves to the response, or is cancelled if the
+        execution ends without one.
+        """
+        return self._inflight.get(key)
+
+    def release(self, key: str):
+        """Give up the claim on key after an execution that stored nothing"""
+
+    def finish(self, key: str, future: asyncio.Future, fingerprint: str, response: Optional[StoredResponse]):
+        """Store the response and release the waiters; None means the execution did not complete"""
+        self._inflight.pop(key, None)
+        if response is None:
+            self.release(key)
+            future.cancel()
+            return
+        self.set(key, fingerprint, response)
+        future.set_result(response)
+
+
+class SQLiteIdempotencyTable(IdempotencyTable):
+    """IdempotencyTable kept in a SQLite file, so every process using the file shares the keys
+
+    Meant to sit next to the data it protects, such as the cart SQLite
+    file, so a retry reaching another worker is still recognised. An
+    execution claims its key with a row that has no response yet. Duplicates
+    in other processes poll that row every `poll_interval` seconds until the
+    response is stored, and run the request themselves if the claim is
+    released. A claim older than `lease` seconds is taken to belong to a
+    worker that died and may be claimed again. Expired keys, and the oldest
+    keys beyond `max_keys`, are swept at most once per `sweep_interval`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_keys: int = 100000,
+        ttl: float = 3600.0,
+        lease: float = 30.0,
+        poll_interval: float = 0.01,
+        sweep_interval: float = 60.0,
+    ):
+        super().__init__(max_keys, ttl)
+        self.path = path
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        self._waiters: dict = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS idempotency (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idempotency_expires_at ON idempotency (expires_at);
+        """)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM idempotency WHERE status IS NOT NULL AND expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+
+    @staticmethod
+    def _decode(status: int, headers: str, body: bytes) -> StoredResponse:
+        return status, [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(headers)], body
+
+    def get(self, key: str) -> Optional[Tuple[str, StoredResponse]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fingerprint, status, headers, body FROM idempotency "
+                "WHERE key = ? AND status IS NOT NULL AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], self._decode(*row[1:])
+
+    def set(self, key: str, fingerprint: str, response: StoredResponse):
+        if response[0] >= 500 or self.ttl <= 0:
+            self.release(key)
+            return
+        status, headers, body = response
+        encoded = json.dumps([(name.decode("latin-1"), value.decode("latin-1")) for name, value in headers])
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO idempotency (key, fingerprint, status, headers, body, expires_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET fingerprint = excluded.fingerprint, status = excluded.status, "
+                "headers = excluded.headers, body = excluded.body, expires_at = excluded.expires_at",
+                (key, fingerprint, status, encoded, body, now + self.ttl),
+            )
+            self._sweep(now)
+
+    def _sweep(self, now: float):
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        self._db.execute("DELETE FROM idempotency WHERE expires_at <= ?", (now,))
+        self._db.execute(
+            "DELETE FROM idempotency WHERE key IN (SELECT key FROM idempotency WHERE status IS NOT NULL "
+            "ORDER BY expires_at LIMIT max(0, (SELECT COUNT(*) FROM idempotency) - ?))",
+            (self.max_keys,),
+        )
+
+    def begin(self, key: str, fingerprint: str) -> Optional[asyncio.Future]:
+        now = time.time()
+        with self._lock:
+            claimed = self._db.execute(
+                "INSERT INTO idempotency (key, fingerprint, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET fingerprint = excluded.fingerprint, status = NULL, "
+                "headers = NULL, body = NULL, expires_at = excluded.expires_at WHERE idempotency.expires_at <= ?",
+                (key, fingerprint, now + self.lease, now),
+            ).rowcount
+        if not claimed:
+            return None
+        return super().begin(key, fingerprint)
+
+    def inflight(self, key: str):
+        local = super().inflight(key)
+        if local is not None:
+            return local
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fingerprint FROM idempotency WHERE key = ? AND status IS NULL AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        waiter = self._waiters.get(key)
+        if waiter is None:
+            waiter = self._waiters[key] = asyncio.ensure_future(self._wait(key))
+        return row[0], waiter
+
+    async def _wait(self, key: str) -> StoredResponse:
+        """Poll a claim held by another process until its response is stored"""
+        try:
+            while True:
+                await asyncio.sleep(self.poll_interval)
+                with self._lock:
+                    row = self._db.execute(
+                        "SELECT status, headers, body, expires_at FROM idempotency WHERE key = ?", (key,)
+                    ).fetchone()
+                if row is not None and row[0] is not None:
+                    return self._decode(*row[:3])
+                if row is None or row[3] <= time.time():
+                    # Released or abandoned: end cancelled, like a local execution without a response
+                    raise asyncio.CancelledError
+        finally:
+            del self._waiters[key]
+
+    def release(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM idempotency WHERE key = ? AND status IS NULL", (key,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def idempotency_table_from_env(sqlite_path: Optional[str] = None) -> IdempotencyTable:
+    """Build a table bounded by `IDEMPOTENCY_MAX_KEYS` and `IDEMPOTENCY_TTL`, in `sqlite_path` if given"""
+    max_keys = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000"))
+    ttl = float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+    if sqlite_path is not None:
+        return SQLiteIdempotencyTable(sqlite_path, max_keys, ttl)
+    return IdempotencyTable(max_keys, ttl)
+
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware replaying responses for requests with an `Idempotency-Key` header
+
+    Applies to `methods` (POST by default). The first request with a key
+    runs normally and its response is recorded; a later request with the
+    same key, method, path and body gets the recorded response back with
+    `Idempotent-Replayed: true`, and one arriving while the first is still
+    running waits for it. Reusing a key for a different request is
+    rejected with 422. Keys are held in `table`, by default a table in
+    this worker process only.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_keys: Optional[int] = None,
+        ttl: Optional[float] = None,
+        methods: Iterable[str] = ("POST",),
+        table: Optional[IdempotencyTable] = None,
+    ):
+        self.app = app
+        if table is None:
+            table = IdempotencyTable(
+                max_keys if max_keys is not None else int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000")),
+                ttl if ttl is not None else float(os.getenv("IDEMPOTENCY_TTL", "3600")),
+            )
+        self.table = table
+        self.methods = frozenset(methods)
+        self._new = IDEMPOTENCY_REQUESTS_TOTAL.labels(result="new")
+        self._replayed = IDEMPOTENCY_REQUESTS_TOTAL.labels(result="replayed")
+        self._coalesced = IDEMPOTENCY_REQUESTS_TOTAL.labels(result="coalesced")
+        self._mismatched = IDEMPOTENCY_REQUESTS_TOTAL.labels(result="mismatch")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        key = None
+        if scope["type"] == "http" and scope["method"] in self.methods:
+            for name, value in scope["headers"]:
+                if name == IDEMPOTENCY_HEADER.encode():
+                    key = value.decode("latin-1")
+                    break
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await self.respond(send, 400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+            return
+
+        body, more_body = b"", True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        fingerprint = hashlib.sha256(
+            b"\0".join((scope["method"].encode(), scope["path"].encode(), scope["query_string"], body))
+        ).hexdigest()
+
+        while True:
+            stored = self.table.get(key)
+            existing = stored or self.table.inflight(key)
+            if existing is None:
+                future = self.table.begin(key, fingerprint)
+                if future is not None:
+                    break
+                # Claimed by another process since the lookup; wait for it instead
+                continue
+            if existing[0] != fingerprint:
+                self._mismatched.inc()
+                await self.respond(send, 422, "Idempotency-Key was already used for a different request")
+                return
+            if stored is not None:
+                self._replayed.inc()
+                await self.replay(send, stored[1])
+                return
+
+            self._coalesced.inc()
+            future = existing[1]
+            try:
+                response = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    # The first request ended without a response; run this one instead
+                    continue
+                raise
+            await self.replay(send, response)
+            return
+
+        self._new.inc()
+        await self.execute(scope, body, receive, send, key, fingerprint, future)
+
+    async def execute(
+        self, scope: Scope, body: bytes, receive: Receive, send: Send, key: str, fingerprint: str, future: asyncio.Future
+    ):
+        """Run the request with its buffered body under the claim `future`, recording the response it sends"""
+        status, headers, chunks = None, [], []
+        received = False
+
+        async def replay_receive() -> Message:
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def recording_send(message: Message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status, headers = message["status"], list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        response = None
+        try:
+            await self.app(scope, replay_receive, recording_send)
+            if status is not None:
+                response = (status, headers, b"".join(chunks))
+        finally:
+            self.table.finish(key, future, fingerprint, response)
+
+    async def replay(self, send: Send, response: StoredResponse):
+        status, headers, body = response
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": headers + [(REPLAYED_HEADER.encode(), b"true")],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def respond(self, send: Send, status: int, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
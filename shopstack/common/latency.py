@@ -0,0 +1,128 @@
+# Simulated storage latency models shared by the services
+import os
+import math
+import random
+import asyncio
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyModel:
+    """Base class for simulated storage latency
+
+    Subclasses implement `sample()`; `wait()` awaits the sampled delay so the
+    event loop keeps serving other requests while this one is "in the database".
+    """
+
+    name = "base"
+
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+
+    def sample(self) -> float:
+        raise NotImplementedError
+
+    async def wait(self) -> float:
+        """Sleep for one sampled latency without blocking the event loop"""
+        latency = self.sample()
+        if latency > 0:
+            await asyncio.sleep(latency)
+        return latency
+
+    def describe(self) -> str:
+        return self.name
+
+
+class NoLatency(LatencyModel):
+    """No simulated latency"""
+
+    name = "none"
+
+    def sample(self) -> float:
+        return 0.0
+
+
+class FixedLatency(LatencyModel):
+    """Constant latency in seconds"""
+
+    name = "fixed"
+
+    def __init__(self, seconds: float, seed: Optional[int] = None):
+        super().__init__(seed)
+        self.seconds = seconds
+
+    def sample(self) -> float:
+        return self.seconds
+
+    def describe(self) -> str:
+        return f"fixed:{self.seconds}"
+
+
+class UniformLatency(LatencyModel):
+    """Latency drawn uniformly between low and high seconds"""
+
+    name = "uniform"
+
+    def __init__(self, low: float, high: float, seed: Optional[int] = None):
+        super().__init__(seed)
+        self.low = low
+        self.high = high
+
+    def sample(self) -> float:
+        return self.rng.uniform(self.low, self.high)
+
+    def describe(self) -> str:
+        return f"uniform:{self.low},{self.high}"
+
+
+class LognormalLatency(LatencyModel):
+    """Long-tailed latency with the given median and shape, capped at `cap` seconds"""
+
+    name = "lognormal"
+
+    def __init__(self, median: float, sigma: float = 0.5, cap: float = 5.0, seed: Optional[int] = None):
+        super().__init__(seed)
+        self.median = median
+        self.sigma = sigma
+        self.cap = cap
+
+    def sample(self) -> float:
+        return min(self.rng.lognormvariate(math.log(self.median), self.sigma), self.cap)
+
+    def describe(self) -> str:
+        return f"lognormal:{self.median},{self.sigma},{self.cap}"
+
+
+def parse_latency_model(spec: str, seed: Optional[int] = None) -> LatencyModel:
+    """Build a model from a spec such as `uniform:0.02,0.06`, `lognormal:0.04,0.5`, `fixed:0.05` or `none`"""
+    kind, _, args = spec.strip().partition(":")
+    params = [float(arg) for arg in args.split(",") if arg.strip()]
+    kind = kind.lower()
+
+    if kind in ("none", "off", "0"):
+        return NoLatency(seed)
+    if kind == "fixed" and len(params) == 1:
+        return FixedLatency(params[0], seed=seed)
+    if kind == "uniform" and len(params) == 2:
+        return UniformLatency(params[0], params[1], seed=seed)
+    if kind == "lognormal" and 1 <= len(params) <= 3:
+        return LognormalLatency(*params, seed=seed)
+    raise ValueError(f"Invalid latency model spec: {spec!r}")
+
+
+def latency_model_from_env(name: str, default: str) -> LatencyModel:
+    """Read `<NAME>_LATENCY` (or the global `STORAGE_LATENCY`) and build the model
+
+    `STORAGE_LATENCY_SEED` makes the sampled delays reproducible.
+    """
+    spec = os.getenv(f"{name.upper()}_LATENCY") or os.getenv("STORAGE_LATENCY") or default
+    seed = os.getenv("STORAGE_LATENCY_SEED")
+    try:
+        model = parse_latency_model(spec, seed=int(seed) if seed is not None else None)
+    except ValueError as e:
+        logger.error(f"{e}; falling back to {default}")
+        model = parse_latency_model(default)
+    logger.info(f"Storage latency model for {name}: {model.describe()}")
+    return model
@@ -0,0 +1,71 @@
+# Housekeeping for Prometheus multiprocess mode, run by the gunicorn master
+import os
+import glob
+import shutil
+import logging
+
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+
+logger = logging.getLogger(__name__)
+
+# Metric types whose samples must outlive the worker that recorded them
+ARCHIVED_TYPES = ("counter", "histogram")
+
+
+def prepare_multiproc_dir(path: str):
+    """Create an empty metrics directory, removing files left by a previous run"""
+    if os.path.isdir(path):
+        for entry in os.listdir(path):
+            entry_path = os.path.join(path, entry)
+            if os.path.isdir(entry_path):
+                shutil.rmtree(entry_path)
+            else:
+                os.remove(entry_path)
+    else:
+        os.makedirs(path, exist_ok=True)
+
+
+def archive_dead_process(pid: int, path: str):
+    """Drop a dead worker's live gauges and fold its counters into one archive file
+
+    Counters and histograms must keep their totals after a worker exits, but
+    leaving one file per dead worker makes every scrape read more files as
+    workers are recycled. Merging them keeps the directory at one file per
+    live worker plus one archive per type.
+    """
+    mark_process_dead(pid, path)
+    for typ in ARCHIVED_TYPES:
+        dead_file = os.path.join(path, f"{typ}_{pid}.db")
+        if not os.path.exists(dead_file):
+            continue
+        archive_file = os.path.join(path, f"{typ}_archive.db")
+        sources = [dead_file] + ([archive_file] if os.path.exists(archive_file) else [])
+        # accumulate=False keeps histogram buckets per-bucket, as they are stored on disk
+        merged = MultiProcessCollector.merge(sources, accumulate=False)
+
+        tmp_file = archive_file + ".tmp"
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        archive = MmapedDict(tmp_file)
+        try:
+            for metric in merged:
+                for sample in metric.samples:
+                    key = mmap_key(
+                        metric.name,
+                        sample.name,
+                        list(sample.labels.keys()),
+                        list(sample.labels.values()),
+                        metric.documentation,
+                    )
+                    archive.write_value(key, sample.value, 0.0)
+        finally:
+            archive.close()
+        os.replace(tmp_file, archive_file)
+        os.remove(dead_file)
+    logger.info(f"Archived metrics of worker {pid}")
+
+
+def process_files(path: str) -> list:
+    """Metric files currently read by a scrape"""
+    return sorted(os.path.basename(f) for f in glob.glob(os.path.join(path, "*.db")))
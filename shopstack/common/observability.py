@@ -1,14 +1,27 @@
 import os
 import logging
 import time
-from typing import Optional, Callable
-from functools import wraps
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Tuple
 
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
-from fastapi import Request, Response
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.multiprocess import MultiProcessCollector
+from prometheus_client.openmetrics import exposition as openmetrics
+from prometheus_client.samples import Exemplar
+from prometheus_client.utils import floatToGoString
+from fastapi import Request
 from fastapi.responses import PlainTextResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common.structured_logging import AccessLogSampler, configure_logging, parse_sample_rates
+from common.tracing import TracingMiddleware, configure_tracing
+
+# With PROMETHEUS_MULTIPROC_DIR set, every worker process writes its samples to
+# mmap files in that directory and /metrics aggregates all of them. Gauges are
+# summed over live workers.
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
 
 # Prometheus metrics
 HTTP_REQUESTS_TOTAL = Counter(
@@ -17,36 +30,309 @@ HTTP_REQUESTS_TOTAL = Counter(
     ['method', 'endpoint', 'status']
 )
 
+# Request latency buckets in seconds. Catalog reads take 20-60ms and cart
+# writes 30-90ms, so the default layout is densest between 10ms and 100ms.
+DEFAULT_DURATION_BUCKETS = (
+    0.005, 0.01, 0.02, 0.03, 0.04, 0.05, 0.06, 0.075, 0.1,
+    0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0,
+)
+
+def exponential_buckets(start: float, factor: float, maximum: float) -> tuple:
+    """Buckets growing by `factor` from `start` up to and including the first bound >= `maximum`"""
+    if start <= 0 or factor <= 1 or maximum < start:
+        raise ValueError(f"Invalid exponential buckets: start={start}, factor={factor}, max={maximum}")
+    buckets = [start]
+    while buckets[-1] < maximum:
+        buckets.append(round(buckets[-1] * factor, 6))
+    return tuple(buckets)
+
+def parse_buckets(spec: str) -> tuple:
+    """Parse `0.01,0.05,0.1`, `default` or `exponential[:start,factor,max]`
+
+    `exponential` alone is a high-resolution layout from 1ms to 10s with
+    four buckets per doubling (about 19% relative error per bucket).
+    """
+    kind, _, args = spec.strip().partition(":")
+    if kind.lower() == "default":
+        return DEFAULT_DURATION_BUCKETS
+    if kind.lower() == "exponential":
+        params = [float(arg) for arg in args.split(",") if arg.strip()] or [0.001, 2 ** 0.25, 10.0]
+        if len(params) != 3:
+            raise ValueError(f"Invalid bucket spec: {spec!r}")
+        return exponential_buckets(*params)
+    buckets = tuple(float(bound) for bound in spec.split(",") if bound.strip())
+    if not buckets or any(b <= a for a, b in zip(buckets, buckets[1:])) or buckets[0] <= 0:
+        raise ValueError(f"Invalid bucket spec: {spec!r}")
+    return buckets
+
+def duration_buckets_from_env() -> tuple:
+    """Bucket layout from HTTP_DURATION_BUCKETS, set per service"""
+    spec = os.getenv('HTTP_DURATION_BUCKETS', 'default')
+    try:
+        return parse_buckets(spec)
+    except ValueError as e:
+        logging.getLogger(__name__).error(f"{e}; falling back to default buckets")
+        return DEFAULT_DURATION_BUCKETS
+
+DURATION_BUCKETS = duration_buckets_from_env()
+
 HTTP_REQUEST_DURATION_SECONDS = Histogram(
     'http_request_duration_seconds',
     'HTTP request duration in seconds',
     ['method', 'endpoint'],
-    buckets=[0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+    buckets=DURATION_BUCKETS
+)
+
+class ExemplarStore:
+    """Latest exemplar of each histogram bucket, kept in this process
+
+    prometheus_client drops exemplars in multiprocess mode, so the latency
+    histogram's exemplars are held here instead. The worker answering a
+    scrape attaches its own to the buckets aggregated over every worker;
+    any request that fell in a bucket is a valid exemplar for it.
+    """
+
+    def __init__(self, buckets: tuple):
+        self.upper_bounds = [float(bound) for bound in buckets] + [float("inf")]
+        self._exemplars: Dict[Tuple[str, ...], Exemplar] = {}
+
+    def record(self, labels: Tuple[str, ...], value: float, trace_id: str):
+        bound = self.upper_bounds[bisect_left(self.upper_bounds, value)]
+        self._exemplars[labels + (floatToGoString(bound),)] = Exemplar({"trace_id": trace_id}, value, time.time())
+
+    def get(self, labels: Tuple[str, ...]) -> Optional[Exemplar]:
+        return self._exemplars.get(labels)
+
+DURATION_EXEMPLARS = ExemplarStore(DURATION_BUCKETS)
+
+# Upstream connection pool metrics (API gateway)
+UPSTREAM_POOL_CONNECTIONS = Gauge(
+    'upstream_pool_connections',
+    'Connections held in the upstream client pool by state',
+    ['upstream', 'state'],
+    multiprocess_mode='livesum'
+)
+
+UPSTREAM_POOL_MAX_CONNECTIONS = Gauge(
+    'upstream_pool_max_connections',
+    'Configured connection limit of the upstream client pool',
+    ['upstream'],
+    multiprocess_mode='livesum'
+)
+
+UPSTREAM_REQUESTS_IN_FLIGHT = Gauge(
+    'upstream_requests_in_flight',
+    'Requests currently in flight to an upstream service',
+    ['upstream'],
+    multiprocess_mode='livesum'
+)
+
+UPSTREAM_ENDPOINTS = Gauge(
+    'upstream_endpoints',
+    'Upstream replicas known to the gateway by state (healthy, ejected)',
+    ['upstream', 'state'],
+    multiprocess_mode='livemax'
+)
+
+UPSTREAM_ENDPOINT_EJECTIONS_TOTAL = Counter(
+    'upstream_endpoint_ejections_total',
+    'Upstream replicas ejected after failing a health check',
+    ['upstream']
+)
+
+# Upstream failure handling metrics (API gateway)
+UPSTREAM_CONCURRENCY_LIMIT = Gauge(
+    'upstream_concurrency_limit',
+    'Adaptive limit on concurrent calls to an upstream',
+    ['upstream'],
+    multiprocess_mode='livesum'
+)
+
+UPSTREAM_LIMIT_REJECTIONS_TOTAL = Counter(
+    'upstream_limit_rejections_total',
+    'Upstream calls rejected because the concurrency limit was reached',
+    ['upstream']
+)
+
+UPSTREAM_BREAKER_STATE = Gauge(
+    'upstream_breaker_state',
+    'Least-open circuit breaker state across an upstream\'s replicas (0 closed, 1 half-open, 2 open)',
+    ['upstream'],
+    multiprocess_mode='livemax'
+)
+
+UPSTREAM_BREAKER_TRANSITIONS_TOTAL = Counter(
+    'upstream_breaker_transitions_total',
+    'Circuit breaker state changes by new state',
+    ['upstream', 'state']
+)
+
+UPSTREAM_BREAKER_REJECTIONS_TOTAL = Counter(
+    'upstream_breaker_rejections_total',
+    'Upstream calls failed fast because the circuit breaker was open',
+    ['upstream']
+)
+
+UPSTREAM_RETRIES_TOTAL = Counter(
+    'upstream_retries_total',
+    'Extra upstream attempts by kind (retry, hedge)',
+    ['upstream', 'kind']
+)
+
+UPSTREAM_RETRY_BUDGET_EXHAUSTED_TOTAL = Counter(
+    'upstream_retry_budget_exhausted_total',
+    'Retries or hedges skipped because the retry budget was spent',
+    ['upstream']
+)
+
+UPSTREAM_HEDGE_WINS_TOTAL = Counter(
+    'upstream_hedge_wins_total',
+    'Hedged requests answered first by the hedge',
+    ['upstream']
+)
+
+# Admission control metrics
+ADMISSION_REQUESTS_IN_FLIGHT = Gauge(
+    'admission_requests_in_flight',
+    'Admitted requests currently being served',
+    multiprocess_mode='livesum'
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'admission_queue_depth',
+    'Requests waiting for admission',
+    multiprocess_mode='livesum'
 )
 
-# Configure JSON logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='{"timestamp": "%(asctime)s", "level": "%(levelname)s", "message": "%(message)s", "service": "%(name)s"}'
+ADMISSION_SHED_TOTAL = Counter(
+    'admission_shed_total',
+    'Requests rejected with 503 by admission control, by reason (queue_full, timeout)',
+    ['reason']
+)
+
+# Response cache metrics (API gateway)
+CACHE_REQUESTS_TOTAL = Counter(
+    'cache_requests_total',
+    'Response cache lookups by result (hit, miss, coalesced)',
+    ['cache', 'result']
+)
+
+CACHE_EVICTIONS_TOTAL = Counter(
+    'cache_evictions_total',
+    'Response cache evictions by reason (capacity, expired)',
+    ['cache', 'reason']
+)
+
+CACHE_ENTRIES = Gauge(
+    'cache_entries',
+    'Entries currently held in the response cache',
+    ['cache'],
+    multiprocess_mode='livesum'
+)
+
+# Catalog replica metrics (API gateway)
+CATALOG_REPLICA_PRODUCTS = Gauge(
+    'catalog_replica_products',
+    'Products held in the gateway replica of the catalog',
+    multiprocess_mode='livesum'
+)
+
+CATALOG_REPLICA_CHANGES_TOTAL = Counter(
+    'catalog_replica_changes_total',
+    'Catalog change-feed entries applied to the gateway replica by op (upsert, delete)',
+    ['op']
+)
+
+CATALOG_REPLICA_SYNCS_TOTAL = Counter(
+    'catalog_replica_syncs_total',
+    'Full copies of the catalog into the gateway replica by reason (startup, reset, error)',
+    ['reason']
+)
+
+CATALOG_REPLICA_STALENESS_SECONDS = Gauge(
+    'catalog_replica_staleness_seconds',
+    'Seconds since the gateway replica last heard from the catalog change feed',
+    multiprocess_mode='livemax'
+)
+
+# Cart store metrics (cart service)
+CART_STORE_CARTS = Gauge(
+    'cart_store_carts',
+    'Carts currently held by the cart store',
+    multiprocess_mode='livesum'
+)
+
+CART_STORE_EVICTIONS_TOTAL = Counter(
+    'cart_store_evictions_total',
+    'Carts evicted from the cart store by reason (idle, capacity)',
+    ['reason']
+)
+
+CART_LOG_RECORDS_TOTAL = Counter(
+    'cart_log_records_total',
+    'Cart mutations written to the append-only cart log'
+)
+
+CART_LOG_PENDING_RECORDS = Gauge(
+    'cart_log_pending_records',
+    'Cart mutations acknowledged but not yet written to the cart log',
+    multiprocess_mode='livesum'
+)
+
+CART_LOG_FLUSH_SECONDS = Histogram(
+    'cart_log_flush_duration_seconds',
+    'Time to write and fsync one batch of cart mutations'
+)
+
+CART_LOG_SNAPSHOT_SECONDS = Histogram(
+    'cart_log_snapshot_duration_seconds',
+    'Time to write a cart store snapshot and compact the log',
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+)
+
+CART_LOG_WRITE_ERRORS_TOTAL = Counter(
+    'cart_log_write_errors_total',
+    'Failed cart log flushes or snapshots (retried on the next interval)'
+)
+
+# Idempotency-Key deduplication metrics
+IDEMPOTENCY_REQUESTS_TOTAL = Counter(
+    'idempotency_requests_total',
+    'Requests with an Idempotency-Key by result (new, replayed, coalesced, mismatch)',
+    ['result']
+)
+
+IDEMPOTENCY_KEYS = Gauge(
+    'idempotency_keys',
+    'Idempotency keys with a stored response',
+    multiprocess_mode='livesum'
+)
+
+# Logging pipeline metrics
+LOG_RECORDS_DROPPED_TOTAL = Counter(
+    'log_records_dropped_total',
+    'Log records not written by reason (queue_full, sampled)',
+    ['reason']
+)
+
+# Configure JSON logging through a bounded queue drained by a writer thread
+configure_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO'),
+    queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+    on_drop=LOG_RECORDS_DROPPED_TOTAL.labels(reason='queue_full').inc
 )
 
 logger = logging.getLogger(__name__)
 
-def setup_otel_instrumentation():
-    """Setup OpenTelemetry instrumentation if OTLP endpoint is configured"""
+def setup_otel_instrumentation(service_name: str = "shopstack"):
+    """Setup OpenTelemetry tracing if OTLP endpoint is configured"""
     otlp_endpoint = os.getenv('OTLP_ENDPOINT')
     if otlp_endpoint:
         try:
-            from opentelemetry import trace
             from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-            from opentelemetry.sdk.trace import TracerProvider
-            from opentelemetry.sdk.trace.export import BatchSpanProcessor
             
-            # Setup trace provider
-            trace.set_tracer_provider(TracerProvider())
-            trace.get_tracer_provider().add_span_processor(
-                BatchSpanProcessor(OTLPSpanExporter(endpoint=otlp_endpoint))
-            )
+            # Setup trace provider with a parent-based sampler and bounded batch export
+            configure_tracing(service_name, OTLPSpanExporter(endpoint=otlp_endpoint))
             
             logger.info(f"OpenTelemetry instrumentation enabled with OTLP endpoint: {otlp_endpoint}")
         except ImportError:
@@ -54,82 +340,233 @@ def setup_otel_instrumentation():
         except Exception as e:
             logger.error(f"Failed to setup OpenTelemetry: {e}")
 
-class MetricsMiddleware(BaseHTTPMiddleware):
-    """FastAPI middleware for collecting Prometheus metrics"""
+# Resolve tracing hooks once at import instead of on every request
+try:
+    from opentelemetry.trace import get_current_span as _get_current_span
+except ImportError:
+    _get_current_span = None
+
+def current_trace_context():
+    """Return (trace_id, span_id) of the active span, or (None, None) without tracing"""
+    if _get_current_span is None:
+        return None, None
+    context = _get_current_span().get_span_context()
+    return context.trace_id, context.span_id
+
+# Label values for requests that match no route, or arrive after the endpoint label cap is reached
+UNMATCHED_ENDPOINT = "unmatched"
+OVERFLOW_ENDPOINT = "overflow"
+KNOWN_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+def access_log_sampler_from_env() -> AccessLogSampler:
+    """Sampler from ACCESS_LOG_SAMPLE_RATES, e.g. `INFO=0.05,WARNING=0.5`"""
+    spec = os.getenv("ACCESS_LOG_SAMPLE_RATES", "")
+    try:
+        return AccessLogSampler(parse_sample_rates(spec))
+    except ValueError as e:
+        logger.error(f"{e}; logging every request")
+        return AccessLogSampler()
+
+class MetricsMiddleware:
+    """Pure ASGI middleware collecting Prometheus metrics and access logs
+
+    Wraps `send` to observe the response status instead of subclassing
+    BaseHTTPMiddleware, which adds a task and memory stream per request.
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        start_time = time.time()
-        
-        # Get trace context if available
-        trace_id = None
-        span_id = None
-        try:
-            from opentelemetry import trace
-            current_span = trace.get_current_span()
-            if current_span:
-                trace_id = current_span.get_span_context().trace_id
-                span_id = current_span.get_span_context().span_id
-        except ImportError:
-            pass
-        
-        # Log request with trace context
-        logger.info(
-            f"Request started",
-            extra={
-                "method": request.method,
-                "url": str(request.url),
-                "trace_id": trace_id,
-                "span_id": span_id
-            }
-        )
-        
-        response = await call_next(request)
-        
-        # Calculate duration
-        duration = time.time() - start_time
-        
-        # Record metrics
-        endpoint = request.url.path
-        HTTP_REQUESTS_TOTAL.labels(
-            method=request.method,
-            endpoint=endpoint,
-            status=response.status_code
-        ).inc()
+    Requests are labelled with the matched route template (`/cart/{cart_id}`)
+    rather than the raw path, and at most `max_endpoints` distinct templates
+    are tracked; anything beyond that is counted under `overflow`. Requests
+    answered before routing ran, such as those shed by admission control,
+    are matched against the app's routes here so they keep their template.
+    
+    Access log records are INFO for 2xx/3xx, WARNING for 4xx and ERROR for
+    5xx, each sampled at the rate configured in ACCESS_LOG_SAMPLE_RATES.
+    """
+    
+    def __init__(self, app: ASGIApp, max_endpoints: Optional[int] = None, sampler: Optional[AccessLogSampler] = None):
+        self.app = app
+        self.max_endpoints = max_endpoints or int(os.getenv("METRICS_MAX_ENDPOINTS", "100"))
+        self.endpoints = set()
+        self.sampler = sampler or access_log_sampler_from_env()
+        self._sampled_out = LOG_RECORDS_DROPPED_TOTAL.labels(reason="sampled")
+    
+    def endpoint_label(self, scope: Scope) -> str:
+        """Route template of the request, bounded by the cardinality cap"""
+        route = scope.get("route") or self.match_route(scope)
+        endpoint = getattr(route, "path", None) or UNMATCHED_ENDPOINT
+        if endpoint not in self.endpoints:
+            if len(self.endpoints) >= self.max_endpoints:
+                return OVERFLOW_ENDPOINT
+            self.endpoints.add(endpoint)
+        return endpoint
+    
+    @staticmethod
+    def match_route(scope: Scope):
+        """Route the app's router would pick for the request: the first full match, else the first partial one"""
+        app = scope.get("app")
+        partial = None
+        for route in getattr(getattr(app, "router", None), "routes", ()):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+            if match == Match.PARTIAL and partial is None:
+                partial = route
+        return partial
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        HTTP_REQUEST_DURATION_SECONDS.labels(
-            method=request.method,
-            endpoint=endpoint
-        ).observe(duration)
+        start_time = time.perf_counter()
+        status_code = 500
         
-        # Log response with trace context
-        logger.info(
-            f"Request completed",
-            extra={
-                "method": request.method,
-                "url": str(request.url),
-                "status_code": response.status_code,
-                "duration": duration,
-                "trace_id": trace_id,
-                "span_id": span_id
-            }
-        )
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
         
-        return response
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start_time
+            method = scope["method"] if scope["method"] in KNOWN_METHODS else "OTHER"
+            endpoint = self.endpoint_label(scope)
+            
+            # Record metrics
+            HTTP_REQUESTS_TOTAL.labels(
+                method=method,
+                endpoint=endpoint,
+                status=status_code
+            ).inc()
+            
+            # Attach the trace id as an exemplar so a slow bucket links to its trace
+            trace_id, span_id = current_trace_context()
+            HTTP_REQUEST_DURATION_SECONDS.labels(
+                method=method,
+                endpoint=endpoint
+            ).observe(duration, {"trace_id": format(trace_id, "032x")} if trace_id else None)
+            if MULTIPROC_DIR and trace_id:
+                DURATION_EXEMPLARS.record((method, endpoint), duration, format(trace_id, "032x"))
+            
+            # Log response with trace context, building the record only if it will be emitted
+            level = logging.ERROR if status_code >= 500 else logging.WARNING if status_code >= 400 else logging.INFO
+            if logger.isEnabledFor(level):
+                if self.sampler.sample(level):
+                    logger.log(
+                        level,
+                        "Request completed",
+                        extra={
+                            "method": scope["method"],
+                            "path": scope["path"],
+                            "endpoint": endpoint,
+                            "status_code": status_code,
+                            "duration": duration,
+                            "trace_id": format(trace_id, "032x") if trace_id else None,
+                            "span_id": format(span_id, "016x") if span_id else None
+                        }
+                    )
+                else:
+                    self._sampled_out.inc()
+
+# Gauges whose value is computed on demand. In multiprocess mode a callback
+# cannot be read by whichever worker answers the scrape, so the values are
+# written to the worker's mmap file by a background thread instead.
+_function_gauges = []
+_refresher: Optional[threading.Thread] = None
+_refresh_interval = float(os.getenv('METRICS_GAUGE_REFRESH_INTERVAL', '5.0'))
 
-def get_metrics():
-    """Return Prometheus metrics"""
+def set_gauge_function(gauge, f: Callable[[], float]):
+    """Report `f()` as the value of a gauge (or labelled gauge child)"""
+    if not MULTIPROC_DIR:
+        gauge.set_function(f)
+        return
+    _function_gauges.append((gauge, f))
+    _start_gauge_refresher()
+
+def refresh_function_gauges():
+    """Write the current value of every function gauge of this process"""
+    for gauge, f in list(_function_gauges):
+        try:
+            gauge.set(f())
+        except Exception as e:
+            logger.debug(f"Failed to refresh gauge: {e}")
+
+def _refresh_loop():
+    while True:
+        refresh_function_gauges()
+        time.sleep(_refresh_interval)
+
+def _start_gauge_refresher():
+    global _refresher
+    if _refresher is None:
+        _refresher = threading.Thread(target=_refresh_loop, name="metrics-gauge-refresher", daemon=True)
+        _refresher.start()
+
+def _reset_gauge_refresher():
+    """Threads do not survive fork; restart the refresher in the child (gunicorn --preload)"""
+    global _refresher
+    _refresher = None
+    if _function_gauges:
+        _start_gauge_refresher()
+
+if MULTIPROC_DIR:
+    os.register_at_fork(after_in_child=_reset_gauge_refresher)
+
+class _ExemplarCollector:
+    """Multiprocess collector that adds this worker's latency exemplars to the aggregated buckets"""
+
+    def __init__(self, collector: MultiProcessCollector):
+        self.collector = collector
+
+    def collect(self):
+        for metric in self.collector.collect():
+            if metric.name == 'http_request_duration_seconds':
+                metric.samples = [
+                    sample._replace(exemplar=DURATION_EXEMPLARS.get(
+                        (sample.labels.get("method"), sample.labels.get("endpoint"), sample.labels["le"])
+                    ))
+                    if sample.name.endswith("_bucket") else sample
+                    for sample in metric.samples
+                ]
+            yield metric
+
+_multiprocess_registry: Optional[CollectorRegistry] = None
+
+def metrics_registry():
+    """Registry to expose: the process-local default, or one aggregating every worker's files"""
+    global _multiprocess_registry
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    if _multiprocess_registry is None:
+        _multiprocess_registry = CollectorRegistry()
+        _multiprocess_registry.register(_ExemplarCollector(MultiProcessCollector(None, path=MULTIPROC_DIR)))
+    return _multiprocess_registry
+
+def get_metrics(accept: Optional[str] = None):
+    """Return Prometheus metrics, in OpenMetrics format (with exemplars) if the scraper accepts it"""
+    if MULTIPROC_DIR:
+        refresh_function_gauges()
+    if accept and "application/openmetrics-text" in accept:
+        return PlainTextResponse(
+            openmetrics.generate_latest(metrics_registry()),
+            media_type=openmetrics.CONTENT_TYPE_LATEST
+        )
     return PlainTextResponse(
-        generate_latest(),
+        generate_latest(metrics_registry()),
         media_type=CONTENT_TYPE_LATEST
     )
 
 def add_observability_routes(app):
     """Add observability endpoints to FastAPI app"""
     app.add_middleware(MetricsMiddleware)
+    # Added last so it runs outermost and the metrics middleware sees the server span
+    app.add_middleware(TracingMiddleware)
     
     @app.get("/metrics")
-    async def metrics():
-        return get_metrics()
+    async def metrics(request: Request):
+        return get_metrics(request.headers.get("accept"))
     
     @app.get("/healthz")
     async def healthz():
@@ -0,0 +1,159 @@
+# Streaming reverse-proxy routes for the API gateway
+import logging
+from typing import Iterable, List, Optional
+
+import httpx
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from common.cache import ResponseCache
+from common.idempotency import IDEMPOTENCY_HEADER
+from common.responses import etag_matches
+from common.upstream import UpstreamClient
+
+logger = logging.getLogger(__name__)
+
+# Connection-scoped headers that must not be forwarded (RFC 9110 section 7.6.1)
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+})
+
+# Headers describing one upstream reply; a cached copy is served without them
+# and the gateway's own server sets fresh ones
+PER_RESPONSE_HEADERS = frozenset({"date", "server"})
+
+
+class ProxyRoute:
+    """One gateway route forwarded unchanged to an upstream service
+
+    The upstream path is the gateway path (including the query string).
+    Routes with a cache are read through it; all others stream.
+    """
+
+    def __init__(self, method: str, path: str, upstream: UpstreamClient, cache: Optional[ResponseCache] = None):
+        self.method = method
+        self.path = path
+        self.upstream = upstream
+        self.cache = cache
+
+
+def forward_request_headers(request: Request) -> List[tuple]:
+    return [
+        (name, value)
+        for name, value in request.headers.items()
+        if name not in HOP_BY_HOP_HEADERS and name != "host"
+    ]
+
+
+def forward_response_headers(headers: httpx.Headers) -> dict:
+    return {
+        name: value
+        for name, value in headers.items()
+        if name not in HOP_BY_HOP_HEADERS
+    }
+
+
+def upstream_target(request: Request) -> str:
+    path = request.url.path
+    if request.url.query:
+        path = f"{path}?{request.url.query}"
+    return path
+
+
+async def raw_chunks(response: httpx.Response):
+    """Yield the undecoded body; responses built in-process may already be read"""
+    if response.is_stream_consumed:
+        yield response.content
+        return
+    async for chunk in response.aiter_raw():
+        yield chunk
+
+
+def service_label(upstream: UpstreamClient) -> str:
+    return upstream.name.capitalize()
+
+
+async def stream_upstream(request: Request, upstream: UpstreamClient) -> StreamingResponse:
+    """Forward the request and stream status, headers and raw body chunks back undecoded
+
+    Requests with an Idempotency-Key are buffered rather than streamed, so
+    the upstream client can resend the body when it retries them.
+    """
+    if request.method in ("GET", "HEAD"):
+        body = None
+    elif IDEMPOTENCY_HEADER in request.headers:
+        body = await request.body()
+    else:
+        body = request.stream()
+    response = await upstream.request(
+        request.method,
+        upstream_target(request),
+        headers=forward_request_headers(request),
+        content=body,
+        stream=True,
+    )
+    return StreamingResponse(
+        raw_chunks(response),
+        status_code=response.status_code,
+        headers=forward_response_headers(response.headers),
+        background=BackgroundTask(response.aclose),
+    )
+
+
+async def fetch_raw(upstream: UpstreamClient, target: str):
+    """Fetch a response as (status_code, (raw_body, headers)) for the cache"""
+    response = await upstream.request("GET", target, stream=True)
+    try:
+        content = b"".join([chunk async for chunk in raw_chunks(response)])
+    finally:
+        await response.aclose()
+    headers = {
+        name: value
+        for name, value in forward_response_headers(response.headers).items()
+        if name not in PER_RESPONSE_HEADERS
+    }
+    return response.status_code, (content, headers)
+
+
+async def cached_upstream(request: Request, upstream: UpstreamClient, cache: ResponseCache) -> Response:
+    """Serve a GET from the cache, loading the raw upstream bytes on a miss"""
+    target = upstream_target(request)
+    status_code, (content, headers) = await cache.get_or_load(target, lambda: fetch_raw(upstream, target))
+    etag = headers.get("etag")
+    if status_code == 200 and etag and etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=content, status_code=status_code, headers=headers)
+
+
+def proxy_endpoint(route: ProxyRoute):
+    """Build the FastAPI endpoint for a proxy route"""
+    label = service_label(route.upstream)
+
+    async def endpoint(request: Request) -> Response:
+        logger.info("Proxying %s %s to %s service", request.method, request.url.path, route.upstream.name)
+        try:
+            if route.cache is not None:
+                return await cached_upstream(request, route.upstream, route.cache)
+            return await stream_upstream(request, route.upstream)
+        except httpx.RequestError as e:
+            logger.error("Failed to connect to %s service: %s", route.upstream.name, e)
+            raise HTTPException(status_code=503, detail=f"{label} service unavailable")
+
+    endpoint.__name__ = f"proxy_{route.upstream.name}_{route.method.lower()}"
+    endpoint.__doc__ = f"Proxy request to {route.upstream.name} service"
+    return endpoint
+
+
+def add_proxy_routes(app, routes: Iterable[ProxyRoute]):
+    """Register a streaming passthrough endpoint for each route"""
+    for route in routes:
+        app.add_api_route(route.path, proxy_endpoint(route), methods=[route.method])
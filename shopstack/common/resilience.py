@@ -0,0 +1,336 @@
+# Failure handling building blocks for upstream calls: circuit breaker, retry budget, latency tracking, concurrency limits
+import math
+import time
+import random
+from collections import deque
+from typing import Callable, List, Optional
+
+import httpx
+
+from common.observability import UPSTREAM_BREAKER_TRANSITIONS_TOTAL, UPSTREAM_CONCURRENCY_LIMIT
+
+# Breaker states; the upstream_breaker_state gauge exports the lowest across an upstream's replicas
+CLOSED = 0
+HALF_OPEN = 1
+OPEN = 2
+STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+
+class CircuitOpenError(httpx.RequestError):
+    """Raised instead of calling an upstream whose breaker is open
+
+    Subclasses httpx.RequestError so callers that already map connection
+    failures to 503 handle it the same way.
+    """
+
+
+class LimitExceededError(httpx.RequestError):
+    """Raised instead of calling an upstream that already has as many calls in flight as its limit allows"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker
+
+    After `failure_threshold` failures in a row the breaker opens and calls
+    fail fast for `reset_timeout` seconds. It then lets a single probe
+    through (half-open): success closes it, failure opens it again.
+    A threshold of 0 disables the breaker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def _transition(self, state: int):
+        if state != self.state:
+            self.state = state
+            UPSTREAM_BREAKER_TRANSITIONS_TOTAL.labels(upstream=self.name, state=STATE_NAMES[state]).inc()
+
+    def available(self) -> bool:
+        """Whether `allow()` would admit a call now, without claiming the half-open probe"""
+        if self.failure_threshold <= 0 or self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return self.clock() - self.opened_at >= self.reset_timeout
+        return not self._probe_in_flight
+
+    def allow(self) -> bool:
+        """Whether a call may be made now; a half-open breaker admits one probe at a time"""
+        if self.failure_threshold <= 0 or self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            self._transition(HALF_OPEN)
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        self._transition(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.failure_threshold > 0 and (self.state == HALF_OPEN or self.failures >= self.failure_threshold):
+            self.opened_at = self.clock()
+            self._transition(OPEN)
+
+    def release(self):
+        """Forget a call that ended without an outcome (cancelled)"""
+        self._probe_in_flight = False
+
+    def reset(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        self._transition(CLOSED)
+
+
+class RetryBudget:
+    """Token bucket limiting retries and hedges to a fraction of traffic
+
+    Every request deposits `ratio` tokens and every retry spends one, so
+    retries add at most `ratio` extra load when an upstream is failing.
+    `min_per_second` tokens are also added over time so low-traffic
+    periods can still retry.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.2,
+        min_per_second: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = max(10.0, min_per_second * 10)
+        self.clock = clock
+        self.tokens = min_per_second
+        self._updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        """Record an original (non-retry) request"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Take a token for a retry; False if the budget is exhausted"""
+        self._refill()
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class LatencyTracker:
+    """Recent successful call durations and a percentile of them, recomputed every few samples"""
+
+    def __init__(self, size: int = 256, min_samples: int = 20, recompute_every: int = 16, quantile: float = 0.95):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self.recompute_every = recompute_every
+        self.quantile = quantile
+        self._since_recompute = 0
+        self._value: Optional[float] = None
+
+    def observe(self, duration: float):
+        self.samples.append(duration)
+        self._since_recompute += 1
+        if self._since_recompute >= self.recompute_every:
+            self._value = None
+
+    def percentile(self) -> Optional[float]:
+        """`quantile` of the window, or None until `min_samples` calls have completed"""
+        if len(self.samples) < self.min_samples:
+            return None
+        if self._value is None:
+            ordered = sorted(self.samples)
+            self._value = ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))]
+            self._since_recompute = 0
+        return self._value
+
+
+def backoff_delay(attempt: int, base: float, cap: float = 1.0) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (1-based)"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class AIMDLimit:
+    """Additive increase, multiplicative decrease
+
+    Grows the limit by one per sample while the upstream is kept busy, and
+    cuts it by `backoff` whenever a call times out or is shed.
+    """
+
+    name = "aimd"
+
+    def __init__(self, initial: int = 20, min_limit: int = 4, max_limit: int = 100, backoff: float = 0.9):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+
+    def update(self, rtt: float, in_flight: int, dropped: bool) -> float:
+        if dropped:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif in_flight * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+        return self.limit
+
+
+class GradientLimit:
+    """Limit that follows the ratio of no-load to recent round-trip time
+
+    The no-load RTT is measured by a probe: the limit drops to `min_limit`,
+    the calls already in flight (which were queued) are skipped, and the
+    mean RTT of the next `probe_samples` calls, made without queueing, is
+    taken. The limit then returns to its previous value. A probe runs at
+    startup and again after every `probe_every` x limit samples, so the
+    estimate follows the upstream when it gets faster or slower. A
+    percentile of recent samples is not used: once the limit is above the
+    upstream's capacity every sample includes queueing.
+
+    The recent RTT is a moving average. While it stays within `tolerance`
+    of the no-load RTT the limit grows by about sqrt(limit) per sample; as
+    queueing inflates it the gradient falls towards 0.5 and shrinks the
+    limit, which settles where queueing adds about `tolerance` - 1 to the
+    no-load RTT. Samples taken while less than half the limit is used are
+    ignored, since an idle upstream says nothing about its capacity.
+    Dropped calls cut the limit by `backoff` as in AIMDLimit.
+    """
+
+    name = "gradient"
+
+    def __init__(
+        self,
+        initial: int = 20,
+        min_limit: int = 4,
+        max_limit: int = 100,
+        smoothing: float = 0.2,
+        tolerance: float = 1.5,
+        probe_samples: int = 10,
+        probe_every: int = 200,
+        backoff: float = 0.9,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self.probe_samples = probe_samples
+        self.probe_every = probe_every
+        self.backoff = backoff
+        self.no_load_rtt: Optional[float] = None
+        self.recent_rtt: Optional[float] = None
+        self._until_probe = 0
+        self._probe: Optional[List[float]] = None
+        self._probe_skip = 0
+        self._resume_limit = self.limit
+        self._start_probe(in_flight=0)
+
+    @property
+    def probing(self) -> bool:
+        return self._probe is not None
+
+    def _start_probe(self, in_flight: int):
+        """Drop to the minimum limit so the upstream's queue drains; `in_flight` calls are still queued"""
+        self._resume_limit = self.limit
+        self.limit = float(min(self.min_limit, self.limit))
+        self._probe = []
+        self._probe_skip = in_flight
+
+    def _probe_sample(self, rtt: float):
+        if self._probe_skip > 0:
+            self._probe_skip -= 1
+            return
+        self._probe.append(rtt)
+        if len(self._probe) < self.probe_samples:
+            return
+        self.no_load_rtt = sum(self._probe) / len(self._probe)
+        self.recent_rtt = self.no_load_rtt
+        self.limit = self._resume_limit
+        self._probe = None
+        self._until_probe = int(self.probe_every * self.limit)
+
+    def update(self, rtt: float, in_flight: int, dropped: bool) -> float:
+        if self.probing:
+            if dropped:
+                self._probe_skip = max(0, self._probe_skip - 1)
+                self._resume_limit = max(self.min_limit, self._resume_limit * self.backoff)
+            else:
+                self._probe_sample(rtt)
+            return self.limit
+        if dropped:
+            # A shed or timed-out call's RTT says nothing about no-load latency
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+            return self.limit
+
+        self.recent_rtt += (rtt - self.recent_rtt) * 0.1
+        self._until_probe -= 1
+        if self._until_probe <= 0:
+            # The other calls in flight started before the probe
+            self._start_probe(in_flight - 1)
+            return self.limit
+        if in_flight * 2 < self.limit:
+            return self.limit
+        gradient = max(0.5, min(1.0, self.tolerance * self.no_load_rtt / self.recent_rtt))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, self.limit))
+        return self.limit
+
+
+LIMIT_ALGORITHMS = {algorithm.name: algorithm for algorithm in (GradientLimit, AIMDLimit)}
+
+
+class ConcurrencyLimiter:
+    """Rejects calls beyond an adaptive in-flight limit instead of queueing them
+
+    `algorithm` learns the limit from the round-trip time of completed
+    calls; see GradientLimit and AIMDLimit.
+    """
+
+    def __init__(self, name: str, algorithm):
+        self.name = name
+        self.algorithm = algorithm
+        self.in_flight = 0
+        self._limit_gauge = UPSTREAM_CONCURRENCY_LIMIT.labels(upstream=name)
+        self._limit_gauge.set(self.limit)
+
+    @property
+    def limit(self) -> int:
+        return int(self.algorithm.limit)
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, rtt: Optional[float] = None, dropped: bool = False):
+        """End a call; `rtt` of None (e.g. a connection error) releases the slot without a sample"""
+        if rtt is not None:
+            # Sample with the call itself counted, as it was while in flight
+            self.algorithm.update(rtt, self.in_flight, dropped)
+            self._limit_gauge.set(self.limit)
+        self.in_flight -= 1
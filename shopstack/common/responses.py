@@ -0,0 +1,33 @@
+# Helpers for serving pre-rendered bodies with conditional requests
+import json
+import hashlib
+
+from fastapi import Request, Response
+
+
+def render_json(value) -> bytes:
+    """Serialize to compact UTF-8 JSON, matching FastAPI's JSONResponse output"""
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the response body"""
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check If-None-Match against an ETag (weak comparison, as RFC 9110 requires for GET)"""
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+def json_response(request: Request, body: bytes, etag: str) -> Response:
+    """Serve pre-rendered JSON bytes, or an empty 304 if the client already has them"""
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
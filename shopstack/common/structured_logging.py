@@ -0,0 +1,111 @@
+# Non-blocking JSON logging shared by all services
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Callable, Dict, Optional
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, logger name and any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "service": record.name,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never blocks the caller and formats nothing on its thread
+
+    Records are handed to a bounded queue as-is; the message, `extra` fields
+    and traceback are rendered by the listener thread. When the queue is
+    full the record is dropped and `on_drop` is called.
+    """
+
+    def __init__(self, log_queue: queue.Queue, on_drop: Optional[Callable[[], None]] = None):
+        super().__init__(log_queue)
+        self.on_drop = on_drop
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.on_drop is not None:
+                self.on_drop()
+
+
+class AccessLogSampler:
+    """Per-level sampling of access log records
+
+    `rates` maps a level name to the fraction of records kept; levels not
+    listed are always logged.
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None, seed: Optional[int] = None):
+        self.rates = {logging.getLevelName(level.upper()): rate for level, rate in (rates or {}).items()}
+        self._random = random.Random(seed).random
+
+    def sample(self, level: int) -> bool:
+        rate = self.rates.get(level, 1.0)
+        return rate >= 1.0 or self._random() < rate
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse `INFO=0.1,WARNING=1` into {"INFO": 0.1, "WARNING": 1.0}"""
+    rates = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        level, sep, rate = part.partition("=")
+        level = level.strip().upper()
+        if not sep or not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f"Invalid sample rate spec: {spec!r}")
+        rates[level] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+def configure_logging(
+    level: str = "INFO",
+    queue_size: int = 10000,
+    on_drop: Optional[Callable[[], None]] = None,
+    stream=None,
+) -> Optional[logging.handlers.QueueListener]:
+    """Send root logging through a bounded queue to a JSON stdout writer thread
+
+    Like `logging.basicConfig`, does nothing if the root logger already has
+    handlers. Returns the started listener, which is stopped (and flushed)
+    at exit.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    log_queue = queue.Queue(maxsize=queue_size)
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    root.addHandler(NonBlockingQueueHandler(log_queue, on_drop))
+    root.setLevel(level.upper())
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,129 @@
+# Server and client spans with W3C trace context propagation between services
+import os
+import logging
+from contextlib import contextmanager
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:
+    propagate = trace = None
+
+logger = logging.getLogger(__name__)
+
+# Proxy tracer: spans are no-ops until a tracer provider is installed
+shopstack_tracer = trace.get_tracer("shopstack") if trace is not None else None
+
+
+def sampler_from_env():
+    """Parent-based sampler: follow the caller's decision, sample new traces at TRACE_SAMPLE_RATIO
+
+    Only the gateway normally starts traces, so the ratio there decides for
+    the whole request tree and downstream services never break a trace.
+    """
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    ratio = min(max(float(os.getenv("TRACE_SAMPLE_RATIO", "1.0")), 0.0), 1.0)
+    return ParentBased(TraceIdRatioBased(ratio))
+
+
+def batch_settings_from_env() -> dict:
+    """Bounded BatchSpanProcessor settings; spans beyond the queue are dropped, never block"""
+    return dict(
+        max_queue_size=int(os.getenv("TRACE_MAX_QUEUE_SIZE", "2048")),
+        max_export_batch_size=int(os.getenv("TRACE_MAX_EXPORT_BATCH_SIZE", "512")),
+        schedule_delay_millis=float(os.getenv("TRACE_SCHEDULE_DELAY_MS", "1000")),
+        export_timeout_millis=float(os.getenv("TRACE_EXPORT_TIMEOUT_MS", "10000")),
+    )
+
+
+def configure_tracing(service_name: str, exporter, sampler=None, batch: bool = True):
+    """Install a global tracer provider exporting this service's spans; returns the provider"""
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=sampler or sampler_from_env(),
+    )
+    if batch:
+        provider.add_span_processor(BatchSpanProcessor(exporter, **batch_settings_from_env()))
+    else:
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware opening a server span per request
+
+    The span continues the caller's trace from the `traceparent` header and
+    is named after the matched route template once routing has run. Add it
+    after MetricsMiddleware so metrics and access logs see the span.
+    """
+
+    def __init__(self, app: ASGIApp, tracer=None):
+        self.app = app
+        self.tracer = tracer or shopstack_tracer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self.tracer is None:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        carrier = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        span = self.tracer.start_span(
+            method,
+            context=propagate.extract(carrier),
+            kind=SpanKind.SERVER,
+            attributes={"http.method": method, "http.target": scope["path"], "http.scheme": scope.get("scheme", "http")},
+        )
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            with trace.use_span(span, end_on_exit=False):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            if span.is_recording():
+                route = getattr(scope.get("route"), "path", None)
+                if route is not None:
+                    span.update_name(f"{method} {route}")
+                    span.set_attribute("http.route", route)
+                set_status_code(span, status_code)
+            span.end()
+
+
+def set_status_code(span, status_code: int):
+    span.set_attribute("http.status_code", status_code)
+    if status_code >= 500:
+        span.set_status(Status(StatusCode.ERROR))
+
+
+@contextmanager
+def client_span(peer: str, method: str, url: str):
+    """Client span around an outbound request; yields None when OpenTelemetry is not installed"""
+    if shopstack_tracer is None:
+        yield None
+        return
+    with shopstack_tracer.start_as_current_span(
+        method,
+        kind=SpanKind.CLIENT,
+        attributes={"http.method": method, "http.url": url, "peer.service": peer},
+    ) as span:
+        yield span
+
+
+def inject_trace_context(carrier):
+    """Add the current trace context (`traceparent`) to a mutable header mapping"""
+    if propagate is not None:
+        propagate.inject(carrier)
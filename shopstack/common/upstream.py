@@ -0,0 +1,476 @@
+# Pooled HTTP clients for calling backend services
+import os
+import time
+import asyncio
+import logging
+from typing import Optional
+
+import httpx
+
+from common.observability import (
+    UPSTREAM_BREAKER_STATE,
+    UPSTREAM_ENDPOINT_EJECTIONS_TOTAL,
+    UPSTREAM_ENDPOINTS,
+    UPSTREAM_POOL_CONNECTIONS,
+    UPSTREAM_POOL_MAX_CONNECTIONS,
+    UPSTREAM_BREAKER_REJECTIONS_TOTAL,
+    UPSTREAM_HEDGE_WINS_TOTAL,
+    UPSTREAM_LIMIT_REJECTIONS_TOTAL,
+    UPSTREAM_REQUESTS_IN_FLIGHT,
+    UPSTREAM_RETRIES_TOTAL,
+    UPSTREAM_RETRY_BUDGET_EXHAUSTED_TOTAL,
+    set_gauge_function,
+)
+from common.balancer import Endpoint, LoadBalancer, parse_urls
+from common.idempotency import IDEMPOTENCY_HEADER
+from common.resilience import (
+    LIMIT_ALGORITHMS,
+    CircuitBreaker,
+    CircuitOpenError,
+    ConcurrencyLimiter,
+    LatencyTracker,
+    LimitExceededError,
+    RetryBudget,
+    backoff_delay,
+)
+from common.tracing import client_span, inject_trace_context, set_status_code
+
+logger = logging.getLogger(__name__)
+
+# Methods safe to send more than once, and statuses worth another attempt
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+RETRYABLE_STATUSES = frozenset({502, 503, 504})
+# Failures raised before a request was sent, so the upstream cannot have applied it
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def _env(name: str, key: str, default: str) -> str:
+    """Read `<NAME>_<KEY>`, falling back to `UPSTREAM_<KEY>` and then the default"""
+    value = os.getenv(f"{name.upper()}_{key}")
+    if value is None:
+        value = os.getenv(f"UPSTREAM_{key}", default)
+    return value
+
+
+class UpstreamConfig:
+    """Connection pool limits and timeouts for one upstream service"""
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 1.0,
+        read_timeout: float = 5.0,
+        write_timeout: float = 5.0,
+        pool_timeout: float = 1.0,
+        http2: bool = False,
+        retries: int = 2,
+        retry_backoff: float = 0.05,
+        retry_budget_ratio: float = 0.2,
+        retry_budget_min_per_second: float = 5.0,
+        breaker_failures: int = 5,
+        breaker_reset_timeout: float = 5.0,
+        hedge: bool = False,
+        hedge_min_delay: float = 0.005,
+        balancer: str = "p2c",
+        health_check_interval: float = 5.0,
+        health_check_timeout: float = 1.0,
+        dns_refresh_interval: float = 0.0,
+        concurrency_limit: str = "off",
+        initial_limit: int = 20,
+        min_limit: int = 4,
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.pool_timeout = pool_timeout
+        self.http2 = http2
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_budget_ratio = retry_budget_ratio
+        self.retry_budget_min_per_second = retry_budget_min_per_second
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.balancer = balancer
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.dns_refresh_interval = dns_refresh_interval
+        self.concurrency_limit = concurrency_limit
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+
+    @classmethod
+    def from_env(cls, name: str) -> "UpstreamConfig":
+        """Build config from environment, e.g. CATALOG_MAX_CONNECTIONS or UPSTREAM_MAX_CONNECTIONS"""
+        return cls(
+            max_connections=int(_env(name, "MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(_env(name, "MAX_KEEPALIVE_CONNECTIONS", "20")),
+            keepalive_expiry=float(_env(name, "KEEPALIVE_EXPIRY", "30.0")),
+            connect_timeout=float(_env(name, "CONNECT_TIMEOUT", "1.0")),
+            read_timeout=float(_env(name, "READ_TIMEOUT", "5.0")),
+            write_timeout=float(_env(name, "WRITE_TIMEOUT", "5.0")),
+            pool_timeout=float(_env(name, "POOL_TIMEOUT", "1.0")),
+            http2=_env(name, "HTTP2", "false").lower() in ("1", "true", "yes"),
+            retries=int(_env(name, "RETRIES", "2")),
+            retry_backoff=float(_env(name, "RETRY_BACKOFF", "0.05")),
+            retry_budget_ratio=float(_env(name, "RETRY_BUDGET_RATIO", "0.2")),
+            retry_budget_min_per_second=float(_env(name, "RETRY_BUDGET_MIN_PER_SECOND", "5.0")),
+            breaker_failures=int(_env(name, "BREAKER_FAILURES", "5")),
+            breaker_reset_timeout=float(_env(name, "BREAKER_RESET_TIMEOUT", "5.0")),
+            hedge=_env(name, "HEDGE", "false").lower() in ("1", "true", "yes"),
+            hedge_min_delay=float(_env(name, "HEDGE_MIN_DELAY", "0.005")),
+            balancer=_env(name, "BALANCER", "p2c").lower(),
+            health_check_interval=float(_env(name, "HEALTH_CHECK_INTERVAL", "5.0")),
+            health_check_timeout=float(_env(name, "HEALTH_CHECK_TIMEOUT", "1.0")),
+            dns_refresh_interval=float(_env(name, "DNS_REFRESH_INTERVAL", "0.0")),
+            concurrency_limit=_env(name, "CONCURRENCY_LIMIT", "off").lower(),
+            initial_limit=int(_env(name, "INITIAL_LIMIT", "20")),
+            min_limit=int(_env(name, "MIN_LIMIT", "4")),
+        )
+
+    def limit_algorithm(self):
+        """Adaptive concurrency limit algorithm, or None when `concurrency_limit` is `off`"""
+        if self.concurrency_limit == "off":
+            return None
+        if self.concurrency_limit not in LIMIT_ALGORITHMS:
+            raise ValueError(
+                f"Unknown concurrency limit {self.concurrency_limit!r}; expected off or one of {', '.join(LIMIT_ALGORITHMS)}"
+            )
+        return LIMIT_ALGORITHMS[self.concurrency_limit](self.initial_limit, self.min_limit, self.max_connections)
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+
+def _succeeded(task: asyncio.Future) -> bool:
+    return task.exception() is None and task.result().status_code not in RETRYABLE_STATUSES
+
+
+class UpstreamClient:
+    """Long-lived, keep-alive pooled HTTP client for a single backend service
+
+    One instance is created per backend at import time; the underlying
+    httpx.AsyncClient is opened by the app lifespan (or lazily on first use)
+    and closed on shutdown so connections are reused across requests.
+
+    `base_url` may list several replicas separated by commas; each request
+    goes to one picked by the load balancer. With more than one replica (or
+    DNS refresh enabled) a background task health-checks `/healthz` and
+    re-resolves hostnames while the client is started.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        config: Optional[UpstreamConfig] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.name = name
+        self.base_url = base_url
+        self.config = config or UpstreamConfig.from_env(name)
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._maintenance: Optional[asyncio.Task] = None
+        self.balancer = LoadBalancer(
+            name,
+            parse_urls(base_url),
+            self.config.balancer,
+            breaker=lambda: CircuitBreaker(name, self.config.breaker_failures, self.config.breaker_reset_timeout),
+        )
+        self.retry_budget = RetryBudget(self.config.retry_budget_ratio, self.config.retry_budget_min_per_second)
+        self.latency = LatencyTracker()
+        algorithm = self.config.limit_algorithm()
+        self.limiter = ConcurrencyLimiter(name, algorithm) if algorithm is not None else None
+
+        self._retries = UPSTREAM_RETRIES_TOTAL.labels(upstream=name, kind="retry")
+        self._hedges = UPSTREAM_RETRIES_TOTAL.labels(upstream=name, kind="hedge")
+        self._hedge_wins = UPSTREAM_HEDGE_WINS_TOTAL.labels(upstream=name)
+        self._budget_exhausted = UPSTREAM_RETRY_BUDGET_EXHAUSTED_TOTAL.labels(upstream=name)
+        self._breaker_rejections = UPSTREAM_BREAKER_REJECTIONS_TOTAL.labels(upstream=name)
+        self._limit_rejections = UPSTREAM_LIMIT_REJECTIONS_TOTAL.labels(upstream=name)
+        self._ejections = UPSTREAM_ENDPOINT_EJECTIONS_TOTAL.labels(upstream=name)
+
+        UPSTREAM_POOL_MAX_CONNECTIONS.labels(upstream=name).set(self.config.max_connections)
+        set_gauge_function(
+            UPSTREAM_POOL_CONNECTIONS.labels(upstream=name, state="active"),
+            lambda: self.pool_stats()["active"],
+        )
+        set_gauge_function(
+            UPSTREAM_POOL_CONNECTIONS.labels(upstream=name, state="idle"),
+            lambda: self.pool_stats()["idle"],
+        )
+        set_gauge_function(
+            UPSTREAM_BREAKER_STATE.labels(upstream=name),
+            lambda: min(endpoint.breaker.state for endpoint in self.balancer.endpoints),
+        )
+        for state in ("healthy", "ejected"):
+            set_gauge_function(
+                UPSTREAM_ENDPOINTS.labels(upstream=name, state=state),
+                lambda state=state: self.balancer.counts()[state],
+            )
+
+    def _build_client(self) -> httpx.AsyncClient:
+        kwargs = dict(
+            limits=self.config.limits,
+            timeout=self.config.timeout,
+        )
+        if self.transport is not None:
+            return httpx.AsyncClient(transport=self.transport, **kwargs)
+
+        if self.config.http2:
+            try:
+                return httpx.AsyncClient(http2=True, **kwargs)
+            except ImportError:
+                logger.warning("HTTP/2 requested but h2 is not installed. Install with: pip install httpx[http2]")
+        return httpx.AsyncClient(**kwargs)
+
+    async def start(self):
+        """Open the connection pool and start health checking replicas"""
+        if self._client is None:
+            self._client = self._build_client()
+            logger.info(
+                f"Upstream client {self.name} started for {self.base_url} "
+                f"(max_connections={self.config.max_connections}, http2={self.config.http2}, "
+                f"balancer={self.config.balancer})"
+            )
+        if self._maintenance is None and self._needs_maintenance():
+            self._maintenance = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        """Stop health checks and close the connection pool and all keep-alive connections"""
+        if self._maintenance is not None:
+            self._maintenance.cancel()
+            try:
+                await self._maintenance
+            except asyncio.CancelledError:
+                pass
+            self._maintenance = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info(f"Upstream client {self.name} closed")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    def _needs_maintenance(self) -> bool:
+        if self.config.dns_refresh_interval > 0:
+            return True
+        return self.config.health_check_interval > 0 and len(self.balancer.endpoints) > 1
+
+    async def _maintain(self):
+        """Periodically re-resolve replicas and health-check them"""
+        intervals = [i for i in (self.config.health_check_interval, self.config.dns_refresh_interval) if i > 0]
+        next_resolve = 0.0
+        while True:
+            if self.config.dns_refresh_interval > 0 and time.monotonic() >= next_resolve:
+                await self.balancer.resolve()
+                next_resolve = time.monotonic() + self.config.dns_refresh_interval
+            if self.config.health_check_interval > 0 and len(self.balancer.endpoints) > 1:
+                await self.check_health()
+            await asyncio.sleep(min(intervals))
+
+    async def check_health(self):
+        """GET `/healthz` on every replica, ejecting those that fail and readmitting those that pass"""
+        async def probe(endpoint: Endpoint):
+            try:
+                response = await self.client.get(f"{endpoint.url}/healthz", timeout=self.config.health_check_timeout)
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            if self.balancer.mark(endpoint, healthy):
+                self._ejections.inc()
+
+        await asyncio.gather(*(probe(endpoint) for endpoint in self.balancer.endpoints))
+
+    def pool_stats(self) -> dict:
+        """Return the number of active and idle connections in the pool"""
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        if pool is None:
+            return {"active": 0, "idle": 0}
+        connections = list(pool.connections)
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"active": len(connections) - idle, "idle": idle}
+
+    async def request(self, method: str, path: str, stream: bool = False, **kwargs) -> httpx.Response:
+        """Send a request to the upstream over the shared pool
+
+        Idempotent requests that fail to connect or get a 502/503/504 are
+        retried with jittered backoff, on another replica when there is one,
+        while the retry budget allows; GETs may also be hedged. Other
+        requests sent with an Idempotency-Key header go to the replica their
+        key hashes to, which is the only one that knows the key. They are
+        retried there after a 502/503/504 or a failure to connect, but never
+        after a timeout or a dropped connection, since the first attempt may
+        already have been applied. Replicas with
+        an open circuit breaker are skipped, and calls fail fast with
+        CircuitOpenError when every replica's breaker is open, or with
+        LimitExceededError when the adaptive concurrency limit is reached.
+        With `stream=True` the body is not read; the caller must close the
+        response.
+        """
+        self.retry_budget.deposit()
+        key = None if method in IDEMPOTENT_METHODS else httpx.Headers(kwargs.get("headers")).get(IDEMPOTENCY_HEADER)
+        retryable = method in IDEMPOTENT_METHODS or key is not None
+        retries = self.config.retries if retryable else 0
+        attempt = 0
+        endpoint = None
+        while True:
+            if key is None:
+                endpoint = self.balancer.pick(exclude=endpoint)
+            elif endpoint is None:
+                endpoint = self.balancer.pick_for_key(key)
+            if endpoint is None:
+                self._breaker_rejections.inc()
+                raise CircuitOpenError(f"{self.name} circuit breaker is open")
+            try:
+                if self.config.hedge and method == "GET":
+                    response = await self._hedged_send(endpoint, method, path, stream, kwargs)
+                else:
+                    response = await self._send(endpoint, method, path, stream, kwargs)
+            except (CircuitOpenError, LimitExceededError):
+                raise
+            except httpx.RequestError as e:
+                if key is not None and not isinstance(e, UNSENT_ERRORS):
+                    raise
+                if not self._may_retry(attempt, retries):
+                    raise
+            else:
+                if response.status_code not in RETRYABLE_STATUSES or not self._may_retry(attempt, retries):
+                    return response
+                await response.aclose()
+            attempt += 1
+            self._retries.inc()
+            await asyncio.sleep(backoff_delay(attempt, self.config.retry_backoff))
+
+    def _may_retry(self, attempt: int, retries: int) -> bool:
+        if attempt >= retries:
+            return False
+        if not self.retry_budget.withdraw():
+            self._budget_exhausted.inc()
+            return False
+        return True
+
+    async def _send(self, endpoint: Endpoint, method: str, path: str, stream: bool, kwargs: dict) -> httpx.Response:
+        """One attempt to one replica, in its own client span, reporting its outcome to the breaker and limiter"""
+        if not endpoint.breaker.allow():
+            self._breaker_rejections.inc()
+            raise CircuitOpenError(f"{self.name} circuit breaker is open for {endpoint.url}")
+        if self.limiter is not None and not self.limiter.try_acquire():
+            endpoint.breaker.release()
+            self._limit_rejections.inc()
+            raise LimitExceededError(f"{self.name} concurrency limit of {self.limiter.limit} reached")
+        in_flight = UPSTREAM_REQUESTS_IN_FLIGHT.labels(upstream=self.name)
+        in_flight.inc()
+        endpoint.outstanding += 1
+        start = time.perf_counter()
+        # Round-trip time reported to the limiter; None when the outcome says nothing about load
+        rtt, dropped = None, False
+        try:
+            url = f"{endpoint.url}{path}"
+            with client_span(self.name, method, url) as span:
+                headers = httpx.Headers(kwargs.get("headers"))
+                inject_trace_context(headers)
+                request = self.client.build_request(method, url, **{**kwargs, "headers": headers})
+                response = await self.client.send(request, stream=stream)
+                if span is not None and span.is_recording():
+                    set_status_code(span, response.status_code)
+        except httpx.RequestError as e:
+            endpoint.breaker.record_failure()
+            if isinstance(e, httpx.TimeoutException):
+                rtt, dropped = time.perf_counter() - start, True
+            raise
+        except BaseException:
+            endpoint.breaker.release()
+            raise
+        else:
+            elapsed = time.perf_counter() - start
+            if response.status_code >= 500:
+                endpoint.breaker.record_failure()
+                if response.status_code == 503:
+                    rtt, dropped = elapsed, True
+            else:
+                endpoint.breaker.record_success()
+                self.latency.observe(elapsed)
+                rtt = elapsed
+        finally:
+            in_flight.dec()
+            endpoint.outstanding -= 1
+            if self.limiter is not None:
+                self.limiter.release(rtt, dropped)
+        return response
+
+    async def _hedged_send(
+        self, endpoint: Endpoint, method: str, path: str, stream: bool, kwargs: dict
+    ) -> httpx.Response:
+        """Send, and if no answer arrives within the recent p95, send a second copy and take the first success
+
+        The second copy goes to a different replica when there is one.
+        """
+        delay = self.latency.percentile()
+        if delay is None:
+            return await self._send(endpoint, method, path, stream, kwargs)
+        first = asyncio.ensure_future(self._send(endpoint, method, path, stream, kwargs))
+        done, _ = await asyncio.wait({first}, timeout=max(delay, self.config.hedge_min_delay))
+        if done:
+            return first.result()
+        second = self.balancer.pick(exclude=endpoint)
+        if second is None:
+            return await first
+        if not self.retry_budget.withdraw():
+            self._budget_exhausted.inc()
+            return await first
+        self._hedges.inc()
+        hedge = asyncio.ensure_future(self._send(second, method, path, stream, kwargs))
+        attempts = (first, hedge)
+        winner = None
+        try:
+            pending = set(attempts)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if _succeeded(task)), None)
+            if winner is None:
+                # Neither attempt succeeded; report the hedge's outcome
+                winner = hedge
+            elif winner is hedge:
+                self._hedge_wins.inc()
+        finally:
+            for task in attempts:
+                if task is not winner:
+                    task.cancel()
+                    if task.done() and not task.cancelled() and task.exception() is None:
+                        await task.result().aclose()
+        return winner.result()
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", path, **kwargs)
@@ -1,6 +1,14 @@
+import os
+import time
 import random
 import json
-from locust import HttpUser, task, between
+from bisect import bisect_left
+from itertools import accumulate
+
+import gevent
+import requests
+from gevent.pool import Pool
+from locust import HttpUser, User, task, between, constant
 
 class EcommerceUser(HttpUser):
     """Simulates an e-commerce user browsing catalog and adding items to cart"""
@@ -61,16 +69,46 @@ class EcommerceUser(HttpUser):
             else:
                 response.failure(f"Expected 200 or 500, got {response.status_code}")
     
-    @task(1)  # 10% probability - list all products
+    @task(1)  # 10% probability - add several items at once
+    def add_batch_to_cart(self):
+        """Add a few items to the cart in a single batch request"""
+        product_ids = ["123", "456", "789"]
+        items = [
+            {
+                "product_id": random.choice(product_ids),
+                "quantity": random.randint(1, 3),
+                "user_id": self.user_id
+            }
+            for _ in range(random.randint(2, 5))
+        ]
+        
+        with self.client.post("/cart/add/batch",
+                            json=items,
+                            catch_response=True) as response:
+            if response.status_code == 200:
+                data = response.json()
+                if data.get("added") == len(items):
+                    response.success()
+                    if not self.cart_id:
+                        self.cart_id = data["results"][0].get("cart_id")
+                else:
+                    response.failure(f"Expected {len(items)} items added, got {data}")
+            elif response.status_code == 500:
+                # This is expected due to 1% failure rate simulation
+                response.success()
+            else:
+                response.failure(f"Expected 200 or 500, got {response.status_code}")
+    
+    @task(1)  # 10% probability - list products
     def list_products(self):
-        """List all available products"""
+        """List the first page of available products"""
         with self.client.get("/catalog", catch_response=True) as response:
             if response.status_code == 200:
                 data = response.json()
-                if isinstance(data, list) and len(data) > 0:
+                if isinstance(data.get("items"), list) and len(data["items"]) > 0:
                     response.success()
                 else:
-                    response.failure(f"Expected non-empty list, got {data}")
+                    response.failure(f"Expected non-empty product page, got {data}")
             else:
                 response.failure(f"Expected 200, got {response.status_code}")
     
@@ -116,3 +154,173 @@ class MetricsUser(HttpUser):
                     response.failure(f"Expected alive status, got {data}")
             else:
                 response.failure(f"Expected 200, got {response.status_code}")
+
+
+class ZipfProducts:
+    """Product ids "0".."size-1" drawn with Zipf popularity: id k has weight 1 / (k + 1) ** s"""
+
+    def __init__(self, size: int, s: float, rng: random.Random):
+        self.rng = rng
+        self.cumulative = list(accumulate(1.0 / (rank + 1) ** s for rank in range(size)))
+
+    def draw(self) -> str:
+        return str(bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1]))
+
+
+def arrival_rate(shape: str, elapsed: float) -> float:
+    """Target arrivals per second `elapsed` seconds into the run for a LOAD_SHAPE
+
+    constant: LOAD_RATE throughout
+    step:     LOAD_RATE, plus LOAD_STEP_RATE every LOAD_STEP_SECONDS
+    ramp:     linear from LOAD_RAMP_FROM to LOAD_RATE over LOAD_RAMP_SECONDS, then held
+    spike:    LOAD_RATE, times LOAD_SPIKE_FACTOR for LOAD_SPIKE_SECONDS from LOAD_SPIKE_AT
+    """
+    rate = float(os.getenv("LOAD_RATE", "50"))
+    if shape == "constant":
+        return rate
+    if shape == "step":
+        step_seconds = float(os.getenv("LOAD_STEP_SECONDS", "60"))
+        return rate + float(os.getenv("LOAD_STEP_RATE", "25")) * int(elapsed // step_seconds)
+    if shape == "ramp":
+        start = float(os.getenv("LOAD_RAMP_FROM", "0"))
+        progress = min(elapsed / float(os.getenv("LOAD_RAMP_SECONDS", "120")), 1.0)
+        return start + (rate - start) * progress
+    if shape == "spike":
+        spike_at = float(os.getenv("LOAD_SPIKE_AT", "60"))
+        if spike_at <= elapsed < spike_at + float(os.getenv("LOAD_SPIKE_SECONDS", "30")):
+            return rate * float(os.getenv("LOAD_SPIKE_FACTOR", "5"))
+        return rate
+    raise ValueError(f"Unknown LOAD_SHAPE {shape!r}; expected constant, step, ramp or spike")
+
+
+class OpenLoopUser(User):
+    """Open-loop load: arrivals on a schedule, independent of response times
+
+    A single scheduler draws Poisson arrivals at the rate given by LOAD_SHAPE
+    and starts each one in its own greenlet, so a slow system faces a growing
+    backlog instead of a generator that politely waits. Every request is
+    recorded with its latency measured from the time it was scheduled to be
+    sent, not from when it actually went out, so queueing in the generator or
+    the services shows up in the percentiles.
+
+    Arrivals are product lookups (Zipf popularity over LOAD_CATALOG_SIZE ids,
+    which should match CATALOG_SYNTHETIC_PRODUCTS), multi-id lookups, and
+    cart sessions that add several items, view the cart and clear it, with
+    LOAD_THINK_TIME between steps. Run it on its own:
+
+        locust -f locustfile.py OpenLoopUser --host http://localhost:8000 -u 1
+    """
+
+    # One scheduler produces the whole arrival rate
+    fixed_count = 1
+    wait_time = constant(0)
+
+    # Arrival mix: (kind, weight)
+    MIX = (("browse", 80), ("multi_get", 10), ("cart_session", 10))
+
+    def on_start(self):
+        seed = int(os.getenv("LOAD_SEED", "42"))
+        self.rng = random.Random(seed)
+        self.products = ZipfProducts(
+            int(os.getenv("LOAD_CATALOG_SIZE", "1000")), float(os.getenv("LOAD_ZIPF_S", "1.0")), random.Random(seed + 1)
+        )
+        self.shape = os.getenv("LOAD_SHAPE", "constant")
+        self.think_time = float(os.getenv("LOAD_THINK_TIME", "1.0"))
+        arrival_rate(self.shape, 0.0)
+        max_outstanding = int(os.getenv("LOAD_MAX_OUTSTANDING", "1000"))
+        self.pool = Pool(max_outstanding)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_outstanding)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.sessions_started = 0
+
+    def on_stop(self):
+        self.pool.kill()
+        self.session.close()
+
+    @task
+    def schedule(self):
+        """Run the arrival schedule until the user is stopped"""
+        kinds = [kind for kind, _ in self.MIX]
+        weights = [weight for _, weight in self.MIX]
+        start = time.monotonic()
+        intended = start
+        while True:
+            rate = arrival_rate(self.shape, intended - start)
+            if rate <= 0:
+                intended += 0.1
+            else:
+                intended += self.rng.expovariate(rate)
+            delay = intended - time.monotonic()
+            if delay > 0:
+                gevent.sleep(delay)
+            if rate <= 0:
+                continue
+
+            # Draw everything from the seeded RNG here, in schedule order, so runs are repeatable
+            kind = self.rng.choices(kinds, weights)[0]
+            if kind == "browse":
+                arrival = (self.browse, self.products.draw())
+            elif kind == "multi_get":
+                arrival = (self.multi_get, [self.products.draw() for _ in range(5)])
+            else:
+                self.sessions_started += 1
+                items = [(self.products.draw(), self.rng.randint(1, 3)) for _ in range(self.rng.randint(2, 5))]
+                arrival = (self.cart_session, f"open_{self.sessions_started}", items)
+
+            if self.pool.full():
+                # The generator itself is saturated; count the arrival rather than delay the schedule
+                self.record("GET", "generator", intended, None, RuntimeError("LOAD_MAX_OUTSTANDING reached"))
+                continue
+            function, *args = arrival
+            self.pool.spawn(function, intended, *args)
+
+    def record(self, method: str, name: str, intended: float, response, exception=None):
+        """Report a request to Locust with latency measured from its intended send time"""
+        if exception is None and response is not None and response.status_code >= 400:
+            exception = requests.HTTPError(f"{response.status_code} {response.reason}")
+        self.environment.events.request.fire(
+            request_type=method,
+            name=name,
+            response_time=(time.monotonic() - intended) * 1000,
+            response_length=len(response.content) if response is not None else 0,
+            response=response,
+            context={},
+            exception=exception,
+        )
+
+    def send(self, method: str, path: str, name: str, intended: float, **kwargs):
+        """Send a request no earlier than `intended` and record it; returns the response or None"""
+        delay = intended - time.monotonic()
+        if delay > 0:
+            gevent.sleep(delay)
+        try:
+            response = self.session.request(method, self.host + path, timeout=30, **kwargs)
+        except requests.RequestException as e:
+            self.record(method, name, intended, None, e)
+            return None
+        self.record(method, name, intended, response)
+        return response
+
+    def browse(self, intended: float, product_id: str):
+        self.send("GET", f"/catalog/{product_id}", "/catalog/{product_id}", intended)
+
+    def multi_get(self, intended: float, product_ids):
+        self.send("GET", f"/catalog?ids={','.join(product_ids)}", "/catalog?ids", intended)
+
+    def cart_session(self, intended: float, user_id: str, items):
+        """Add each product, view the cart, then clear it, one step every LOAD_THINK_TIME seconds
+
+        Each step is due at a fixed offset from the session's arrival, so a
+        slow step makes the following ones late and their latency includes
+        the wait.
+        """
+        cart_id = f"cart_{user_id}"
+        for product_id, quantity in items:
+            body = {"product_id": product_id, "quantity": quantity, "user_id": user_id}
+            self.send("POST", "/cart/add", "/cart/add", intended, json=body)
+            intended += self.think_time
+        self.send("GET", f"/cart/{cart_id}/view", "/cart/{cart_id}/view", intended)
+        intended += self.think_time
+        self.send("DELETE", f"/cart/{cart_id}", "/cart/{cart_id}", intended)